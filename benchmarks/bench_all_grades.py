@@ -0,0 +1,104 @@
+# NYC School Data
+# Copyright (C) 2022-2023. Matthew X. Curinga
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU AFFERO GENERAL PUBLIC LICENSE (the "License") as
+# published by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the License for more details.
+#
+# You should have received a copy of the License along with this program.
+# If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+"""
+Time of `nysed.calc_all_grades()` on the statewide NYSED exam file, against
+the old version (one `query()` on the whole frame per school, year, exam and
+category). The old version is timed on a sample of the groups and the time
+for every group is estimated from it.
+
+The statewide file in `data_dir` is used if it is there, otherwise synthetic
+data of the same size (about 2.5 million rows).
+
+Usage:
+    python benchmarks/bench_all_grades.py [sample groups]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from nycschools import config, dataloader, nysed
+
+categories = ["All Students", "Female", "Male", "Asian", "Black", "Hispanic", "White", "Multiracial",
+              "Current ELL", "Never ELL", "SWD", "Not SWD", "Econ Disadv", "Not Econ Disadv",
+              "Homeless", "Not Homeless", "In Foster Care", "Parent in Armed Forces"]
+
+
+def statewide(n_beds=3000, seed=1):
+    """Synthetic NYSED results: schools x 8 years x 2 exams x 6 grades x 18 categories, half of them reported."""
+    rng = np.random.default_rng(seed)
+    idx = pd.MultiIndex.from_product([[f"{i:012}" for i in range(n_beds)], range(2014, 2022), ["ela", "math"],
+                                      range(3, 9), categories],
+                                     names=["beds", "ay", "exam", "grade", "category"])
+    df = idx.to_frame(index=False).sample(frac=.5, random_state=seed).reset_index(drop=True)
+    df["test_year"] = df.ay + 1
+    df["number_tested"] = rng.integers(0, 120, len(df))
+    df["total_enrollment"] = df.number_tested + rng.integers(1, 10, len(df))
+    df["number_not_tested"] = df.total_enrollment - df.number_tested
+    df["mean_scale_score"] = rng.uniform(580, 620, len(df)).round()
+    for level in ["1", "2", "3", "4"]:
+        df[f"level_{level}_n"] = rng.integers(0, 30, len(df))
+    df["level_3_4_n"] = df.level_3_n + df.level_4_n
+    return df
+
+
+def old_calc_all_grades(nysed):
+    def all_grades_for_school(row):
+        qry = f"beds == '{row.beds}' and ay == {row.ay} and category == '{row.category}' and exam=='{row.exam}'"
+        data = nysed.query(qry)
+
+        mean_scale_score = np.average(data.mean_scale_score, weights=data.total_enrollment)
+        num_tested = data.number_tested.sum()
+        levels = ["1", "2", "3", "4", "3_4"]
+        if num_tested == 0:
+            levels_n = [0] * len(levels)
+            levels_pct = [0] * len(levels)
+        else:
+            levels_n = [data[f"level_{i}_n"].sum() for i in levels]
+            levels_pct = [n / num_tested for n in levels_n]
+        rows.append({"mean_scale_score": mean_scale_score, "levels_n": levels_n, "levels_pct": levels_pct})
+
+    rows = []
+    t = nysed[["beds", "ay", "exam", "category", "test_year"]].drop_duplicates()
+    return t, lambda n: t.head(n).apply(all_grades_for_school, axis=1)
+
+
+def main(sample=200):
+    path = dataloader.data_path("nysed_math_ela")
+    if os.path.exists(path):
+        df = nysed.load_nys_nysed()
+        df["beds"] = df.beds.astype(str)
+        print(f"statewide file: {len(df):,} rows")
+    else:
+        df = statewide()
+        print(f"synthetic statewide data: {len(df):,} rows")
+
+    start = time.perf_counter()
+    all_grades = nysed.calc_all_grades(df)
+    print(f"{'groupby':>8}: {time.perf_counter() - start:8.2f}s  {len(all_grades):>10,} All Grades rows")
+
+    groups, run = old_calc_all_grades(df)
+    start = time.perf_counter()
+    run(sample)
+    elapsed = time.perf_counter() - start
+    estimate = elapsed / sample * len(groups)
+    print(f"{'old':>8}: {elapsed:8.2f}s  for {sample} groups, about {estimate / 3600:.1f} hours for all {len(groups):,}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
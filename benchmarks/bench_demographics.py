@@ -0,0 +1,108 @@
+# NYC School Data
+# Copyright (C) 2022-2023. Matthew X. Curinga
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU AFFERO GENERAL PUBLIC LICENSE (the "License") as
+# published by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the License for more details.
+#
+# You should have received a copy of the License along with this program.
+# If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+"""
+Compare the old row-wise `.apply(axis=1)` derivation of the demographic
+columns (ay, district, boro, school_num, charter, clean_name, short_name,
+poverty, poverty_1, economic_need_index) with the vectorized helpers used by
+`schools.get_demographics()` and `parse`, on a synthetic raw frame the size of the full
+multi-year demographic set (~1,900 schools x 20 years).
+
+Usage:
+    python benchmarks/bench_demographics.py [years]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from nycschools import schools, parse
+
+
+def raw_demographics(years=20, n_schools=1900, seed=0):
+    rng = np.random.default_rng(seed)
+    boro = rng.choice(list("KXMQR"), n_schools)
+    district = rng.choice([*range(1, 33), 75, 79, 84], n_schools)
+    num = rng.integers(1, 999, n_schools)
+    dbn = [f"{d:02}{b}{n:03}" for d, b, n in zip(district, boro, num)]
+    prefix = rng.choice(["P.S. ", "I.S. ", "M.S. ", "J.H.S. ", "", "The "], n_schools)
+    name = [f"{p}{n:03} School of {b}" for p, n, b in zip(prefix, num, boro)]
+
+    rows = n_schools * years
+    enroll = rng.integers(50, 2000, rows)
+    poverty = (enroll * rng.uniform(.1, .99, rows)).astype(int).astype(str).astype(object)
+    poverty[rng.random(rows) < .05] = "Above 95%"
+    poverty[rng.random(rows) < .02] = "Below 5%"
+    pct = np.char.add(np.round(rng.uniform(1, 99, rows), 1).astype(str), "%").astype(object)
+    pct[rng.random(rows) < .05] = "Above 95%"
+    pct[rng.random(rows) < .01] = "No Data"
+    return pd.DataFrame({
+        "dbn": np.tile(dbn, years),
+        "year": np.repeat([f"{y}-{(y + 1) % 100:02}" for y in range(2005, 2005 + years)], n_schools),
+        "school_name": np.tile(name, years),
+        "total_enrollment": enroll,
+        "poverty": poverty,
+        "poverty_1": pct,
+        "economic_need_index": rng.uniform(0, 1, rows),
+    })
+
+
+def row_wise(df):
+    """The derivation as it was written before it was vectorized."""
+    boros = schools.boros
+    df["ay"] = df["year"].apply(lambda year: int(year.split("-")[0]))
+    df["district"] = df["dbn"].apply(lambda dbn: int(dbn[:2]))
+    df["boro"] = df["dbn"].apply(lambda dbn: boros[dbn[2]])
+    df["school_num"] = df.dbn.apply(lambda dbn: int(dbn[3:]))
+    df["charter"] = df.district.apply(lambda x: 1 if x == 84 else 0)
+    df["clean_name"] = df.apply(lambda row: schools.clean_name(row.school_name), axis=1)
+    df["short_name"] = df.apply(schools.short_name, axis=1)
+    df["poverty"] = df.apply(lambda row: schools.str_count(row, "poverty", "total_enrollment"), axis=1)
+    df["poverty_1"] = df.apply(lambda row: schools.str_pct(row, "poverty_1", "total_enrollment"), axis=1)
+    df["economic_need_index"] = df.apply(lambda row: schools.str_pct(row, "economic_need_index", "total_enrollment"), axis=1)
+    return df
+
+
+def vectorized(df):
+    df["ay"] = schools.map_unique(df["year"], lambda year: int(year.split("-")[0]))
+    df = schools.dbn_cols(df)
+    df["charter"] = (df.district == 84).astype("int64")
+    df = schools.name_cols(df)
+    df["poverty"] = parse.count(df["poverty"], df["total_enrollment"])
+    df["poverty_1"] = parse.pct(df["poverty_1"], df["total_enrollment"])
+    df["economic_need_index"] = parse.pct(df["economic_need_index"], df["total_enrollment"])
+    return df
+
+
+def timed(f, df):
+    start = time.perf_counter()
+    result = f(df.copy())
+    return result, time.perf_counter() - start
+
+
+def main():
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    df = raw_demographics(years)
+    old, old_t = timed(row_wise, df)
+    new, new_t = timed(vectorized, df)
+    pd.testing.assert_frame_equal(old, new)
+    print(f"{len(df):,} rows")
+    print(f"row-wise   {old_t:8.2f}s")
+    print(f"vectorized {new_t:8.2f}s  ({old_t / new_t:.0f}x faster, identical output)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# NYC School Data
+# Copyright (C) 2022-2023. Matthew X. Curinga
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU AFFERO GENERAL PUBLIC LICENSE (the "License") as
+# published by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the License for more details.
+#
+# You should have received a copy of the License along with this program.
+# If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+"""
+Time and peak memory (tracemalloc) of `exams.load_math_ela_long()` and
+`load_math_ela_wide()` against the old versions (copy + sort each exam and
+concat; merge on dbn, ay and grade only), on synthetic math and ELA files
+written to a temporary `data_dir`. The files are loaded once first, so only
+the combining is measured.
+
+Usage:
+    python benchmarks/bench_exams.py [schools]
+"""
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from nycschools import config, dataloader, exams
+
+grades = ["3", "4", "5", "6", "7", "8", "All Grades"]
+categories = ["All Students", "Not SWD", "SWD", "Asian", "Black", "Hispanic", "White", "Female", "Male",
+              "Econ Disadv", "Not Econ Disadv", "Current ELL", "Ever ELL", "Never ELL"]
+
+
+def exam_results(n_schools, seed):
+    rng = np.random.default_rng(seed)
+    idx = pd.MultiIndex.from_product([[f"{i % 32 + 1:02}{'KXMQR'[i % 5]}{i:03}" for i in range(n_schools)],
+                                      range(2013, 2023), grades, categories],
+                                     names=["dbn", "ay", "grade", "category"])
+    df = idx.to_frame(index=False).sample(frac=.5, random_state=seed).reset_index(drop=True)
+    df["test_year"] = df.ay + 1
+    df["number_tested"] = rng.integers(5, 200, len(df))
+    df["mean_scale_score"] = rng.uniform(550, 650, len(df)).round(1)
+    for level in ["level_1", "level_2", "level_3", "level_4", "level_3_4"]:
+        df[f"{level}_n"] = rng.integers(0, 100, len(df))
+        df[f"{level}_pct"] = rng.uniform(0, 1, len(df)).round(3)
+    return df
+
+
+def old_long():
+    math_df = exams.load_math().copy()
+    ela_df = exams.load_ela().copy()
+    math_df["exam"] = "math"
+    ela_df["exam"] = "ela"
+    return pd.concat([math_df, ela_df])
+
+
+def old_wide():
+    math_df = exams.load_math()
+    ela_df = exams.load_ela()
+    return math_df.merge(ela_df, how="inner", on=["dbn", "ay", "grade"], suffixes=["_math", "_ela"])
+
+
+def measure(label, f):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = f()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = df.memory_usage(deep=True).sum()
+    print(f"{label:>10}: {elapsed:6.2f}s  peak {peak / 2**20:8.1f} MB  result {size / 2**20:8.1f} MB  {len(df):>10,} rows")
+
+
+def main(n_schools=1200):
+    with tempfile.TemporaryDirectory() as data_dir:
+        config.data_dir = data_dir
+        for label, presorted in [("unsorted files", False), ("files sorted by dbn and ay", True)]:
+            math_df, ela_df = exam_results(n_schools, 1), exam_results(n_schools, 2)
+            if presorted:
+                math_df, ela_df = math_df.sort_values(["dbn", "ay"]), ela_df.sort_values(["dbn", "ay"])
+            math_df.to_csv(dataloader.data_path("nyc_math"), index=False)
+            ela_df.to_csv(dataloader.data_path("nyc_ela"), index=False)
+            dataloader.clear_cache()
+            exams.load_math(), exams.load_ela()
+            print(f"{label}: {len(math_df):,} math and {len(ela_df):,} ela rows")
+            measure("old long", old_long)
+            measure("long", exams.load_math_ela_long)
+            measure("old wide", old_wide)
+            measure("wide", exams.load_math_ela_wide)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1200)
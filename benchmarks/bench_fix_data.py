@@ -0,0 +1,120 @@
+# NYC School Data
+# Copyright (C) 2022-2023. Matthew X. Curinga
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU AFFERO GENERAL PUBLIC LICENSE (the "License") as
+# published by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the License for more details.
+#
+# You should have received a copy of the License along with this program.
+# If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+"""
+Compare each step of the old per-value `nysed.fix_data` with the vectorized
+version, and the whole function, on a synthetic researcher file (after
+`nysed.fix_cols`).
+
+Usage:
+    python benchmarks/bench_fix_data.py [rows]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from nycschools import nysed, parse
+
+nysed_categories = ["All Students", "Female", "Male", "Hispanic or Latino", "Black or African American",
+                    "Asian or Native Hawaiian/Other Pacific Islander", "White", "English Language Learner",
+                    "Non-English Language Learner", "Students with Disabilities", "General Education Students",
+                    "Economically Disadvantaged", "Not Economically Disadvantaged", "Homeless"]
+
+
+def researcher_file(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "school_name": rng.choice([f"SCHOOL {i}" for i in range(4000)], rows),
+        "beds": rng.choice([f"3{i:011}" for i in range(4000)], rows),
+        "category": rng.choice(nysed_categories, rows),
+        "exam": rng.choice(["ELA", "Mathematics"], rows),
+        "grade": rng.choice([f"Grade {g} {e}" for g in range(3, 9) for e in ["ELA", "Math"]], rows),
+        "test_year": rng.choice([f"06/30/{y}" for y in range(2016, 2022)], rows),
+        "subgroup_code": rng.integers(1, 20, rows),
+    })
+    tested = rng.integers(0, 150, rows)
+    for col, values in [("number_tested", tested), ("total_enrollment", tested + 3), ("number_not_tested", 3)]:
+        df[col] = pd.Series(np.broadcast_to(values, rows)).astype(str).astype(object)
+    for level in ["1", "2", "3", "4"]:
+        n = rng.integers(0, 40, rows).astype(str).astype(object)
+        n[rng.random(rows) < .1] = "-"
+        df[f"level_{level}_n"] = n
+        pct = rng.integers(0, 100, rows).astype(str).astype(object)
+        pct[rng.random(rows) < .1] = "-"
+        df[f"level_{level}_pct"] = pct
+    df["level_3_4_pct"] = df.level_3_pct
+    df["mean_scale_score"] = rng.integers(550, 650, rows).astype(str).astype(object)
+    return df
+
+
+def old_map_cats(cat):
+    return nysed.cat_map.get(cat, cat)
+
+
+def timed(f):
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    df = researcher_file(rows)
+    counts = ["level_1_n", "level_2_n", "level_3_n", "level_4_n", "number_tested", "total_enrollment",
+              "number_not_tested"]
+    cases = [
+        ("test_year",
+         lambda: df.test_year.apply(lambda x: int(x.split("/")[-1])),
+         lambda: nysed.parse_test_year(df.test_year)),
+        ("category",
+         lambda: df.category.apply(old_map_cats),
+         lambda: nysed.map_categories(df.category)),
+        ("grade",
+         lambda: df.grade.apply(lambda x: int(x[6])),
+         lambda: nysed.parse_grade(df.grade)),
+        ("counts",
+         lambda: [pd.to_numeric(df[c], errors="coerce").fillna(0).astype(int) for c in counts],
+         lambda: [parse.number(df[c]).fillna(0).astype(int) for c in counts]),
+        ("pct",
+         lambda: [df[c].apply(old_nysed_pct) for c in df.columns if c.endswith("pct")],
+         lambda: [parse.pct(df[c], scale="gt1", errors="coerce") for c in df.columns if c.endswith("pct")]),
+    ]
+    print(f"{rows:,} rows")
+    print(f"{'step':<10} {'old s':>8} {'new s':>8} {'speedup':>8}")
+    for name, old, new in cases:
+        old_t, new_t = timed(old), timed(new)
+        print(f"{name:<10} {old_t:>8.2f} {new_t:>8.3f} {old_t / new_t:>7.0f}x")
+    print(f"{'fix_data':<10} {'':>8} {timed(lambda: nysed.fix_data(df)):>8.3f}")
+
+
+def old_nysed_pct(x):
+    if not x or x == "" or x == "-" or x == 0:
+        return 0
+    if hasattr(x, "endswith") and x.endswith("%"):
+        x = x[:-1]
+    try:
+        x = float(x)
+        if 0 <= x <= 1:
+            return x
+        x /= 100
+        return x
+    except:
+        return x
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# NYC School Data
+# Copyright (C) 2022-2023. Matthew X. Curinga
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU AFFERO GENERAL PUBLIC LICENSE (the "License") as
+# published by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the License for more details.
+#
+# You should have received a copy of the License along with this program.
+# If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+"""
+Time `schools.link_schools()` on a synthetic external source: 2,000 reference
+schools and `n` messy names (upper cased, truncated or with extra words),
+with boro + district hints, a boro hint only, and no hints.
+
+Usage:
+    python benchmarks/bench_link.py [n]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from nycschools import schools
+
+words = ["academy", "science", "arts", "leadership", "community", "high", "school", "collegiate",
+         "global", "prep", "technology", "math", "music", "international", "william", "penn",
+         "douglass", "lincoln", "washington", "clemente", "roberto", "king", "hudson", "harbor",
+         "bridge", "park", "heights", "village", "east", "west", "north", "south"]
+
+
+def reference(n_schools=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_schools):
+        name = " ".join(rng.choice(words, rng.integers(2, 5))).title()
+        boro, district = rng.choice(list("KXMQR")), int(rng.integers(1, 33))
+        rows.append({"dbn": f"{district:02}{boro}{i % 999:03}", "school_name": f"P.S. {i % 999:03} {name}"})
+    ref = schools.name_cols(schools.dbn_cols(pd.DataFrame(rows)))
+    ref["ay"] = 2022
+    return ref
+
+
+def messy_names(ref, n, seed=0):
+    rng = np.random.default_rng(seed)
+    pick = rng.integers(0, len(ref), n)
+    names = ref.school_name.to_numpy(dtype=object)[pick].copy()
+    for i in range(n):
+        r = rng.random()
+        if r < .3:
+            names[i] = names[i].upper().replace("P.S. ", "PS ")
+        elif r < .6:
+            names[i] = names[i][:-2]
+        elif r < .8:
+            names[i] = f"{names[i]} {rng.integers(0, 500)}"
+    data = pd.DataFrame({"school": names, "boro": ref.boro.to_numpy()[pick],
+                         "district": ref.district.to_numpy()[pick]})
+    return data, ref.dbn.to_numpy()[pick]
+
+
+def main(n=100_000):
+    ref = reference()
+    data, truth = messy_names(ref, n)
+    print(f"{n:,} names ({data.school.nunique():,} distinct), {len(ref):,} schools")
+    hints = {"boro + district": dict(boro_col="boro", district_col="district"),
+             "boro": dict(boro_col="boro"),
+             "none": {}}
+    for label, kwargs in hints.items():
+        start = time.perf_counter()
+        links = schools.link_schools(data, "school", df=ref, **kwargs)
+        elapsed = time.perf_counter() - start
+        accuracy = (links.dbn.to_numpy() == truth).mean()
+        print(f"{label:>16}: {elapsed:6.1f}s  accuracy {accuracy:.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,83 @@
+# NYC School Data
+# Copyright (C) 2022-2023. Matthew X. Curinga
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU AFFERO GENERAL PUBLIC LICENSE (the "License") as
+# published by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the License for more details.
+#
+# You should have received a copy of the License along with this program.
+# If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+"""
+Compare (dbn, ay) lookups and year-over-year changes on the long demographic
+frame (`df[(df.dbn == x) & (df.ay == y)]`, shifted self-merges) with a
+`panel.SchoolPanel` and `panel.change_table()`, on a synthetic frame the size of the full demographic
+set (~1,900 schools x 20 years x 40 measures).
+
+Usage:
+    python benchmarks/bench_panel.py [lookups]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from nycschools import panel as panels
+from nycschools.panel import SchoolPanel
+
+
+def demographics(years=20, n_schools=1900, n_measures=40, seed=0):
+    rng = np.random.default_rng(seed)
+    dbns = [f"{i % 32 + 1:02}{'KXMQR'[i % 5]}{i:03}" for i in range(n_schools)]
+    df = pd.DataFrame({"dbn": np.repeat(dbns, years), "ay": np.tile(np.arange(2005, 2005 + years), n_schools)})
+    for k in range(n_measures):
+        df[f"m{k}_n"] = rng.integers(0, 1000, len(df))
+    # schools open and close
+    return df.sample(frac=.9, random_state=seed).reset_index(drop=True)
+
+
+def timed(label, f):
+    start = time.perf_counter()
+    result = f()
+    print(f"{label:>32}: {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def main(lookups=2000):
+    df = demographics()
+    print(f"{len(df):,} rows, {df.dbn.nunique():,} schools")
+    rng = np.random.default_rng(1)
+    keys = df.iloc[rng.integers(0, len(df), lookups)][["dbn", "ay"]].to_numpy()
+
+    timed(f"{lookups:,} frame filters", lambda: [df[(df.dbn == d) & (df.ay == y)].m0_n.iloc[0] for d, y in keys])
+    panel = timed("build SchoolPanel", lambda: SchoolPanel(df))
+    timed(f"{lookups:,} panel lookups", lambda: [panel[d, y, "m0_n"] for d, y in keys])
+
+    def merge_delta():
+        prev = df.assign(ay=df.ay + 1)
+        merged = df.merge(prev, on=["dbn", "ay"], how="left", suffixes=("", "_prev"))
+        return pd.DataFrame({c: merged[c] - merged[f"{c}_prev"] for c in df.columns if c.endswith("_n")})
+    timed("shifted self-merge deltas", merge_delta)
+    timed("panel.delta().to_frame()", lambda: panel.delta().to_frame())
+
+    cols = [c for c in df.columns if c.endswith("_n")]
+    def merge_changes():
+        out = df
+        for p in (1, 3, 5):
+            prev = df.assign(ay=df.ay + p)
+            merged = out.merge(prev, on=["dbn", "ay"], how="left", suffixes=("", "_prev"))
+            change = pd.DataFrame({f"{c}_change_{p}y": merged[c] - merged[f"{c}_prev"] for c in cols})
+            out = pd.concat([merged.drop(columns=[f"{c}_prev" for c in cols]), change], axis=1)
+        return out
+    timed("1, 3, 5 year self-merges", merge_changes)
+    timed("change_table(periods=(1, 3, 5))", lambda: panels.change_table(df, cols, periods=(1, 3, 5)))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
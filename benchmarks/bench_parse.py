@@ -0,0 +1,97 @@
+# NYC School Data
+# Copyright (C) 2022-2023. Matthew X. Curinga
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU AFFERO GENERAL PUBLIC LICENSE (the "License") as
+# published by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the License for more details.
+#
+# You should have received a copy of the License along with this program.
+# If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+"""
+Compare the per-row / per-value percentage and count parsing that was used in
+`schools`, `nysed.fix_data` and `shsat` with the `parse` module, on synthetic
+1M-row columns.
+
+Usage:
+    python benchmarks/bench_parse.py [rows]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from nycschools import parse, schools
+
+
+def columns(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    enroll = pd.Series(rng.integers(50, 2000, rows))
+    pct = np.char.add(np.round(rng.uniform(1, 99, rows), 1).astype(str), "%").astype(object)
+    pct[rng.random(rows) < .05] = "Above 95%"
+    pct[rng.random(rows) < .02] = "Below 5%"
+    pct[rng.random(rows) < .01] = "No Data"
+    count = (enroll * rng.uniform(.1, .99, rows)).astype(int).astype(str).to_numpy(dtype=object)
+    count[rng.random(rows) < .05] = "Above 95%"
+    shsat = rng.integers(6, 400, rows).astype(str).astype(object)
+    shsat[rng.random(rows) < .1] = "0-5"
+    nysed = rng.integers(0, 101, rows).astype(str).astype(object)
+    nysed[rng.random(rows) < .1] = "-"
+    return pd.DataFrame({"pct": pct, "count": count, "nysed": nysed, "shsat": shsat, "n": enroll})
+
+
+def old_nysed_pct(x):
+    if not x or x == "" or x =="-" or x == 0:
+        return 0
+    if hasattr(x, "endswith") and x.endswith("%"):
+        x = x[:-1]
+    try:
+        x = float(x)
+        if 0 <= x <= 1:
+            return x
+        x /= 100
+        return x
+    except:
+        return x
+
+
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    df = columns(rows)
+    df["dbn"], df["year"] = "01M015", "2022-23"
+    cases = [
+        ("schools pct",
+         lambda: df.apply(lambda row: schools.str_pct(row, "pct", "n"), axis=1),
+         lambda: parse.pct(df["pct"], df["n"])),
+        ("schools count",
+         lambda: df.apply(lambda row: schools.str_count(row, "count", "n"), axis=1),
+         lambda: parse.count(df["count"], df["n"])),
+        ("nysed pct",
+         lambda: df["nysed"].apply(old_nysed_pct),
+         lambda: parse.pct(df["nysed"], scale="gt1", errors="coerce")),
+        ("shsat count",
+         lambda: pd.to_numeric(df["shsat"].apply(lambda x: 2 if x == "0-5" else x), errors="coerce"),
+         lambda: parse.count(df["shsat"])),
+    ]
+    print(f"{rows:,} rows")
+    print(f"{'column':<14} {'per row s':>10} {'parse s':>8} {'speedup':>8}")
+    for name, old, new in cases:
+        _, old_t = timed(old)
+        _, new_t = timed(new)
+        print(f"{name:<14} {old_t:>10.2f} {new_t:>8.3f} {old_t / new_t:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# NYC School Data
+# Copyright (C) 2022-2023. Matthew X. Curinga
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU AFFERO GENERAL PUBLIC LICENSE (the "License") as
+# published by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the License for more details.
+#
+# You should have received a copy of the License along with this program.
+# If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+"""
+Time of the school level math and ELA rollups: the per analysis groupby
+with a weighted mean per group, `exams.exam_rollup()` and the cached
+`exams.load_exam_rollup()`, on the synthetic exam files of `bench_exams.py`.
+The groupby apply is timed on a sample of the schools and the time for
+every school is estimated from it.
+
+Usage:
+    python benchmarks/bench_rollup.py [schools] [sample schools]
+"""
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from bench_exams import exam_results
+from nycschools import config, dataloader, exams
+
+
+def groupby_apply(df):
+    """The usual rollup in an analysis: one Python call per group."""
+    df = df[df.grade != "All Grades"]
+
+    def school(g):
+        return pd.Series({
+            "number_tested": g.number_tested.sum(),
+            "mean_scale_score": np.average(g.mean_scale_score, weights=g.number_tested),
+            "level_3_4_n": g.level_3_4_n.sum(),
+            "level_3_4_pct": g.level_3_4_n.sum() / g.number_tested.sum(),
+        })
+    return df.groupby(["dbn", "ay", "category", "exam"], observed=True).apply(school)
+
+
+def measure(label, f):
+    start = time.perf_counter()
+    df = f()
+    print(f"{label:>20}: {time.perf_counter() - start:6.2f}s  {len(df):>10,} rows")
+
+
+def main(n_schools=1200, sample=20):
+    with tempfile.TemporaryDirectory() as data_dir:
+        config.data_dir = data_dir
+        exam_results(n_schools, 1).to_csv(dataloader.data_path("nyc_math"), index=False)
+        exam_results(n_schools, 2).to_csv(dataloader.data_path("nyc_ela"), index=False)
+        df = exams.load_math_ela_long()
+        print(f"{len(df):,} math and ela rows")
+        sample = min(sample, n_schools)
+        dbns = df.dbn.unique()[:sample]
+        start = time.perf_counter()
+        groupby_apply(df[df.dbn.isin(dbns)])
+        elapsed = time.perf_counter() - start
+        estimate = elapsed / sample * n_schools
+        print(f"{'groupby apply':>20}: {elapsed:6.2f}s  for {sample} schools, about {estimate:.0f}s for all {n_schools:,}")
+        measure("exam_rollup", lambda: exams.exam_rollup(df))
+        measure("district rollup", lambda: exams.exam_rollup(df, by="district"))
+        measure("load (build)", lambda: exams.load_exam_rollup(refresh=True))
+        measure("load (cached)", exams.load_exam_rollup)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,64 @@
+# NYC School Data
+# Copyright (C) 2022-2023. Matthew X. Curinga
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU AFFERO GENERAL PUBLIC LICENSE (the "License") as
+# published by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the License for more details.
+#
+# You should have received a copy of the License along with this program.
+# If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+"""
+Compare parse time and memory for each data file in `datasets.schemas`
+read without column types and with them.
+
+Usage:
+    python benchmarks/bench_schemas.py
+
+Requires the compiled data files in `config.data_dir`.
+"""
+import os.path
+import time
+
+import pandas as pd
+
+from nycschools import config, dataloader
+from nycschools.datasets import schemas
+
+
+def mb(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def read_untyped(path):
+    if path.endswith(".csv"):
+        return pd.read_csv(path, low_memory=False)
+    return pd.read_feather(path)
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    print(f"{'dataset':<16} {'untyped MB':>10} {'typed MB':>10} {'saved':>6} {'untyped s':>10} {'typed s':>8}")
+    for key in schemas:
+        path = os.path.join(config.data_dir, config.urls[key].filename)
+        if not os.path.exists(path):
+            print(f"{key:<16} missing {path}")
+            continue
+        raw, raw_t = timed(read_untyped, path)
+        typed, typed_t = timed(dataloader.read_file, path)
+        saved = 1 - mb(typed) / mb(raw)
+        print(f"{key:<16} {mb(raw):>10.1f} {mb(typed):>10.1f} {saved:>6.0%} {raw_t:>10.2f} {typed_t:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
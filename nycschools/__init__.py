@@ -17,10 +17,15 @@
 import os
 import warnings
 import os.path
+import importlib
 from types import SimpleNamespace
 from .datasets import urls as __urls
 
 
+__submodules = ["budgets", "class_size", "dataloader", "exams", "geo", "nysed",
+                "panel", "parse", "schools", "shsat", "snapshot", "tools", "ui"]
+
+
 def get_version():
     """Returns the version of the nycschools package"""
     return "0.1.0"
@@ -33,6 +38,45 @@ def __read_urls():
     return urls
 
 
+def find_data_dir():
+    """Finds the local data directory, warning if it does not exist.
+
+Returns
+-------
+str :
+    The path to the data directory, or "" if it does not exist.
+"""
+    env_dir = os.environ.get("NYC_SCHOOLS_DATA_DIR", None)
+    data_dir = env_dir if env_dir else os.path.join(os.getcwd(), "school-data")
+
+    if not os.path.exists(data_dir):
+        no_data = f"""The data directory {data_dir} does not exist.
+Run python -m nycschools.dataloader to download the data.
+Please visit documentation on how to download the data at:
+https://adelphi-ed-tech.github.io/nycschools/install.html
+
+If you have downloaded the data and are seeing this warning, you may
+need to set the environment variable NYC_SCHOOLS_DATA_DIR to the
+path to the data directory.
+"""
+
+        warnings.warn(no_data)
+        data_dir = ""
+    return data_dir
+
+
+class Config(SimpleNamespace):
+    """Configuration settings. `data_dir` is looked up the first time it
+    is read (see `find_data_dir()`), so importing the package never touches the
+    filesystem. Assign `config.data_dir` to override it."""
+
+    def __getattr__(self, name):
+        if name == "data_dir":
+            self.data_dir = find_data_dir()
+            return self.data_dir
+        raise AttributeError(name)
+
+
 def get_config():
     """Initialize the configuration settings.
 
@@ -42,10 +86,10 @@ None
 
 Returns
 -------
-SimpleNamespace : 
+Config : 
     A namespace object with the following attributes:
     - data_dir : str
-        The path to the data directory.
+        The path to the data directory, resolved on first access.
     - urls : dict
         A dictionary of URLs to download data if the local cache should be re-built.
 
@@ -55,33 +99,15 @@ The location for local data files is determined by first looking for an environm
 
 To see and change these settings for your installation, run `python -m nycschools.dataloader`.
 """
+    return Config(urls=__read_urls())
 
-    env_dir = os.environ.get("NYC_SCHOOLS_DATA_DIR", None)
-    pwd = os.getcwd()
-    local = os.path.join(pwd, "school-data")
-    config = {}
-    if env_dir:
-        config["data_dir"] = env_dir
-    else:
-        config["data_dir"] = local
-    
-    if not os.path.exists(config["data_dir"]):
-        no_data = f"""The data directory {config["data_dir"]} does not exist.
-Run python -m nycschools.dataloader to download the data.
-Please visit documentation on how to download the data at:
-https://adelphi-ed-tech.github.io/nycschools/install.html
-
-If you have downloaded the data and are seeing this warning, you may
-need to set the environment variable NYC_SCHOOLS_DATA_DIR to the
-path to the data directory.
-"""
-
-        warnings.warn(no_data)
-        config["data_dir"] = ""
-
-    config["urls"] = __read_urls()
 
-    return SimpleNamespace(**config)
+config = get_config()
 
 
-config = get_config()
+def __getattr__(name):
+    """Imports submodules on first use, so `import nycschools` stays cheap
+    and `nycschools.schools` works without an explicit import."""
+    if name in __submodules:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -16,27 +16,29 @@
 import os.path
 import os
 import pandas as pd
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.common.exceptions import WebDriverException
 
 from . import config, schools
-from .dataloader import load
+from .dataloader import load, data_path
+from .tools import lazy_import
 
-import dotenv
-dotenv.load_dotenv()
+# selenium and bs4 are only needed to scrape new data
+webdriver = lazy_import("selenium.webdriver")
+selenium_errors = lazy_import("selenium.common.exceptions")
+bs4 = lazy_import("bs4")
 
-__galaxyfile = os.path.join(config.data_dir, config.urls["galaxy"].filename)
 
 
 
-def load_galaxy_budgets():
+def load_galaxy_budgets(columns=None, filters=None):
     """Loads the galaxy budgets from the local cache.
     
     Parameters
     ----------
-    None
+    columns : list, optional
+        only load these columns
+    filters : list, optional
+        only load rows that match these filters, e.g. `[("dbn", "==", "01M015")]`.
+        See `dataloader.read_file()` for the filter format.
     
     Returns
     -------
@@ -44,7 +46,7 @@ def load_galaxy_budgets():
         A single DataFrame that combines all of the budget data scraped from the web
         for all schools in the database."""   
 
-    return load(config.urls["galaxy"].filename)
+    return load(config.urls["galaxy"].filename, columns=columns, filters=filters)
 
 
 def open_webdriver():
@@ -60,6 +62,10 @@ def open_webdriver():
     driver : selenium.webdriver.chrome.webdriver.WebDriver
         The Selenium webdriver with the --headless option.
     """
+    # driver settings can come from a local .env file
+    import dotenv
+    dotenv.load_dotenv()
+
     # Define the possible browser driver classes
     drivers = [webdriver.Firefox, webdriver.Chrome,  webdriver.Edge]
 
@@ -76,12 +82,12 @@ def open_webdriver():
             driver = Driver(options=opt)
 
             return driver
-        except WebDriverException as ex:
+        except selenium_errors.WebDriverException as ex:
             print(ex)
             continue
 
     # If no drivers could be loaded, raise an error
-    raise WebDriverException("""No suitable WebDriver could be found. 
+    raise selenium_errors.WebDriverException("""No suitable WebDriver could be found. 
 Make sure that the latest Chrome or Firefox browser is installed.
 Update the selenium package with:
 pip install -U selenium""")
@@ -139,7 +145,7 @@ def get_galaxy_summary(dbn, ay, driver):
     driver.get(url)
     html = driver.page_source
 
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = bs4.BeautifulSoup(html, 'html.parser')
     # use the section header as row category
     sections = [section.get_text().strip() for section in soup.select('.TO_Section')]
     data = pd.read_html(html)
@@ -168,6 +174,6 @@ def get_galaxy_budgets():
 
     data = pd.concat(budgets)
     data.item = data.item.str.lower()
-    data.to_csv(__galaxyfile, index=False)
+    data.to_csv(data_path("galaxy"), index=False)
 
     return data, not_found
\ No newline at end of file
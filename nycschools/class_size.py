@@ -17,17 +17,19 @@ import os.path
 
 import pandas as pd
 
-from .dataloader import load
-from . import config
+from .dataloader import load, data_path, read_excel_sheets
+from . import config, schools
 urls = config.urls
-__class_size_file = os.path.join(config.data_dir, config.urls["class_size"].filename)
-__ptr_file = os.path.join(config.data_dir, config.urls["class_size"].filename_ptr)
 
-def load_class_size():
-    return load(config.urls["class_size"].filename)
+def load_class_size(columns=None, filters=None):
+    """Load the class size data for all years. `columns` and `filters`
+    select the data to load, see `dataloader.read_file()`."""
+    return load(config.urls["class_size"].filename, columns=columns, filters=filters)
 
-def load_ptr():
-    return load(config.urls["class_size"].filename_ptr)
+def load_ptr(columns=None, filters=None):
+    """Load the pupil teacher ratios. `columns` and `filters`
+    select the data to load, see `dataloader.read_file()`."""
+    return load(config.urls["class_size"].filename_ptr, columns=columns, filters=filters)
 
 def get_class_22(url):
     """Read class size data for 2022 from
@@ -36,7 +38,7 @@ def get_class_22(url):
        which are saved in a separate file.
     """
 
-    xls = pd.read_excel(url, sheet_name=None)
+    xls = read_excel_sheets(url, ["K-8 Avg", "MS HS Avg", "PTR"])
     # first sheet is k-8
     k8 = xls["K-8 Avg"]
     hs = xls["MS HS Avg"]
@@ -51,6 +53,8 @@ def get_class_22(url):
                 'students_n', 'classes_n', 'avg_class_size',
                 'min_class_size', 'max_class_size', 'dept', 'subject',
                 'ay']
+    # the sheets mix "K" and numbered grades, which are read as text
+    df["grade"] = df.grade.map(lambda g: int(g) if isinstance(g, str) and g.isdigit() else g)
 
     return df, ptr
 
@@ -69,7 +73,7 @@ def get_class_size_year(ay, url):
     if (ay == 2022):
         df, ptr = get_class_22(url)
 
-        ptr.to_csv(__ptr_file, index=False)
+        ptr.to_csv(data_path("class_size", "filename_ptr"), index=False)
     else:
         df = pd.read_csv(url, dtype={'dbn': str})
         df["ay"] = ay
@@ -96,7 +100,8 @@ def get_class_size():
     -------
     DataFrame
         a pandas DataFrame holding school demographic data for all of the schools
-        in the data portal
+        in the data portal, with `beds`, `zip` and `geo_district` from
+        `schools.join_loc_data()`
 
     """
     years =[]
@@ -104,7 +109,8 @@ def get_class_size():
         data = get_class_size_year(int(ay), url)
         years.append(data)
     df = pd.concat(years)
-    df.to_csv(__class_size_file, index=False)
+    df = schools.join_loc_data(df)
+    df.to_csv(data_path("class_size"), index=False)
     return df
 
 
@@ -13,9 +13,14 @@
 # You should have received a copy of the License along with this program.
 # If not, see <http://www.gnu.org/licenses/>.
 # ==============================================================================
+import io
 import os
+import importlib.util
+import tempfile
 import os.path
-import py7zr
+import json
+import hashlib
+import zlib
 import requests
 import sys
 import warnings
@@ -23,17 +28,23 @@ import platform
 import subprocess
 import time
 import datetime
+import threading
+import functools
+from collections import OrderedDict, namedtuple
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 import pandas as pd
-import geopandas as gpd
 
-from yaspin import yaspin
-from yaspin.spinners import Spinners
 
 # from . import config, schools, exams, budgets, geo, nysed, shsat
 from . import config
-from .tools import suppress_warnings
+from .datasets import schemas
+from .tools import suppress_warnings, file_lock, lazy_import
+
+gpd = lazy_import("geopandas")
+ds = lazy_import("pyarrow.dataset")
+pq = lazy_import("pyarrow.parquet")
+py7zr = lazy_import("py7zr")
 
 import ssl
 
@@ -43,66 +54,872 @@ def get_data_dir():
     return config.data_dir
 
 
-def read_file(path, gdf=False):
+def data_path(key, attr="filename", data_dir=None):
+    """The local path of a dataset file, e.g. `data_path("demographics")`.
+
+    The path is built from the *current* `config.data_dir` on every call
+    (cached per directory), so setting `config.data_dir` at runtime, e.g. by
+    `download_archive()`, takes effect without re-importing any modules.
+
+    Parameters
+    ----------
+    key : str
+        the dataset key in `datasets.urls`
+    attr : str
+        the attribute that holds the file name, e.g. `"filename_ptr"`
+    data_dir : str, optional
+        resolve against this directory instead of `config.data_dir`
+
+    Returns
+    -------
+    str
+        the path to the file
+    """
+    if data_dir is None:
+        data_dir = config.data_dir
+    return _data_path(data_dir, key, attr)
+
+
+@functools.lru_cache(maxsize=1024)
+def _data_path(data_dir, key, attr):
+    return os.path.join(data_dir, getattr(config.urls[key], attr))
+
+
+def read_file(path, gdf=False, columns=None, filters=None):
+    """Read a data file into a DataFrame (or GeoDataFrame) based on its extension.
+
+    Parameters
+    ----------
+    path : str
+        a local path or URL to a .parquet, .geojson, .csv or .feather file
+    gdf : bool, default False
+        read a .feather file as a GeoDataFrame
+    columns : list, optional
+        only read these columns. Spatial files always keep their `geometry` column.
+    filters : list, optional
+        only keep rows that match these filters, in the `pyarrow` format:
+        a list of `(column, op, value)` tuples that are all true, or a list
+        of such lists where any one is true.
+        For example: `[("ay", "==", 2022), ("district", "<", 33)]`.
+        `op` is one of `==, =, !=, <, <=, >, >=, in, not in`.
+
+    Notes
+    -----
+    Parquet and Feather files push the column selection and filters down to
+    `pyarrow` so unused columns and rows are never decoded into pandas. Text
+    files are parsed with only the needed columns and then filtered.
+
+    Files listed in `datasets.schemas` are read with those column types.
+    """
     check_path = path[:path.find("?")] if "?" in path else path
+    schema = schema_for(check_path)
     if check_path.endswith(".parquet"):
-        return gpd.read_parquet(path)
+        if not gdf and not _is_geoparquet(path):
+            df = pd.read_parquet(path, columns=columns, filters=filters)
+            return apply_schema(df, schema)
+        cols = _needed_columns(columns, None, geo=True)
+        return apply_schema(gpd.read_parquet(path, columns=cols, filters=filters), schema)
     if check_path.endswith(".geojson"):
-        return gpd.read_file(path)
+        df = gpd.read_file(path)
+        return _select(df, _needed_columns(columns, None, geo=True), filters)
     elif check_path.endswith(".csv"):
-        return pd.read_csv(path)
+        usecols = _needed_columns(columns, filters)
+        # categories and floats are set by the parser, integers after checking for NaN
+        dtype = {c: t for c, t in schema.items() if not pd.api.types.is_integer_dtype(t)}
+        df = pd.read_csv(path, usecols=usecols, dtype=dtype or None)
+        return _select(apply_schema(df, schema), columns, filters)
     elif check_path.endswith(".feather"):
         if gdf:
-            return gpd.read_feather(path)
-        return pd.read_feather(path)
+            df = gpd.read_feather(path, columns=_needed_columns(columns, filters, geo=True))
+            return _select(apply_schema(df, schema), _needed_columns(columns, None, geo=True), filters)
+        if filters is None:
+            return apply_schema(pd.read_feather(path, columns=columns), schema)
+        data = ds.dataset(path, format="ipc")
+        df = data.to_table(columns=columns, filter=pq.filters_to_expression(filters)).to_pandas()
+        return apply_schema(df, schema)
     else:
         raise ValueError(f"Unknown file type: {path}")
 
+
+def schema_for(path):
+    """Returns the column types in `datasets.schemas` for a data file
+    (matched on its file name) or an empty dict if it doesn't have a schema."""
+    name = os.path.basename(path)
+    for key, schema in schemas.items():
+        if getattr(config.urls.get(key), "filename", None) == name:
+            return schema
+    return {}
+
+
+def apply_schema(df, schema):
+    """Convert the columns of `df` to the types in `schema`.
+    Integer columns with missing values are converted to floats (float32 for
+    small ints, float64 for the rest) and columns that can't be converted
+    are left as they are."""
+    for col, dtype in schema.items():
+        if col not in df or df[col].dtype == dtype:
+            continue
+        s = df[col]
+        try:
+            if pd.api.types.is_integer_dtype(dtype):
+                if not pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s):
+                    continue
+                if s.isna().any() or (s % 1 != 0).any():
+                    dtype = "float32" if pd.api.types.pandas_dtype(dtype).itemsize <= 2 else "float64"
+            df[col] = s.astype(dtype)
+        except (ValueError, TypeError) as ex:
+            warnings.warn(f"Could not convert {col} to {dtype}: {ex}")
+    return df
+
+
+def _is_geoparquet(path):
+    """True if the Parquet file has GeoParquet metadata (or can't be checked)."""
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+        return b"geo" in metadata
+    except Exception:
+        return True
+
+
+def _filter_terms(filters):
+    """Normalize `filters` to a list of lists of `(col, op, value)` (an OR of ANDs)."""
+    if not filters:
+        return []
+    if isinstance(filters[0], tuple):
+        return [list(filters)]
+    return [list(f) for f in filters]
+
+
+def _needed_columns(columns, filters, geo=False):
+    """The columns that must be read to select `columns` and apply `filters`."""
+    if columns is None:
+        return None
+    needed = list(columns)
+    for terms in _filter_terms(filters):
+        needed += [col for col, op, value in terms]
+    if geo:
+        needed.append("geometry")
+    return list(dict.fromkeys(needed))
+
+
+def _select(df, columns=None, filters=None):
+    """Apply `pyarrow` style filters and a column projection to a frame in memory."""
+    ops = {
+        "==": lambda s, v: s == v,
+        "=": lambda s, v: s == v,
+        "!=": lambda s, v: s != v,
+        "<": lambda s, v: s < v,
+        "<=": lambda s, v: s <= v,
+        ">": lambda s, v: s > v,
+        ">=": lambda s, v: s >= v,
+        "in": lambda s, v: s.isin(v),
+        "not in": lambda s, v: ~s.isin(v),
+    }
+    terms = _filter_terms(filters)
+    if terms:
+        mask = pd.Series(False, index=df.index)
+        for and_terms in terms:
+            m = pd.Series(True, index=df.index)
+            for col, op, value in and_terms:
+                if op not in ops:
+                    raise ValueError(f"Unknown filter operation: {op}")
+                m &= ops[op](df[col], value)
+            mask |= m
+        df = df[mask].reset_index(drop=True)
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
+
+
+def _freeze(filters):
+    """A hashable version of `filters` to use in cache keys."""
+    return tuple(tuple((col, op, tuple(v) if isinstance(v, (list, set)) else v)
+                       for col, op, v in terms) for terms in _filter_terms(filters))
+
 def write_file(df, path):
-    if path.endswith(".geojson"):
-        df.to_file(path, driver="GeoJSON")
-    elif path.endswith(".csv"):
-        df.to_csv(path, index=False)
-    elif path.endswith(".feather"):
-        df.to_feather(path)
-    else:
+    """Write `df` to `path` in the format of its extension.
+    The data is written to a temporary file that is renamed to `path` when it
+    is complete, so readers never see a partially written file."""
+    if not path.endswith((".geojson", ".csv", ".feather")):
         raise ValueError(f"Unknown file type: {path}")
+    tmp = temp_path(path)
+    try:
+        if path.endswith(".geojson"):
+            df.to_file(tmp, driver="GeoJSON")
+        elif path.endswith(".csv"):
+            df.to_csv(tmp, index=False)
+        elif path.endswith(".feather"):
+            df.to_feather(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def temp_path(path):
+    """A temporary file name next to `path` that is unique to this process and thread."""
+    return f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "currsize", "maxsize", "frames"])
+
+
+class FrameCache():
+    """A process-wide, memory bounded LRU cache of the DataFrames read by `load()`.
+
+    Frames are keyed on the file path, the `gdf` flag, the columns and filters
+    used to read it and the size and modification time of the file, so a data file that is re-built or replaced on disk is
+    read again on the next `load()`. When the total (deep) memory usage of
+    the cached frames exceeds `maxsize` bytes the least recently used frames
+    are evicted.
+
+    The cache keeps its own copy of each frame and hands out copies, so
+    callers can modify the frames they get back without corrupting the cache.
+    With pandas copy-on-write enabled these copies are shallow and cheap.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._frames = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns a copy of the cached frame for `key` or `None` if it is not cached."""
+        with self._lock:
+            if key not in self._frames:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._frames.move_to_end(key)
+            return _copy_frame(self._frames[key])
+
+    def put(self, key, df):
+        """Adds `df` to the cache and returns a copy that is safe to give to the caller."""
+        size = int(df.memory_usage(deep=True, index=True).sum())
+        with self._lock:
+            # drop the frame for this key and any stale versions of the same file
+            for k in [k for k in self._frames if k[:4] == key[:4]]:
+                self._remove(k)
+            if size <= self.maxsize:
+                self._frames[key] = df
+                self._sizes[key] = size
+                self._evict()
+        return _copy_frame(df)
+
+    def resize(self, maxsize):
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._sizes.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions,
+                             sum(self._sizes.values()), self.maxsize, len(self._frames))
+
+    def _remove(self, key):
+        del self._frames[key]
+        del self._sizes[key]
+
+    def _evict(self):
+        while self._frames and sum(self._sizes.values()) > self.maxsize:
+            key = next(iter(self._frames))
+            self._remove(key)
+            self.evictions += 1
+
+
+def _copy_on_write():
+    """True if pandas copy-on-write is enabled so shallow copies can't leak writes."""
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    try:
+        return pd.get_option("mode.copy_on_write") is True
+    except Exception:
+        return False
+
+
+def _copy_frame(df):
+    return df.copy(deep=not _copy_on_write())
+
+
+# memory budget for the in-process cache, set NYC_SCHOOLS_CACHE_MB=0 to turn it off
+frame_cache = FrameCache(int(float(os.environ.get("NYC_SCHOOLS_CACHE_MB", 1024)) * 2**20))
+
+
+def cache_info():
+    """Returns the hits, misses, evictions, current size and max size (in bytes)
+    of the in-process `load()` cache."""
+    return frame_cache.info()
+
+
+def clear_cache():
+    """Empty the in-process `load()` cache and reset its counters."""
+    frame_cache.clear()
+
+
+def set_cache_size(mb):
+    """Set the memory budget of the in-process `load()` cache in megabytes.
+    Use 0 to turn the cache off."""
+    frame_cache.resize(int(mb * 2**20))
+
+
+def _cache_key(path, gdf, columns=None, filters=None):
+    """Key a frame on how it was read and the current size/mtime of the file, if it is local."""
+    cols = tuple(columns) if columns is not None else None
+    try:
+        stat = os.stat(path)
+        return (os.path.abspath(path), gdf, cols, _freeze(filters), stat.st_mtime_ns, stat.st_size)
+    except (OSError, ValueError):
+        return (path, gdf, cols, _freeze(filters), None, None)
+
+
+# text formats that get a columnar sidecar, set NYC_SCHOOLS_SIDECAR=0 to turn them off
+sidecar_formats = {".csv": ".parquet", ".geojson": ".parquet"}
+use_sidecars = os.environ.get("NYC_SCHOOLS_SIDECAR", "1") != "0"
+sidecar_dir = "_cache"
+
+
+def sidecar_path(path):
+    """Returns the path of the columnar sidecar for a local text data file.
+    The size and mtime of the source file are part of the sidecar name so
+    a sidecar is never served for a file that has changed since it was written.
+    Returns `None` if the file type doesn't have a sidecar."""
+    root, ext = os.path.splitext(path)
+    if ext not in sidecar_formats:
+        return None
+    stat = os.stat(path)
+    name = os.path.basename(path)
+    folder = os.path.join(os.path.dirname(path), sidecar_dir)
+    # a schema change also needs a new sidecar
+    schema = hashlib.sha1(repr(sorted(schema_for(path).items())).encode()).hexdigest()[:8]
+    return os.path.join(folder, f"{name}.{stat.st_size}-{stat.st_mtime_ns}-{schema}{sidecar_formats[ext]}")
+
+
+def read_sidecar(path, gdf=False, columns=None, filters=None):
+    """Read a local data file from its Parquet (or GeoParquet) sidecar.
+    If the sidecar is missing or stale the text file is parsed and a new
+    sidecar is written for the next load. Files without a sidecar format
+    are read with `read_file()`. `columns` and `filters` are pushed down
+    to the Parquet reader, see `read_file()`."""
+    if not use_sidecars:
+        return read_file(path, gdf=gdf, columns=columns, filters=filters)
+    sidecar = sidecar_path(path)
+    if sidecar is None:
+        return read_file(path, gdf=gdf, columns=columns, filters=filters)
+
+    geo = path.endswith(".geojson")
+    def read():
+        try:
+            if geo:
+                cols = _needed_columns(columns, None, geo=True)
+                return gpd.read_parquet(sidecar, columns=cols, filters=filters)
+            return pd.read_parquet(sidecar, columns=columns, filters=filters)
+        except Exception as ex:
+            warnings.warn(f"Could not read sidecar {sidecar}: {ex}")
+
+    if os.path.exists(sidecar):
+        df = read()
+        if df is not None:
+            return df
+
+    # one process builds the sidecar while the others wait for it
+    with file_lock(sidecar):
+        if os.path.exists(sidecar):
+            df = read()
+            if df is not None:
+                return df
+        # the sidecar always holds the whole file
+        df = read_file(path, gdf=gdf)
+        write_sidecar(df, path, sidecar)
+    return _select(df, _needed_columns(columns, None, geo=geo), filters)
+
+
+def write_sidecar(df, path, sidecar):
+    """Write `df` to `sidecar` and remove any stale sidecars for `path`.
+    Failures only warn, the text file is always the source of truth."""
+    folder = os.path.dirname(sidecar)
+    prefix = os.path.basename(path) + "."
+    tmp = temp_path(sidecar)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        df.to_parquet(tmp)
+        os.replace(tmp, sidecar)
+        for f in os.listdir(folder):
+            old = os.path.join(folder, f)
+            # only remove old sidecars, not temp or lock files
+            if f.startswith(prefix) and old != sidecar and f.endswith(os.path.splitext(sidecar)[1]):
+                os.remove(old)
+    except Exception as ex:
+        warnings.warn(f"Could not write sidecar for {path}: {ex}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _read_cached(path, gdf=False, columns=None, filters=None, cache=True):
+    key = _cache_key(path, gdf, columns, filters)
+    reader = read_sidecar if key[4] is not None else read_file
+    if not cache:
+        return reader(path, gdf=gdf, columns=columns, filters=filters)
+    df = frame_cache.get(key)
+    if df is not None:
+        return df
+    return frame_cache.put(key, reader(path, gdf=gdf, columns=columns, filters=filters))
+
+
+def read_source(source):
+    """Returns the raw bytes of a source file: a local path or a URL."""
+    if str(source).startswith("http"):
+        r = requests.get(source)
+        r.raise_for_status()
+        return r.content
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def build_cached(name, source, build, data_dir=None):
+    """Build a frame from a source file once per version of the file.
+
+    The source is read and hashed, and `build(io.BytesIO(content))` is only
+    called if there is no cached result for the same `source` and content
+    hash. Results are saved as Parquet in `data_dir/_cache`; older results
+    for `name` and `source` are removed.
+
+    Parameters
+    ----------
+    name : str
+        a name for the cached frames, e.g. "demographics-2022"
+    source : str
+        the URL or local path of the source file
+    build : callable
+        makes the DataFrame from a file-like object with the source content
+    data_dir : str, optional
+        defaults to `config.data_dir`
+
+    Returns
+    -------
+    DataFrame
+    """
+    content = read_source(source)
+    folder = os.path.join(data_dir or config.data_dir, sidecar_dir)
+    prefix = f"{name}.{hashlib.sha1(str(source).encode()).hexdigest()[:12]}-"
+    path = os.path.join(folder, f"{prefix}{hashlib.sha256(content).hexdigest()[:16]}.parquet")
+    if os.path.exists(path):
+        try:
+            return pd.read_parquet(path)
+        except Exception as ex:
+            warnings.warn(f"Could not read cached {name} from {path}: {ex}")
+
+    df = build(io.BytesIO(content))
+    write_cached(df, path, prefix)
+    return df
 
-def load(path, gdf=False):
+
+def write_cached(df, path, prefix):
+    """Write a derived frame to the Parquet file `path` and remove the other
+    files in its folder that start with `prefix` (older versions of it).
+    Failures only warn, a cache can always be rebuilt."""
+    folder = os.path.dirname(path)
+    tmp = temp_path(path)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        df.to_parquet(tmp)
+        os.replace(tmp, path)
+        for f in os.listdir(folder):
+            if f.startswith(prefix) and f.endswith(".parquet") and os.path.join(folder, f) != path:
+                os.remove(os.path.join(folder, f))
+    except Exception as ex:
+        warnings.warn(f"Could not cache {path}: {ex}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# calamine is much faster than openpyxl, use it if it is installed
+excel_engine = "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+
+
+def read_excel_sheets(source, sheets, columns=None, workers=None, cache=True):
+    """Read some of the sheets of an Excel workbook, each in its own process.
+
+    Only the listed sheets (and columns) are parsed, with `excel_engine`.
+    Parsed sheets are cached as Parquet in `data_dir/_cache` by the workbook's
+    content hash, so reading the same workbook again only reads the cache.
+    Columns that mix numbers and text (e.g. "s" for suppressed counts) are
+    returned as `string` columns so they can be saved.
+
+    Parameters
+    ----------
+    source : str
+        the URL or local path of the workbook
+    sheets : list
+        the names of the sheets to read
+    columns : list or dict, optional
+        the columns to keep in every sheet; a dict renames them
+        (`{"School DBN": "dbn"}`)
+    workers : int, optional
+        the number of processes, by default one per sheet up to the number of cores
+    cache : bool, default True
+        read and write the cache
+
+    Returns
+    -------
+    dict
+        sheet name -> DataFrame
+    """
+    content = read_source(source)
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    def cache_path(sheet):
+        key = hashlib.sha1(repr((str(source), sheet, columns)).encode()).hexdigest()[:12]
+        return os.path.join(config.data_dir, sidecar_dir, f"excel-{key}."), f"{digest}.parquet"
+
+    use_cache = cache and bool(config.data_dir)
+    frames = {}
+    if use_cache:
+        for sheet in sheets:
+            prefix, name = cache_path(sheet)
+            if os.path.exists(prefix + name):
+                try:
+                    frames[sheet] = pd.read_parquet(prefix + name)
+                except Exception as ex:
+                    warnings.warn(f"Could not read cached sheet {sheet} of {source}: {ex}")
+    missing = [sheet for sheet in sheets if sheet not in frames]
+    if not missing:
+        return frames
+
+    local = os.path.exists(str(source))
+    path = str(source) if local else temp_path(os.path.join(tempfile.gettempdir(), f"workbook-{digest}.xlsx"))
+    try:
+        if not local:
+            with open(path, "wb") as f:
+                f.write(content)
+        # opening a workbook is slow, so each process opens it once for its share of the sheets
+        workers = min(len(missing), workers or os.cpu_count() or 1)
+        jobs = [(path, missing[i::workers], columns) for i in range(workers)]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parsed = dict(kv for part in executor.map(_read_sheets, jobs) for kv in part.items())
+        else:
+            parsed = _read_sheets(jobs[0])
+    finally:
+        if not local and os.path.exists(path):
+            os.remove(path)
+
+    for sheet in missing:
+        frames[sheet] = parsed[sheet]
+        if use_cache:
+            prefix, name = cache_path(sheet)
+            write_cached(parsed[sheet], prefix + name, os.path.basename(prefix))
+    return {sheet: frames[sheet] for sheet in sheets}
+
+
+def _read_sheets(job):
+    """Parse some sheets of a workbook: `job` is (path, sheet names, columns)."""
+    path, sheets, columns = job
+    usecols = list(columns) if columns else None
+    xls = pd.read_excel(path, sheet_name=sheets, usecols=usecols, engine=excel_engine)
+    for sheet, df in xls.items():
+        if columns:
+            df = df[list(columns)]
+        if isinstance(columns, dict):
+            df = df.rename(columns=columns)
+        xls[sheet] = _mixed_to_string(df)
+    return xls
+
+
+def _mixed_to_string(df):
+    """Cast the object columns that hold more than one type of value to `string`."""
+    mixed = [c for c in df.columns if df[c].dtype == object
+             and df[c].dropna().map(type).nunique() > 1]
+    if mixed:
+        df = df.astype({c: "string" for c in mixed})
+    return df
+
+
+def upsert(df, new, keys):
+    """Returns the rows of `new` followed by the rows of `df` whose `keys`
+    are not in `new`, e.g. `upsert(df, update, ["dbn", "ay"])`."""
+    if df is None or len(df) == 0:
+        return new.reset_index(drop=True)
+    if len(keys) == 1:
+        replaced = df[keys[0]].isin(new[keys[0]]).to_numpy()
+    else:
+        replaced = pd.MultiIndex.from_frame(df[keys]).isin(pd.MultiIndex.from_frame(new[keys]))
+    return pd.concat([new, df[~replaced]], ignore_index=True)
+
+
+def load(path, gdf=False, columns=None, filters=None, cache=True):
+    """Load a data file from `data_dir` or, if it isn't there, from the
+    data site (and save it to `data_dir` for next time).
+
+    Parameters
+    ----------
+    path : str
+        the file name in `data_dir` or a full URL
+    gdf : bool, default False
+        read a .feather file as a GeoDataFrame
+    columns : list, optional
+        only load these columns
+    filters : list, optional
+        only load the rows that match these `pyarrow` style filters,
+        e.g. `[("ay", "==", 2022), ("district", "<", 33)]`.
+        See `read_file()` for details.
+    cache : bool, default True
+        keep the frame in the in-process cache (see `cache_info()`), use
+        False for one-off reads, e.g. one district at a time
+
+    Returns
+    -------
+    DataFrame
+    """
     print("loading:", path)
     if path.startswith("http"):
         remote_path = path
     else:
         remote_path = config.urls["datasite"].url + path
     if config.data_dir is None or config.data_dir == "":
-        return read_file(remote_path, gdf=gdf)
-    
+        return _read_cached(remote_path, gdf=gdf, columns=columns, filters=filters, cache=cache)
+
     local_path = os.path.join(config.data_dir, path)
+    if not os.path.exists(local_path) and not path.startswith("http"):
+        try:
+            fetch_file(path)
+        except (requests.RequestException, IOError) as ex:
+            warnings.warn(f"Could not fetch {path}, reading it remotely: {ex}")
     if os.path.exists(local_path):
-        return read_file(local_path, gdf=gdf)
+        return _read_cached(local_path, gdf=gdf, columns=columns, filters=filters, cache=cache)
+
+    # one worker reads the remote file and saves all of it locally while the
+    # others wait for it, then select from it
+    with file_lock(local_path, lock_dir=os.path.join(config.data_dir, sidecar_dir)):
+        if os.path.exists(local_path):
+            return _read_cached(local_path, gdf=gdf, columns=columns, filters=filters, cache=cache)
+        df = read_file(remote_path, gdf=gdf)
+        write_file(df, local_path)
+    geo = "geopandas" in sys.modules and isinstance(df, gpd.GeoDataFrame)
+    df = _select(df, _needed_columns(columns, None, geo=geo), filters)
+    if not cache:
+        return df
+    return frame_cache.put(_cache_key(local_path, gdf, columns, filters), df)
 
-    df = read_file(remote_path, gdf=gdf)
-    write_file(df, local_path)
-    return df
 
 
 
+def download_file(url, local_filename, sha256=None, size=None, chunk_size=16 * 2**20, workers=4):
+    """Download `url` to `local_filename`, streaming to disk.
 
-def download_file(url, local_filename):
-    """Optimize file download using requests library."""
-    with requests.get(url, stream=True) as r:
+    If the server accepts HTTP range requests the file is downloaded in
+    `chunk_size` pieces by `workers` threads. Each piece is saved in a
+    `.partN` file next to `local_filename`, so an interrupted download
+    resumes where it stopped the next time it is called. The server's ETag
+    and the file size are saved next to the parts, and parts of a different
+    version of the file are removed instead of resumed. Servers that don't
+    support ranges are downloaded in a single stream.
+
+    Parameters:
+        url (str): the URL to download
+        local_filename (str): where to save the file
+        sha256 (str): the expected SHA-256 hex digest of the file, if it is
+            known the download is verified and removed if it doesn't match
+        size (int): the expected size of the file in bytes, checked the same way
+        chunk_size (int): the size in bytes of each range request
+        workers (int): the number of parallel range requests
+
+    Returns:
+        str: `local_filename`
+
+    Raises:
+        ValueError: if the size or SHA-256 digest doesn't match `size` or `sha256`
+    """
+    with requests.get(url, stream=True, headers={"Range": "bytes=0-0"}) as r:
         r.raise_for_status()
-        with open(local_filename, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+        ranges = r.status_code == 206 and "/" in r.headers.get("Content-Range", "")
+        total = int(r.headers["Content-Range"].split("/")[-1]) if ranges else None
+        etag = r.headers.get("ETag")
+
+    tmp = f"{local_filename}.part"
+    if ranges:
+        starts = range(0, total, chunk_size)
+        parts = [(f"{tmp}{i}", start, min(start + chunk_size, total) - 1) for i, start in enumerate(starts)]
+        _check_parts(tmp, {"url": url, "etag": etag, "size": total, "chunk_size": chunk_size})
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in as_completed([executor.submit(_download_range, url, *p) for p in parts]):
+                future.result()
+        with open(tmp, "wb") as f:
+            for part, start, end in parts:
+                with open(part, "rb") as p:
+                    while chunk := p.read(2**20):
+                        f.write(chunk)
+        for part, start, end in parts:
+            os.remove(part)
+        os.remove(f"{tmp}.json")
+    else:
+        with requests.get(url, stream=True) as r:
+            r.raise_for_status()
+            with open(tmp, "wb") as f:
+                for chunk in r.iter_content(chunk_size=2**20):
+                    f.write(chunk)
+
+    if size is not None and os.path.getsize(tmp) != size:
+        got = os.path.getsize(tmp)
+        os.remove(tmp)
+        raise ValueError(f"{url} is {got} bytes, expected {size}")
+    if sha256:
+        digest = file_sha256(tmp)
+        if digest != sha256.lower():
+            os.remove(tmp)
+            raise ValueError(f"SHA-256 of {url} is {digest}, expected {sha256}")
+    os.replace(tmp, local_filename)
     return local_filename
 
-def download_data():
+
+def _check_parts(tmp, version):
+    """Remove the `.partN` files of an earlier download of a different version
+    of the file (by ETag, size and chunk size), then record `version` in `tmp.json`
+    so the parts can be resumed."""
+    folder, name = os.path.split(os.path.abspath(tmp))
+    info = f"{tmp}.json"
+    saved = None
+    if os.path.exists(info):
+        try:
+            with open(info) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+    if saved is not None and saved != version:
+        for f in os.listdir(folder):
+            if f.startswith(name) and f[len(name):].isdigit():
+                os.remove(os.path.join(folder, f))
+    with open(info, "w") as f:
+        json.dump(version, f)
+
+
+def _download_range(url, part, start, end):
+    """Download bytes `start..end` of `url` into `part`, resuming if part of it is already there."""
+    have = os.path.getsize(part) if os.path.exists(part) else 0
+    expected = end - start + 1
+    if have > expected:
+        # left over from a different download, start over
+        os.remove(part)
+        have = 0
+    if have == expected:
+        return part
+    with requests.get(url, stream=True, headers={"Range": f"bytes={start + have}-{end}"}) as r:
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise IOError(f"Server ignored the range request for {url}")
+        with open(part, "ab") as f:
+            for chunk in r.iter_content(chunk_size=2**20):
+                f.write(chunk)
+    if os.path.getsize(part) != expected:
+        raise IOError(f"Incomplete download of {url} bytes {start}-{end}")
+    return part
+
+
+def file_sha256(path):
+    """Returns the SHA-256 hex digest of a file."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(2**20):
+            h.update(chunk)
+    return h.hexdigest()
+
+_manifest = None
+
+
+def load_manifest(refresh=False):
+    """Returns the datasite manifest: a dict of file name to `size` and `sha256`.
+    The manifest is fetched once per process. If it can't be fetched an empty
+    dict is returned and files are downloaded without being verified."""
+    global _manifest
+    if _manifest is None or refresh:
+        url = config.urls["datasite"].url + config.urls["manifest"].filename
+        try:
+            r = requests.get(url, timeout=30)
+            r.raise_for_status()
+            _manifest = r.json().get("files", {})
+        except (requests.RequestException, ValueError) as ex:
+            warnings.warn(f"Could not load the data manifest from {url}: {ex}")
+            _manifest = {}
+    return _manifest
+
+
+def build_manifest(data_dir=None):
+    """Write `manifest.json` with the size and SHA-256 of every data file in
+    `data_dir`. Publish it on the datasite with the data files so
+    `fetch_file()` can verify its downloads."""
+    data_dir = data_dir or config.data_dir
+    skip = {config.urls["manifest"].filename, "index.html"}
+    files = {}
+    for f in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, f)
+        if f in skip or f.startswith(("_", ".")) or not os.path.isfile(path):
+            continue
+        files[f] = {"size": os.path.getsize(path), "sha256": file_sha256(path)}
+    out = os.path.join(data_dir, config.urls["manifest"].filename)
+    with open(out, "w") as f:
+        json.dump({"files": files}, f, indent=2)
+    return files
+
+
+def fetch_file(path, data_dir=None):
+    """Download a single data file from the datasite into `data_dir` if it
+    isn't there already, and return its local path.
+
+    The download is written to a temporary file and renamed into place once
+    it is complete (and matches the manifest size and SHA-256, if the file is
+    in the manifest), so other readers never see a partial file. A lock per
+    file makes parallel workers wait for a single download instead of each
+    fetching the file.
+    """
+    data_dir = data_dir or config.data_dir
+    local_path = os.path.join(data_dir, path)
+    if os.path.exists(local_path):
+        return local_path
+    with file_lock(local_path, lock_dir=os.path.join(data_dir, sidecar_dir)):
+        # another worker may have fetched it while we waited for the lock
+        if os.path.exists(local_path):
+            return local_path
+        entry = load_manifest().get(path, {})
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        try:
+            download_file(config.urls["datasite"].url + path, local_path,
+                          sha256=entry.get("sha256"), size=entry.get("size"))
+        except ValueError as ex:
+            manifest = config.urls["datasite"].url + config.urls["manifest"].filename
+            raise ValueError(f"The download of {path} doesn't match the data manifest {manifest}: {ex}") from ex
+    return local_path
+
+
+def prefetch(files=None, data_dir=None, workers=4):
+    """Fetch data files from the datasite in parallel, by default every file in the manifest.
+    Returns the local paths."""
+    files = files if files is not None else list(load_manifest())
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda f: fetch_file(f, data_dir), files))
+
+
+def download_data(lazy=False):
+    """Find the local data directory or download the data archive into it.
+    With `lazy=True` the archive isn't downloaded, instead each data file is
+    fetched from the datasite the first time it is loaded."""
     path = find_data_dir(config)
     if path:
         config.data_dir = path
         return path
-    
+
+    if lazy:
+        data_dir = config.data_dir or os.path.join(".", "school-data")
+        os.makedirs(data_dir, exist_ok=True)
+        config.data_dir = data_dir
+        return data_dir
+
     return download_archive(config.data_dir)
 
 
@@ -201,6 +1018,7 @@ def contains_data_files(path):
     Found files: {files.intersection(expected)}
     Missing files: {missing}
 You can download the data files by running: `python -m nycschools.dataloader -d`
+or missing files will be fetched from the datasite as they are loaded.
 For more information, see:
 https://adelphi-ed-tech.github.io/nycschools/""")
 
@@ -234,19 +1052,45 @@ def download_archive(data_dir=None):
 
     url = config.urls["school-data-archive"].url
     filename = config.urls["school-data-archive"].filename
+    sha256 = getattr(config.urls["school-data-archive"], "sha256", None)
     data_dir = os.path.abspath(data_dir)
     archive = os.path.join(data_dir, filename)
-    resp = requests.get(url)
-    with open(archive, "wb") as f:
-        f.write(resp.content)
-
-    with py7zr.SevenZipFile(archive, mode='r') as z:
-        z.extractall(path=data_dir)
+    download_file(url, archive, sha256=sha256)
+    extract_archive(archive, data_dir)
 
     os.remove(archive)
     return data_dir
 
 
+def extract_archive(archive, data_dir):
+    """Extract the members of a .7z archive into `data_dir` that are missing
+    or differ (by size or CRC32) from the files that are already there.
+
+    Returns:
+        list: the names of the extracted files
+    """
+    with py7zr.SevenZipFile(archive, mode='r') as z:
+        targets = [info.filename for info in z.list()
+                   if not info.is_directory and _member_changed(info, data_dir)]
+        if targets:
+            z.reset()
+            z.extract(path=data_dir, targets=targets)
+    return targets
+
+
+def _member_changed(info, data_dir):
+    path = os.path.join(data_dir, info.filename)
+    if not os.path.exists(path) or os.path.getsize(path) != info.uncompressed:
+        return True
+    if info.crc32 is None:
+        return False
+    crc = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(2**20):
+            crc = zlib.crc32(chunk, crc)
+    return crc != info.crc32
+
+
 def get_venv_activate():
     """Finds the activation script for a running virtual environment
     or `None` if not running a venv."""
@@ -338,6 +1182,8 @@ def download_cache():
     data_dir = prompt_data()
     print(f"Downloading school data to {data_dir}")
 
+    from yaspin import yaspin
+    from yaspin.spinners import Spinners
     with yaspin(text="loading...", spinner=Spinners.bouncingBall) as sp:
         sp.side = "right"
         data_dir = download_archive(data_dir)
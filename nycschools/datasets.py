@@ -22,6 +22,10 @@ urls = {
         "url": "https://data.mixi.nyc/",
         "desc": "online data portal for nycschools"
     },
+    "manifest": {
+        "filename": "manifest.json",
+        "desc": "size and SHA-256 of each file on the datasite, used to fetch files on demand"
+    },
     "docbook": {
         "url": "https://adelphi-ed-tech.github.io/nycschools/install.html"
     },
@@ -45,6 +49,8 @@ urls = {
     "school-data-archive": {
         "url": "https://drive.google.com/uc?export=download&id=1I35Wr1-UObcPm9CYSgqPUa8JOzOuAQBF",
         "filename": "nycschools-data.7z",
+        # SHA-256 of the published archive (printed by `invoke archive`), downloads are verified when it is set
+        "sha256": None,
         "desc": "Download the archive of clean school data from public Google Drive"
     },
     "hs_admissions": {
@@ -198,6 +204,79 @@ urls = {
             "https://data.nysed.gov/files/assessment/15-16/3-8-2015-16.zip"
         ],
         "filename": "nysed-exams.feather",
+        "filename_parquet": "nysed-exams",
         "desc": "NYS grades 3-8 ELA and Math test in a .zip archive"
     }
 }
+
+
+# column types for the compiled data files, keyed with the same names as `urls`
+# and applied by `dataloader.read_file()` when the file is parsed.
+# Integer columns that have missing values are read as floats instead.
+# Only low-cardinality columns are categories: before pandas 3 a groupby on a
+# category column keeps every category (`observed=False`), so ids like `dbn` are strings.
+__grades = ["grade_3k", "grade_pk", "grade_k"] + [f"grade_{i}" for i in range(1, 13)]
+__demo_groups = ["non_binary", "female", "male", "asian", "black", "hispanic",
+                 "multi_racial", "native_american", "white",
+                 "missing_race_ethnicity_data", "swd", "ell", "poverty"]
+__exam_levels = ["level_1", "level_2", "level_3", "level_4", "level_3_4"]
+
+schemas = {
+    "demographics": {
+        "dbn": "string[pyarrow]",
+        "district": "int8",
+        "geo_district": "int8",
+        "boro": "category",
+        "ay": "int16",
+        "year": "category",
+        "school_type": "category",
+        "school_level": "category",
+        "total_enrollment": "int32",
+        "zip": "int32",
+        "eni": "float32",
+        **{c: "int16" for c in __grades},
+        **{f"{g}_n": "int32" for g in __demo_groups},
+        **{f"{g}_pct": "float32" for g in __demo_groups},
+    },
+    "nyc_ela": {
+        "dbn": "string[pyarrow]",
+        "grade": "category",
+        "category": "category",
+        "ay": "int16",
+        "test_year": "int16",
+        "number_tested": "int32",
+        "mean_scale_score": "float32",
+        **{f"{lvl}_n": "float32" for lvl in __exam_levels},
+        **{f"{lvl}_pct": "float32" for lvl in __exam_levels},
+    },
+    "nyc_regents": {
+        "dbn": "string[pyarrow]",
+        "school_type": "category",
+        "school_level": "category",
+        "regents_exam": "category",
+        "category": "category",
+        "ay": "int16",
+        "year": "int16",
+        "test_year": "int16",
+        "mean_score": "float32",
+        "number_tested": "float32",
+        **{f"{c}_n": "float32" for c in ["below_65", "above_64", "above_79", "college_ready"]},
+        **{f"{c}_pct": "float32" for c in ["below_65", "above_64", "above_79", "college_ready"]},
+    },
+    "nysed_math_ela": {
+        "school_name": "string[pyarrow]",
+        "category": "category",
+        "exam": "category",
+        "grade": "int8",
+        "ay": "int16",
+        "test_year": "int16",
+        "subgroup_code": "int16",
+        "number_tested": "int32",
+        "total_enrollment": "int32",
+        "number_not_tested": "int32",
+        "mean_scale_score": "float32",
+        **{f"{lvl}_n": "int32" for lvl in __exam_levels},
+        **{f"{lvl}_pct": "float32" for lvl in __exam_levels},
+    },
+}
+schemas["nyc_math"] = schemas["nyc_ela"]
@@ -19,8 +19,12 @@ import numpy as np
 import os.path
 from concurrent.futures import ThreadPoolExecutor
 
-from .dataloader import load
-from . import config
+from .dataloader import load, data_path, read_excel_sheets
+from . import config, dataloader
+from .tools import lazy_import
+
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
 urls = config.urls
 
 
@@ -70,33 +74,108 @@ def load_charter_test(url, filename):
 
     return df
 
-def load_math_ela_wide():
+# the columns that identify a row of the math and ela results
+exam_keys = ["dbn", "ay", "grade", "category"]
+
+
+def load_math_ela_wide(columns=None, filters=None):
     """
     Load a combined `DataFrame` with both math and ela test results
     in a "wide" data format.
     All of the math result columns have the suffix `_math`
     and the ELA columns have the suffix `_ela`.
-    """
-    math_df = load_math()
-    ela_df = load_ela()
-    combined = math_df.merge(ela_df, how="inner", on=["dbn", "ay", "grade"], suffixes=["_math", "_ela"])
-    return combined
 
-def load_math_ela_long():
+    Rows are matched on `dbn`, `ay`, `grade` and `category`.
+    `columns` and `filters` are applied to each exam before they are
+    merged, see `load_math()`. The merge columns are always loaded.
     """
-    Load a combined `DataFrame` with both math and ela test results
-    in a "wide" data format.
-    All of the math result columns have the suffix `_math`
-    and the ELA columns have the suffix `_ela`.
+    if columns is not None:
+        columns = list(dict.fromkeys(exam_keys + list(columns)))
+    math_df = load(urls["nyc_math"].filename, columns=columns, filters=filters)
+    ela_df = load(urls["nyc_ela"].filename, columns=columns, filters=filters)
+    keys = [c for c in exam_keys if c in math_df and c in ela_df]
+    math_df, ela_df = __align_categories(math_df, ela_df)
+
+    # join on one integer key instead of the four columns, in dbn and ay order
+    math_key, ela_key = __join_keys(math_df, ela_df, keys)
+    order = __exam_order(math_key)
+    order = np.arange(len(math_df)) if order is None else order
+    left = pd.DataFrame({"key": math_key[order], "i": order})
+    right = pd.DataFrame({"key": ela_key, "j": np.arange(len(ela_df))})
+    pairs = left.merge(right, on="key", how="inner", sort=False)
+
+    both = set(math_df.columns) & set(ela_df.columns)
+    def suffix(df, rows, drop, sfx):
+        df = df.drop(columns=drop).take(rows.to_numpy()).reset_index(drop=True)
+        return df.rename(columns={c: c + sfx for c in df.columns if c in both})
+    math_part = suffix(math_df, pairs.i, [], "_math").rename(columns={f"{k}_math": k for k in keys})
+    ela_part = suffix(ela_df, pairs.j, keys, "_ela")
+    return pd.concat([math_part, ela_part], axis=1)
+
+
+def load_math_ela_long(columns=None, filters=None):
     """
-    math_df = load_math().copy()
-    ela_df = load_ela().copy()
-    math_df["exam"] = "math"
-    ela_df["exam"] = "ela"
-    return pd.concat([math_df, ela_df])
-
+    Load a combined `DataFrame` with both math and ela test results
+    in a "long" data format: the results for each exam are stacked and
+    the categorical `exam` column is "math" or "ela".
 
-def load_ela():
+    `columns` and `filters` are applied to each exam, see `load_math()`.
+    """
+    math_df = load(urls["nyc_math"].filename, columns=columns, filters=filters)
+    ela_df = load(urls["nyc_ela"].filename, columns=columns, filters=filters)
+    math_df, ela_df = __align_categories(math_df, ela_df)
+    keys = [c for c in ["dbn", "ay"] if c in math_df and c in ela_df]
+    math_key, ela_key = __join_keys(math_df, ela_df, keys)
+
+    df = pd.concat([math_df, ela_df], ignore_index=True)
+    exam = np.repeat(np.array([0, 1], dtype="int8"), [len(math_df), len(ela_df)])
+    df["exam"] = pd.Categorical.from_codes(exam, categories=["math", "ela"])
+    # math before ela, each by dbn and ay
+    math_order, ela_order = __exam_order(math_key), __exam_order(ela_key)
+    if math_order is None and ela_order is None:
+        return df
+    math_order = np.arange(len(math_df)) if math_order is None else math_order
+    ela_order = np.arange(len(ela_df)) if ela_order is None else ela_order
+    return df.take(np.concatenate([math_order, ela_order + len(math_df)])).reset_index(drop=True)
+
+
+def __align_categories(a, b):
+    """Give the categorical columns that `a` and `b` share the same categories,
+    so they can be concatenated or compared without turning into objects."""
+    for c in a.columns.intersection(b.columns):
+        if isinstance(a[c].dtype, pd.CategoricalDtype) and isinstance(b[c].dtype, pd.CategoricalDtype) \
+                and a[c].dtype != b[c].dtype:
+            categories = a[c].cat.categories.union(b[c].cat.categories)
+            a[c] = a[c].cat.set_categories(categories)
+            b[c] = b[c].cat.set_categories(categories)
+    return a, b
+
+
+def __join_keys(a, b, keys):
+    """An int64 key for each row of `a` and `b` that is the same for the same
+    values of `keys` and sorts like them."""
+    a_key = np.zeros(len(a), dtype="int64")
+    b_key = np.zeros(len(b), dtype="int64")
+    for k in keys:
+        values = pd.concat([a[k], b[k]], ignore_index=True)
+        codes, uniques = pd.factorize(values, sort=True)
+        # missing values (-1) get a code of their own
+        codes = codes + 1
+        a_key = a_key * (len(uniques) + 1) + codes[:len(a)]
+        b_key = b_key * (len(uniques) + 1) + codes[len(a):]
+    return a_key, b_key
+
+
+def __exam_order(key):
+    """The order that sorts rows by `key`, or None if they are already sorted."""
+    if (key[1:] >= key[:-1]).all():
+        return None
+    # a stable sort of small unsigned ints is a radix sort
+    small = key.astype(np.min_scalar_type(key.max())) if len(key) else key
+    return np.argsort(small, kind="stable")
+
+
+def load_ela(columns=None, filters=None, cache=True):
     """
     Loads the New York State ELA grades 3-8 ELA exam results for all categories.
     If a local .csv data file exists, it will return results from that file. If
@@ -104,34 +183,195 @@ def load_ela():
     NYC Data Portal and then cobmines the results with charter school data into
     a `DataFrame`. _This can be slow_.
 
+    Parameters
+    ----------
+    columns : list, optional
+        only load these columns
+    filters : list, optional
+        only load rows that match these filters, e.g. `[("ay", "==", 2022)]`.
+        See `dataloader.read_file()` for the filter format.
+    cache : bool, default True
+        keep the frame in the in-process `dataloader` cache
     """
     # filename = os.path.join(config.data_dir, urls["nyc_ela"].filename)
     # df = pd.read_csv(filename, low_memory=False)
-    df = load(urls["nyc_ela"].filename)
-    return df.sort_values(by=["dbn", "ay"])
+    df = load(urls["nyc_ela"].filename, columns=columns, filters=filters, cache=cache)
+    return __sort_exams(df)
 
 
-def load_math():
+def load_math(columns=None, filters=None, cache=True):
     """
     Loads the New York State Math grades 3-8 ELA exam results for all categories.
     If a local .csv data file exists, it will return results from that file. If
     no local file is available, itt will loads the Excel data file for from the
     NYC Data Portal and then combines the results with charter school data into
     a `DataFrame`. _This can be slow_.
+
+    Parameters
+    ----------
+    columns : list, optional
+        only load these columns
+    filters : list, optional
+        only load rows that match these filters, e.g. `[("ay", "==", 2022)]`.
+        See `dataloader.read_file()` for the filter format.
+    cache : bool, default True
+        keep the frame in the in-process `dataloader` cache
     """
     # filename = os.path.join(config.data_dir, urls["nyc_math"].filename)
     # df = pd.read_csv(filename, low_memory=False)
-    df = load(urls["nyc_math"].filename)
+    df = load(urls["nyc_math"].filename, columns=columns, filters=filters, cache=cache)
+
+    return __sort_exams(df)
+
 
-    return df.sort_values(by=["dbn", "ay"])
+def __sort_exams(df):
+    by = [c for c in ["dbn", "ay"] if c in df]
+    return df.sort_values(by=by) if by else df
 
 
-def load_regents():
+def load_regents(columns=None, filters=None):
     """
     Loads the New York State Regents exam scores for all categories.
+    `columns` and `filters` select the data to load, see `load_math()`.
     @return `DataFrame`
     """
-    return load(urls["nyc_regents"].filename)
+    return load(urls["nyc_regents"].filename, columns=columns, filters=filters)
+
+
+# the proficiency levels that are summed in the rollups
+rollup_levels = ["level_1", "level_2", "level_3", "level_4", "level_3_4"]
+
+
+def exam_rollup(df, by="school"):
+    """Roll the grade 3-8 results up to one row per school (or district),
+    year, category and exam.
+
+    The per grade rows are summed in one groupby; the "All Grades" rows
+    in the data are not used. `mean_scale_score` is the mean weighted by
+    `number_tested` and each `level_*_pct` is `level_*_n` over the number
+    tested in the grades where that level was reported, so suppressed
+    (`NaN`) rows don't count as zeros. `suppressed_n` is the number tested
+    in grades with suppressed level counts. Values are `NaN` if every grade
+    was suppressed.
+
+    Parameters
+    ----------
+    df : DataFrame
+        math and/or ELA results, e.g. `load_math_ela_long()`; without an
+        `exam` column all rows are one exam
+    by : str, default "school"
+        "school" for a row per `dbn`, or "district" (from the dbn)
+
+    Returns
+    -------
+    DataFrame
+    """
+    if by not in ("school", "district"):
+        raise ValueError(f"by must be 'school' or 'district', not {by!r}")
+    keys = ["dbn", "ay", "category"] + (["exam"] if "exam" in df else [])
+    df = df[df.grade.astype(str) != "All Grades"]
+    tested = df.number_tested.astype("float64")
+
+    # the sums that the rollup is computed from; they add up across schools too
+    sums = {"grades_n": pd.Series(1.0, index=df.index), "number_tested": tested}
+    score = df.mean_scale_score.astype("float64")
+    sums["score_tested"] = tested.where(score.notna())
+    sums["score_sum"] = score * tested
+    for level in rollup_levels:
+        n = df[f"{level}_n"].astype("float64")
+        sums[f"{level}_n"] = n
+        sums[f"{level}_tested"] = tested.where(n.notna())
+    sums["suppressed_n"] = tested.where(df.level_3_4_n.isna(), 0)
+    sums = pd.DataFrame(sums)
+    group = [df[k].astype(str) if k == "dbn" else df[k] for k in keys]
+    sums = sums.groupby(group, observed=True, sort=True).sum(min_count=1).reset_index()
+
+    if by == "district":
+        sums["schools_n"] = 1.0
+        district = sums.dbn.str[:2]
+        sums.insert(0, "district", pd.to_numeric(district, errors="coerce").astype("Int64"))
+        keys = ["district"] + keys[1:]
+        sums = sums.drop(columns="dbn").groupby(keys, observed=True, sort=True).sum(min_count=1).reset_index()
+
+    table = sums[keys + [c for c in ["schools_n", "grades_n"] if c in sums]].copy()
+    table["number_tested"] = sums.number_tested
+    table["suppressed_n"] = sums.suppressed_n
+    table["mean_scale_score"] = sums.score_sum / sums.score_tested
+    for level in rollup_levels:
+        table[f"{level}_n"] = sums[f"{level}_n"]
+        table[f"{level}_pct"] = sums[f"{level}_n"] / sums[f"{level}_tested"]
+    counts = [c for c in table.columns if c.endswith("_n") and c != "dbn"]
+    table[counts] = table[counts].astype("float64")
+    return table
+
+
+def load_exam_rollup(by="school", columns=None, filters=None, refresh=False):
+    """Load the `exam_rollup()` of the math and ELA results: one row per
+    school (or district), year, category and exam ("math" or "ela").
+
+    The rollup is built once and saved in `data_dir/_cache` until the
+    math or ELA data file changes.
+
+    Parameters
+    ----------
+    by : str, default "school"
+        "school" or "district"
+    columns : list, optional
+        only return these columns (and the keys)
+    filters : list, optional
+        only return rows that match these filters, e.g. `[("ay", "==", 2022)]`.
+        See `dataloader.read_file()` for the filter format.
+    refresh : bool, default False
+        rebuild the rollup even if it is cached
+
+    Returns
+    -------
+    DataFrame
+    """
+    if by not in ("school", "district"):
+        raise ValueError(f"by must be 'school' or 'district', not {by!r}")
+    path = __rollup_path(by)
+    if path is None or refresh or not os.path.exists(path):
+        cols = exam_keys + ["number_tested", "mean_scale_score"] + [f"{level}_n" for level in rollup_levels]
+        table = exam_rollup(load_math_ela_long(columns=cols), by)
+        # the data files are downloaded by the first load if they were missing
+        path = __rollup_path(by)
+        if path:
+            dataloader.write_cached(table, path, f"exam-rollup-{by}.")
+
+    keys = ["dbn" if by == "school" else "district", "ay", "category", "exam"]
+    if columns is not None:
+        columns = list(dict.fromkeys(keys + list(columns)))
+    if path and os.path.exists(path):
+        return dataloader.read_file(path, columns=columns, filters=filters)
+    data = pa.Table.from_pandas(table, preserve_index=False)
+    if filters:
+        data = data.filter(pq.filters_to_expression(filters))
+    return data.select(columns or data.column_names).to_pandas()
+
+
+def __rollup_path(by):
+    """The cache file for the rollup of the current math and ELA files, or None
+    if they aren't in the data directory."""
+    sources = [data_path("nyc_math"), data_path("nyc_ela")]
+    if not all(os.path.exists(source) for source in sources):
+        return None
+    version = "-".join(f"{stat.st_size}-{stat.st_mtime_ns}" for stat in map(os.stat, sources))
+    return os.path.join(os.path.dirname(sources[0]), dataloader.sidecar_dir, f"exam-rollup-{by}.{version}.parquet")
+
+
+def load_math_rollup(by="school", columns=None, filters=None):
+    """The math rows of `load_exam_rollup()`."""
+    return __exam_rows(load_exam_rollup(by, columns, filters), "math")
+
+
+def load_ela_rollup(by="school", columns=None, filters=None):
+    """The ELA rows of `load_exam_rollup()`."""
+    return __exam_rows(load_exam_rollup(by, columns, filters), "ela")
+
+
+def __exam_rows(df, exam):
+    return df[df.exam == exam].drop(columns="exam").reset_index(drop=True)
 
 
 # ==============================================================================
@@ -171,7 +411,6 @@ def charter_cols(data):
 
 def load_regents_excel():
     url = urls["nyc_regents"].url
-    xls = pd.read_excel(url, sheet_name=None)
     cols = [
         'School DBN',
         'School Type',
@@ -214,17 +453,16 @@ def load_regents_excel():
         'By ELL Status',
         'By SWD Status']
 
-    data = [xls[sheet] for sheet in sheet_names]
-    df = pd.concat(data, ignore_index=True)
-    df = df[cols]
-    df.columns = new_cols
+    # only the sheets and columns we use are parsed, one sheet per process
+    xls = read_excel_sheets(url, sheet_names, columns=dict(zip(cols, new_cols)))
+    df = pd.concat([xls[sheet] for sheet in sheet_names], ignore_index=True)
     numeric_cols = new_cols[6:]
     for col in numeric_cols:
         df[col] = pd.to_numeric(df[col], errors='coerce')
     df["test_year"] = df["year"]
     df["ay"] = df["year"] - 1
     df = df.sort_values(by=["dbn","ay","regents_exam","category"])
-    filename = os.path.join(config.data_dir, urls["nyc_regents"].filename)
+    filename = data_path("nyc_regents")
     df.to_csv(filename, index=False)
     return df
 
@@ -239,23 +477,19 @@ def read_nys_exam_excel(url):
     or NYSED downloads, however they do not contain demographic
     breakdowns for charter schools.
 
-    Note this function can take more than 120 seconds to run.
-    
+    Only the sheets and columns used are parsed, each sheet in its
+    own process, and the parsed sheets are cached by the file's
+    content hash (see `dataloader.read_excel_sheets`).
+
     Parameters:
         url (str): the URL of the Excel file
     Returns:
         `DataFrame`
     """
 
-    xls = pd.read_excel(url, sheet_name=None)
-    
     # these are the known sheet names that we care about
     sheet_names = ['All', 'SWD', 'Ethnicity', 'Gender', 'Econ Status', 'ELL']
 
-    data = [xls[sheet] for sheet in sheet_names]
-
-    df = pd.concat(data, ignore_index=True)
-
     cols = ['DBN', 'Grade', 'Year', 'Category', 'Number Tested', 'Mean Scale Score',
             '# Level 1', '% Level 1', '# Level 2', '% Level 2', '# Level 3',
             '% Level 3', '# Level 4', '% Level 4', '# Level 3+4', '% Level 3+4']
@@ -265,9 +499,8 @@ def read_nys_exam_excel(url):
                 'level_3_n', 'level_3_pct', 'level_4_n', 'level_4_pct', 'level_3_4_n',
                 'level_3_4_pct']
 
-    df = df[cols]
-
-    df.columns = new_cols
+    xls = read_excel_sheets(url, sheet_names, columns=dict(zip(cols, new_cols)))
+    df = pd.concat([xls[sheet] for sheet in sheet_names], ignore_index=True)
 
     for col in numeric_cols:
         df[col] = pd.to_numeric(df[col], errors='coerce')
@@ -291,7 +524,7 @@ def load_math_excel(url=urls["nyc_math"].url):
     df = read_nys_exam_excel(url)
     charter_df = load_charter_math()
     df = pd.concat([df, charter_df])
-    filename = os.path.join(config.data_dir, urls["nyc_math"].filename)
+    filename = data_path("nyc_math")
     df.to_csv(filename, index=False)
     return df
 
@@ -305,6 +538,6 @@ def load_ela_excel(url=urls["nyc_ela"].url):
     df = read_nys_exam_excel(url)
     charter_df = load_charter_ela()
     df = pd.concat([df, charter_df])
-    filename = os.path.join(config.data_dir, urls["nyc_ela"].filename)
+    filename = data_path("nyc_ela")
     df.to_csv(filename, index=False)
     return df
@@ -15,7 +15,6 @@
 # ==============================================================================
 from nycschools import datasets
 import pandas as pd
-import geopandas as gpd
 import os
 import os.path
 from datetime import datetime
@@ -24,46 +23,60 @@ from requests import Session
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from . import config, schools
-from .dataloader import load
+from .dataloader import load, data_path
+from .tools import lazy_import
+
+gpd = lazy_import("geopandas")
 
 urls = config.urls
-school_location_file = os.path.join(config.data_dir, urls["school_locations"].filename)
 
-def load_zipcodes():
+
+def __getattr__(name):
+    # `school_location_file` follows `config.data_dir` instead of being fixed at import
+    if name == "school_location_file":
+        return data_path("school_locations")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def load_zipcodes(columns=None, filters=None):
     """Load the NYC zip code boundaries as a GeoDataFrame from data_dir.
-    Zip codes are compiled from the NYC Data Portal via the US Post Office"""
-    df = load(urls["zipcodes"].filename)
+    Zip codes are compiled from the NYC Data Portal via the US Post Office.
+
+    All of the `load_*` functions in this module take optional `columns`
+    and `filters` to only load some of the data, see `dataloader.read_file()`.
+    The `geometry` column is always loaded."""
+    df = load(urls["zipcodes"].filename, columns=columns, filters=filters)
     return df
 
 
-def load_school_footprints():
+def load_school_footprints(columns=None, filters=None):
     """Get the shapes for school building footprints"""
-    gdf = load(urls["building_footprints"].school_footprints_file)
+    gdf = load(urls["building_footprints"].school_footprints_file, columns=columns, filters=filters)
     return gdf
 
-def load_city_footprints():
+def load_city_footprints(columns=None, filters=None):
     """Get the shapes for all building footprints in the New York City."""
     path = config.urls["building_footprints"].city_footprints_feather
-    df = load(path, gdf=True)
+    df = load(path, gdf=True, columns=columns, filters=filters)
     all_feet = gpd.GeoDataFrame(df, geometry="geometry", crs="EPSG:4326")
 
     return all_feet
 
-def load_district_neighborhoods():
+def load_district_neighborhoods(columns=None, filters=None):
     """Loads district number and neighborhood names"""
-    df = load(urls["neighborhoods"].districts_filename)
+    df = load(urls["neighborhoods"].districts_filename, columns=columns, filters=filters)
     return df
 
-def load_neighborhoods():
+def load_neighborhoods(columns=None, filters=None):
     """Load point data with neighborhood names"""
-    df = load(urls["neighborhoods"].filename)
+    df = load(urls["neighborhoods"].filename, columns=columns, filters=filters)
     return df
 
-def load_school_locations():
+def load_school_locations(columns=None, filters=None):
     """Returns a GeoDataFrame with the school locations and location meta-data"""
 
     try:
-        df = load(urls["school_locations"].filename)
+        df = load(urls["school_locations"].filename, columns=columns, filters=filters)
         return df
     except Exception as e: # geopandas throws DriveError, but I don't know where to import it to catch it
         if e.type != "<class 'fiona.errors.DriverError'>":
@@ -95,17 +108,18 @@ def get_neighborhoods(geojsonurl=urls["neighborhoods"].url):
     df = gpd.read_file(geojsonurl)
     df = df.rename(columns={"name": "neighborhood", "borough": "boro"})
     df = df[["neighborhood", "boro", "geometry"]]
-    path = os.path.join(config.data_dir, urls["neighborhoods"].filename)
+    path = data_path("neighborhoods")
     df.to_file(path, driver="GeoJSON")
     dist_names = merge_districts(df)
 
-    path = os.path.join(config.data_dir, urls["neighborhoods"].districts_filename)
+    path = data_path("neighborhoods", "districts_filename")
     dist_names.to_csv(path, index=False)
     
     return df
 
 
-def get_and_save_locations(filename=school_location_file):
+def get_and_save_locations(filename=None):
+    filename = filename or data_path("school_locations")
     points = get_points()
     locations = get_locations()
     df = points.merge(locations, on="dbn", how="left")
@@ -204,22 +218,23 @@ def get_school_footprints():
     foot["bbl"] = foot.base_bbl.astype(str)
     foot.mpluto_bbl = foot.mpluto_bbl.astype(str)
     # saving local feather
-    city_path = os.path.join(config.data_dir, urls["building_footprints"].city_footprints_feather)
+    city_path = data_path("building_footprints", "city_footprints_feather")
     foot.to_feather(city_path)
 
     # merging with point locations for dbn
     school_loc = get_points()
     school_foot = foot.merge(school_loc[["dbn","bbl"]], on="bbl", how="inner")
     # saving to data dir
-    school_path = os.path.join(config.data_dir, urls["building_footprints"].school_footprints_file)
+    school_path = data_path("building_footprints", "school_footprints_file")
     school_foot.to_file(school_path, driver="GeoJSON")
     return school_foot
 
-def load_districts(url="foo"):
+def load_districts(url="foo", columns=None, filters=None):
     """Get geo shape file for NYC school districts, indexed by district number."""
     # districts = gpd.read_file(url)
-    districts = load(urls["district_geo"].filename)
-    districts.district = districts.district.astype(int)
+    districts = load(urls["district_geo"].filename, columns=columns, filters=filters)
+    if "district" in districts:
+        districts.district = districts.district.astype(int)
     districts = districts.to_crs(epsg=4326)
     return districts
 
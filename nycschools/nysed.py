@@ -17,28 +17,39 @@ import pandas as pd
 import numpy as np
 import wget
 
+import io
 import os.path
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from . import schools
-from .dataloader import load
-from . import config
+from .dataloader import load, data_path, download_file, excel_engine
+from . import config, parse
+from .tools import lazy_import
 import shutil
 
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+
 urls = config.urls
 
 
-def load_nyc_nysed():
+def load_nyc_nysed(columns=None, filters=None):
     """
     Load the subset set of the `load_nys_nysed` data for schools in the
     New York City Department of Education school demographics data set.
+    `columns` and `filters` select the data to load, see `load_nys_nysed()`.
     """
-    df = load_nys_nysed()
-    nyc = schools.load_school_demographics()
+    cols = None if columns is None else list(dict.fromkeys(list(columns) + ["beds"]))
+    df = load_nys_nysed(cols, filters)
+    nyc = schools.load_school_demographics(columns=["beds"])
     beds = nyc.beds.unique()
-    return df[df.beds.isin(beds)]
+    df = df[df.beds.isin(beds)]
+    if columns is not None:
+        df = df[list(columns)]
+    return df
 
-def load_nys_nysed():
+def load_nys_nysed(columns=None, filters=None):
     """
     Load the grades 3-8 math and ela exam results for all schools and districts
     in New York State, in a long data format. This is the only data set that has
@@ -50,55 +61,113 @@ def load_nys_nysed():
 
     The NYSED data includes categories that are not part of the NYC data such as
     homelessness, foster care, and parents in armed services.
+
+    This is a large file. Only loading the needed columns and rows is much
+    faster and uses much less memory, because the selection is done by
+    `pyarrow` before the data is converted to pandas.
+
+    Parameters
+    ----------
+    columns : list, optional
+        only load these columns
+    filters : list, optional
+        only load rows that match these filters, e.g.
+        `[("ay", "==", 2018), ("exam", "==", "math")]`.
+        See `dataloader.read_file()` for the filter format.
     """
 
     # try to load it locally to save time
     # feather = os.path.join(config.data_dir, "nysed-exams.feather")
     # return pd.read_feather(feather)
-    return load(urls["nysed_math_ela"].filename)
+    return load(urls["nysed_math_ela"].filename, columns=columns, filters=filters)
 
 
-def load_nysed_ela_math_archives(urls=urls["nysed_math_ela"].urls):
+def load_nysed_ela_math_archives(urls=urls["nysed_math_ela"].urls, workers=None):
     """
-    Downloads all of the zip archives listed in the urls configuraiton. Extract
-    the archives into a temp folder and read them as dataframes. Concats the
-    dataframes into a single df and return.
+    Downloads all of the zip archives listed in the urls configuraiton, reads
+    the `RESEARCHER_FILE` in each one and concats them into a single df.
+
+    The archives are downloaded at the same time (local paths are read in
+    place) and only the researcher files are read out of them, nothing is
+    extracted. Each file (one test year) is parsed in its own process.
+    The data is saved as a feather file, as a csv and as Parquet files
+    partitioned by `ay` in the `nysed-exams` folder, e.g.
+    `pd.read_parquet(path, filters=[("ay", "==", 2018)])`.
+
+    Parameters
+    ----------
+    urls : list
+        the URLs or local paths of the .zip archives
+    workers : int, optional
+        the number of processes that parse the files, by default one per core
+
+    Returns
+    -------
+    DataFrame
     """
     tmp = os.path.join(config.data_dir, "tmp")
-    if not os.path.exists(tmp):
-        os.mkdir(tmp)
-
-    # download and extract all of the .zip files from NYSED data portal
-    for url in urls:
-        download_and_extract(url, tmp)
-
-    # delete all of the files we don't care about from the temp dir
-    # and parse all of the ones we _do_ care about
-    files = os.listdir(tmp)
-    data = []
-
-    for f in files:
-        if f.endswith("mdb") or "RESEARCHER_FILE" not in f or f.startswith("."):
-            os.remove(os.path.join(tmp, f))
+    os.makedirs(tmp, exist_ok=True)
+    try:
+        with ThreadPoolExecutor(max_workers=max(len(urls), 1)) as executor:
+            archives = list(executor.map(lambda url: fetch_archive(url, tmp), urls))
+        jobs = [(archive, member) for archive in archives for member in researcher_files(archive)]
+        workers = min(len(jobs), workers or os.cpu_count() or 1)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                data = list(executor.map(read_archive_member, jobs))
         else:
-            data.append(os.path.join(tmp, f))
+            data = [read_archive_member(job) for job in jobs]
+    finally:
+        # delete the temp folder
+        shutil.rmtree(tmp, ignore_errors=True)
 
-    df = pd.concat([read_nysed_exam(d) for d in data])
-    df = df.reset_index()
+    df = pd.concat(data, ignore_index=True)
 
     # save as csv for outside/generic use
     out = os.path.join(config.data_dir, "nysed-exams.csv")
     df.to_csv(out, index=False)
 
     # this is a big file, so save as feather for internal use
-    out = os.path.join(config.data_dir, urls["nysed_math_ela"].filename)
+    out = data_path("nysed_math_ela")
     df.to_feather(out)
-    # delete the temp folder
-    shutil.rmtree(tmp, ignore_errors=True)
+
+    # and one Parquet file per year
+    out = data_path("nysed_math_ela", "filename_parquet")
+    pq.write_to_dataset(pa.Table.from_pandas(df, preserve_index=False), out,
+                        partition_cols=["ay"], existing_data_behavior="delete_matching")
 
     return df
 
 
+def fetch_archive(url, tmp):
+    """Download a .zip archive into `tmp`, or return it if it is a local file."""
+    if os.path.exists(url):
+        return url
+    zippath = os.path.join(tmp, url.split("/")[-1])
+    return download_file(url, zippath)
+
+
+def researcher_files(archive):
+    """The names of the `RESEARCHER_FILE` data files in a .zip archive."""
+    with zipfile.ZipFile(archive) as z:
+        names = z.namelist()
+    return [n for n in names
+            if "RESEARCHER_FILE" in n and not n.endswith(("/", "mdb"))
+            and not os.path.basename(n).startswith(".") and "__MACOSX" not in n]
+
+
+def read_archive_member(job):
+    """Read and clean one data file in a .zip archive: `job` is (archive, member name)."""
+    archive, member = job
+    with zipfile.ZipFile(archive) as z, z.open(member) as f:
+        if member.lower().endswith(".csv"):
+            nysed = pd.read_csv(f, low_memory=False)
+        else:
+            nysed = pd.read_excel(io.BytesIO(f.read()), engine=excel_engine)
+    nysed = fix_cols(nysed)
+    return fix_data(nysed)
+
+
 def download_and_extract(url, tmp):
     """Download and extract the .zip archives from NYSED"""
     zippath = os.path.join(tmp, url.split("/")[-1])
@@ -160,6 +229,20 @@ def fix_cols(df):
 
 
 
+# NYSED student categories that are named differently in the NYC data
+cat_map = {
+    'English Language Learner': "Current ELL",
+    'Asian or Native Hawaiian/Other Pacific Islander': 'Asian',
+    'Hispanic or Latino': 'Hispanic',
+    'Black or African American': 'Black',
+    'Not Economically Disadvantaged': 'Not Econ Disadv',
+    'Economically Disadvantaged': 'Econ Disadv',
+    'Students with Disabilities': 'SWD',
+    'General Education Students': 'Not SWD',
+    'Non-English Language Learner': 'Never ELL'
+}
+
+
 def fix_data(df):
     """
     Cleans data in the dataframe so that row-level data is
@@ -167,33 +250,17 @@ def fix_data(df):
     - student categories are consistent
     - counts and percents are consistent
     - exam category is consistent
-    """
 
-    nysed = df.copy()
-    try: # this for excel
-        nysed.test_year = nysed.test_year.apply(lambda x: x.date().year)
-    except: # or this for csv
-        nysed.test_year = nysed.test_year.apply(lambda x: int(x.split("/")[-1]))
-
-    cat_map = {
-        'English Language Learner': "Current ELL",
-        'Asian or Native Hawaiian/Other Pacific Islander': 'Asian',
-        'Hispanic or Latino': 'Hispanic',
-        'Black or African American': 'Black',
-        'Not Economically Disadvantaged': 'Not Econ Disadv',
-        'Economically Disadvantaged': 'Econ Disadv',
-        'Students with Disabilities': 'SWD',
-        'General Education Students': 'Not SWD',
-        'Non-English Language Learner': 'Never ELL'
-    }
+    Every step works on whole columns; the text columns are parsed once
+    per distinct value (`parse_test_year()`, `parse_grade()`, `map_categories()`).
+    """
 
-    def map_cats(cat):
-        if cat in cat_map:
-            return cat_map[cat]
-        return cat
+    # only whole columns are replaced, so a shallow copy leaves `df` as it is
+    nysed = df.copy(deep=False)
+    nysed["test_year"] = parse_test_year(nysed.test_year)
 
     # rename the student demo categories to match NYC
-    nysed.category = nysed.category.apply(map_cats)
+    nysed["category"] = map_categories(nysed.category)
 
     # rename the exams to match NYC
     nysed.exam = nysed.exam.map({"ELA":"ela","Mathematics":"math"})
@@ -206,46 +273,59 @@ def fix_data(df):
         if c in nysed:
             count_cols.append(c)
     for col in count_cols:
-
-        nysed[col] = pd.to_numeric(nysed[col], errors='coerce')
-        nysed[col] = nysed[col].fillna(0)
-        nysed[col] = nysed[col].astype(int)
+        nysed[col] = parse.number(nysed[col]).fillna(0).astype(int)
 
     nysed["ay"] = nysed.test_year - 1
     nysed["level_3_4_n"] = nysed.level_3_n + nysed.level_4_n
 
     # parse the grade leve string to just the grade int
-    nysed.grade = nysed.grade.apply(lambda x: int(x[6]))
+    nysed["grade"] = parse_grade(nysed.grade)
 
 
-    # convert percents from 0-100 to 0-1 to match other data
-    def fix_pct(x):
-        if not x or x == "" or x =="-" or x == 0:
-            return 0
-
-        if hasattr(x, "endswith") and x.endswith("%"):
-            x = x[:-1]
-
-        try:
-            x = float(x)
-            if 0 <= x <= 1:
-                return x
-            x /= 100
-            return x
-        except:
-            print("couldn't fix", x)
-            return x
-
+    # convert percents from 0-100 to 0-1 to match other data, '-' is 0
     pct_cols = [c for c in nysed.columns if c.endswith("pct")]
     for c in pct_cols:
-        nysed[c] = nysed[c].apply(fix_pct)
-        # nysed[c] = nysed[c].astype("float")
+        nysed[c] = parse.pct(nysed[c], scale="gt1", errors="coerce")
 
-    nysed["mean_scale_score"] = pd.to_numeric(nysed["mean_scale_score"], downcast='integer', errors='coerce')
+    nysed["mean_scale_score"] = parse.number(nysed["mean_scale_score"], downcast='integer')
 
     return nysed
 
 
+def parse_test_year(dates):
+    """The year of the test dates: Excel dates or "06/30/2019" strings from a csv."""
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates.dt.year
+    codes, uniques = pd.factorize(dates)
+    uniques = pd.Series(uniques, dtype=object)
+    if len(uniques) and hasattr(uniques[0], "year"):
+        years = uniques.map(lambda x: x.date().year)
+    else:
+        years = uniques.str.split("/").str[-1].astype(int)
+    return pd.Series(years.to_numpy()[codes], index=dates.index).where(codes >= 0)
+
+
+def parse_grade(grades):
+    """The grade number of "Grade 3 ELA" style grade names."""
+    codes, uniques = pd.factorize(grades)
+    numbers = pd.Series(uniques, dtype=object).str[6].astype(int).to_numpy()
+    out = numbers[codes]
+    if (codes < 0).any():
+        # a missing grade is NaN, not the last grade
+        out = out.astype(float)
+        out[codes < 0] = np.nan
+    return pd.Series(out, index=grades.index)
+
+
+def map_categories(categories):
+    """Rename the NYSED student categories to the NYC names in `cat_map`."""
+    codes, uniques = pd.factorize(categories)
+    names = pd.Series(uniques, dtype=object).map(lambda x: cat_map.get(x, x)).to_numpy(dtype=object)
+    out = names[codes]
+    out[codes < 0] = np.nan
+    return pd.Series(out, index=categories.index, name=categories.name)
+
+
 def read_nysed_exam(filename):
     """
     Read the Excel file that has all test scores for all schools and districts
@@ -287,51 +367,36 @@ def calc_all_grades(nysed):
     """
     NYSED data doesn't include All Grades like NYC schools, so this function
     adds an "All Grades" category with aggregate data for each school.
-    """
 
-    # add all students category to nysed
-    def all_grades_for_school(row):
-        """For each school, calculate the aggregate result for all grades"""
-        qry = f"beds == '{row.beds}' and ay == {row.ay} and category == '{row.category}' and exam=='{row.exam}'"
-        data = nysed.query(qry)
-
-        mean_scale_score = np.average(data.mean_scale_score, weights=data.total_enrollment)
-        num_tested = data.number_tested.sum()
-        levels = ["1","2","3","4","3_4"]
-        if num_tested == 0:
-            levels_n = [0] * len(levels)
-            levels_pct = [0] * len(levels)
-        else:
-            levels_n = [data[f"level_{i}_n"].sum() for i in levels]
-            levels_pct = [n / num_tested for n in levels_n ]
-        result = {
-              'ay': row.ay,
-              'exam': row.exam,
-              'grade': "All Grades",
-              'category': row.category,
-              'test_year': data.test_year.max(),
-              'mean_scale_score': mean_scale_score,
-              'number_tested': num_tested,
-              'number_not_tested': data.number_not_tested.sum(),
-              'level_1_n': levels_n[0],
-              'level_1_pct': levels_pct[0],
-              'level_2_n': levels_n[1],
-              'level_2_pct': levels_pct[1],
-              'level_3_n': levels_n[2],
-              'level_3_pct': levels_pct[2],
-              'level_4_n': levels_n[3],
-              'level_4_pct': levels_pct[3],
-              'level_3_4_n': levels_n[4],
-              'level_3_4_pct': levels_pct[2],
-              'beds': data.beds.max()
-        }
-        rows.append(result)
-
-    rows = []
-    cols = ["beds","ay","exam","category","test_year"]
-    t = nysed[cols]
-
-    t = t.drop_duplicates()
-    t.apply(all_grades_for_school, axis=1)
-
-    return pd.DataFrame(rows)
+    The grades are summed in one groupby on `beds`, `ay`, `exam` and
+    `category`. `mean_scale_score` is the mean weighted by `number_tested`
+    over the grades that have a score, and the level percents are the summed
+    counts over `number_tested` (0 if no one was tested).
+    """
+    keys = ["beds", "ay", "exam", "category"]
+    levels = ["1", "2", "3", "4", "3_4"]
+    counts = ["number_tested", "number_not_tested"] + [f"level_{i}_n" for i in levels]
+
+    tested = nysed.number_tested.astype("float64")
+    score = nysed.mean_scale_score.astype("float64")
+    sums = nysed[keys + ["test_year"] + counts].assign(
+        score_sum=score * tested,
+        score_tested=tested.where(score.notna()),
+    )
+    group = sums.groupby(keys, observed=True, sort=True)
+    result = group[counts + ["score_sum", "score_tested"]].sum(min_count=1)
+    result["test_year"] = group.test_year.max()
+    result = result.reset_index()
+
+    num_tested = result.number_tested.fillna(0)
+    for col in counts:
+        result[col] = result[col].fillna(0).astype(nysed[col].dtype)
+    for i in levels:
+        result[f"level_{i}_pct"] = (result[f"level_{i}_n"] / num_tested).where(num_tested > 0, 0)
+    result["mean_scale_score"] = result.score_sum / result.score_tested
+    result["grade"] = "All Grades"
+
+    cols = ['ay', 'exam', 'grade', 'category', 'test_year', 'mean_scale_score',
+            'number_tested', 'number_not_tested'] + \
+           [f"level_{i}_{x}" for i in levels for x in ["n", "pct"]] + ['beds']
+    return result[cols]
@@ -0,0 +1,429 @@
+# NYC School Data
+# Copyright (C) 2022-2023. Matthew X. Curinga
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU AFFERO GENERAL PUBLIC LICENSE (the "License") as
+# published by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the License for more details.
+#
+# You should have received a copy of the License along with this program.
+# If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+"""
+School-by-year panel data for longitudinal analysis.
+
+A `SchoolPanel` holds the numeric columns of a long school data frame (one
+row per `dbn` and `ay`) as a dense school x year x measure NumPy array, so
+looking up a school and year is a dict lookup instead of a scan of the frame.
+
+Examples:
+----------
+from nycschools import panel
+from nycschools.panel import SchoolPanel
+
+demo = SchoolPanel()
+demo["01M015", 2022, "total_enrollment"]
+demo.wide("total_enrollment")    # schools x years
+demo.delta().to_frame()           # year-over-year changes, long format
+
+# or the cached change tables for a whole dataset
+changes = panel.load_changes("demographics", periods=(1, 5))
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import dataloader, exams, schools
+from .tools import suppress_warnings
+
+# numeric columns that describe the school rather than measure it
+id_cols = ["ay", "beds", "district", "geo_district", "zip", "charter"]
+
+
+class SchoolPanel():
+    """School data stored as a dense (school x year x measure) array.
+
+    Years run from the first to the last `ay` without gaps, so a year with
+    no data for a school is a row of NaN and year `ay` of school `dbn` is
+    `values[dbn_index[dbn], ay - first_year]`.
+
+    Attributes
+    ----------
+    values : ndarray
+        float64 array of shape (schools, years, measures)
+    dbns : ndarray
+        the dbn of each school, sorted
+    years : ndarray
+        the academic years, consecutive
+    measures : list
+        the measure (column) names
+    dbn_index : dict
+        dbn -> position in `dbns`
+    measure_index : dict
+        measure -> position in `measures`
+    """
+
+    def __init__(self, df=None, measures=None):
+        """
+        Parameters
+        ----------
+        df : DataFrame, optional
+            long school data with `dbn` and `ay` columns and at most one row
+            per school and year, by default `load_school_demographics()`
+        measures : list, optional
+            the numeric columns to put in the array, by default all of the
+            numeric columns that aren't in `id_cols`. The other columns are
+            kept as they are for `to_frame()`.
+        """
+        if df is None:
+            df = schools.load_school_demographics()
+        if measures is None:
+            measures = [c for c in df.columns if c not in id_cols and c != "dbn"
+                        and pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
+        if df.duplicated(["dbn", "ay"]).any():
+            raise ValueError("df has more than one row for some dbn and ay")
+
+        dbn_codes, dbns = pd.factorize(df["dbn"].astype(str), sort=True)
+        ay = df["ay"].to_numpy(dtype="int64")
+        first = ay.min() if len(ay) else 0
+        last = ay.max() if len(ay) else -1
+        years = np.arange(first, last + 1)
+
+        values = np.full((len(dbns), len(years), len(measures)), np.nan)
+        values[dbn_codes, ay - first] = df[measures].to_numpy(dtype="float64", na_value=np.nan)
+
+        self.__set(values, np.asarray(dbns, dtype=object), years, list(measures),
+                   dbn_codes, ay - first, df.drop(columns=measures).reset_index(drop=True),
+                   {m: df[m].dtype for m in measures}, list(df.columns))
+
+    def __set(self, values, dbns, years, measures, rows, cols, other, dtypes, columns):
+        self.values = values
+        self.dbns = dbns
+        self.years = years
+        self.measures = measures
+        self.dbn_index = {dbn: i for i, dbn in enumerate(dbns)}
+        self.measure_index = {m: k for k, m in enumerate(measures)}
+        # the school and year of each row of the source frame, and its other columns
+        self.__rows = rows
+        self.__cols = cols
+        self.__other = other
+        self.__dtypes = dtypes
+        self.__columns = columns
+
+    def __derived(self, values, dtypes=None, measures=None):
+        """A new panel for the same schools and years with new `values`."""
+        panel = object.__new__(SchoolPanel)
+        measures = self.measures if measures is None else measures
+        panel.__set(values, self.dbns, self.years, measures, self.__rows, self.__cols, self.__other,
+                    dtypes or {m: np.dtype("float64") for m in measures}, self.__columns)
+        return panel
+
+    def __len__(self):
+        return len(self.dbns)
+
+    def __repr__(self):
+        years = f"{self.years[0]}-{self.years[-1]}" if len(self.years) else "no years"
+        return f"<SchoolPanel: {len(self.dbns)} schools, {years}, {len(self.measures)} measures>"
+
+    def year_index(self, ay):
+        """The position of academic year `ay` on the year axis."""
+        j = int(ay) - int(self.years[0]) if len(self.years) else -1
+        if j < 0 or j >= len(self.years):
+            raise KeyError(ay)
+        return j
+
+    def __getitem__(self, key):
+        """`panel[dbn]` is a years x measures DataFrame, `panel[dbn, ay]` a Series
+        of the measures and `panel[dbn, ay, measure]` a single value."""
+        if not isinstance(key, tuple):
+            key = (key,)
+        i = self.dbn_index[key[0]]
+        if len(key) == 1:
+            return pd.DataFrame(self.values[i], index=pd.Index(self.years, name="ay"), columns=self.measures)
+        j = self.year_index(key[1])
+        if len(key) == 2:
+            return pd.Series(self.values[i, j], index=self.measures, name=(key[0], key[1]))
+        return self.values[i, j, self.measure_index[key[2]]]
+
+    def select(self, dbns=None, years=None, measures=None):
+        """A panel with only some of the schools, years and measures.
+
+        Parameters
+        ----------
+        dbns : list, optional
+            the schools to keep, in this order
+        years : list, optional
+            consecutive academic years to keep, e.g. `range(2018, 2023)`
+        measures : list, optional
+            the measures to keep, in this order
+
+        Returns
+        -------
+        SchoolPanel
+        """
+        i = np.arange(len(self.dbns)) if dbns is None else np.array([self.dbn_index[d] for d in dbns], dtype="int64")
+        j = np.arange(len(self.years)) if years is None else np.array([self.year_index(y) for y in years], dtype="int64")
+        if len(j) > 1 and (np.diff(j) != 1).any():
+            raise ValueError("years must be consecutive")
+        measures = self.measures if measures is None else list(measures)
+        k = [self.measure_index[m] for m in measures]
+
+        # line the source rows up with the selected schools and years
+        school_pos = np.full(len(self.dbns), -1)
+        school_pos[i] = np.arange(len(i))
+        year_pos = np.full(len(self.years), -1)
+        year_pos[j] = np.arange(len(j))
+        keep = (school_pos[self.__rows] >= 0) & (year_pos[self.__cols] >= 0)
+        dropped = [m for m in self.measures if m not in measures]
+        columns = [c for c in self.__columns if c not in dropped]
+
+        panel = object.__new__(SchoolPanel)
+        panel.__set(self.values[np.ix_(i, j, k)], self.dbns[i], self.years[j], measures,
+                    school_pos[self.__rows[keep]], year_pos[self.__cols[keep]],
+                    self.__other[keep].reset_index(drop=True),
+                    {m: self.__dtypes[m] for m in measures}, columns)
+        return panel
+
+    def wide(self, measure):
+        """One measure as a schools x years DataFrame."""
+        return pd.DataFrame(self.values[:, :, self.measure_index[measure]],
+                            index=pd.Index(self.dbns, name="dbn"),
+                            columns=pd.Index(self.years, name="ay"))
+
+    def shift(self, periods=1):
+        """The values of `periods` years earlier (later if negative), NaN
+        where there is no such year."""
+        shifted = np.full_like(self.values, np.nan)
+        if periods >= 0:
+            shifted[:, periods:] = self.values[:, :len(self.years) - periods]
+        else:
+            shifted[:, :periods] = self.values[:, -periods:]
+        return self.__derived(shifted)
+
+    def delta(self, periods=1):
+        """The change in every measure since `periods` years earlier."""
+        return self.__derived(self.values - self.shift(periods).values)
+
+    def pct_change(self, periods=1):
+        """The relative change in every measure since `periods` years
+        earlier, e.g. .1 for a 10% increase. NaN where the earlier value is 0."""
+        before = self.shift(periods).values
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = np.where(before != 0, (self.values - before) / before, np.nan)
+        return self.__derived(change)
+
+    # the std of a window with one year is NaN
+    @suppress_warnings()
+    def rolling(self, window, func="mean", min_periods=None):
+        """A rolling statistic over the `window` years up to and including each year.
+
+        Parameters
+        ----------
+        window : int
+            the number of years in each window
+        func : str
+            "mean", "sum", "min", "max", "median" or "std" (sample, like pandas),
+            ignoring missing years
+        min_periods : int, optional
+            the fewest years with data a window needs, by default `window`
+
+        Returns
+        -------
+        SchoolPanel
+        """
+        funcs = {"mean": np.nanmean, "sum": np.nansum, "min": np.nanmin, "max": np.nanmax,
+                 "median": np.nanmedian, "std": lambda a, axis: np.nanstd(a, axis=axis, ddof=1)}
+        if func not in funcs:
+            raise ValueError(f"unknown rolling function: {func}")
+        min_periods = window if min_periods is None else min_periods
+        padded = np.concatenate(
+            [np.full((len(self.dbns), window - 1, len(self.measures)), np.nan), self.values], axis=1)
+        windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=1)
+        count = (~np.isnan(windows)).sum(axis=-1)
+        result = np.full_like(self.values, np.nan)
+        enough = count >= max(min_periods, 1)
+        if enough.any():
+            result[enough] = funcs[func](windows[enough], axis=-1)
+        return self.__derived(result)
+
+    def to_frame(self, dropna=False):
+        """Converts the panel back to a long DataFrame with one row for each
+        row of the source frame, in the same order and with the same columns.
+
+        Measures keep their original dtype when they have no missing values.
+
+        Parameters
+        ----------
+        dropna : bool, default False
+            drop rows where every measure is NaN (e.g. the first year of a `delta()`)
+
+        Returns
+        -------
+        DataFrame
+        """
+        df = self.__other.copy()
+        measures = self.values[self.__rows, self.__cols]
+        for k, m in enumerate(self.measures):
+            col = measures[:, k]
+            dtype = self.__dtypes[m]
+            if np.isnan(col).any() and not pd.api.types.is_float_dtype(dtype):
+                dtype = "float64"
+            df[m] = pd.Series(col).astype(dtype)
+        df = df[[c for c in self.__columns if c in df.columns]]
+        if dropna and len(self.measures):
+            df = df[~np.isnan(measures).all(axis=1)].reset_index(drop=True)
+        return df
+
+
+# ==============================================================================
+# change tables
+
+# what to compute changes for in each dataset: how to load it, the columns
+# that identify a row (with `ay`) and the columns to compare
+change_specs = {
+    "demographics": {
+        "load": lambda columns=None, filters=None, cache=True: schools.load_school_demographics(columns, filters, cache),
+        "keys": ["dbn"],
+        "cols": ["total_enrollment"] + [c for c in schools.demo.default_cols if c.endswith(("_n", "_pct"))],
+    },
+    "nyc_ela": {
+        "load": lambda columns=None, filters=None, cache=True: exams.load_ela(columns, filters, cache),
+        "keys": ["dbn", "grade", "category"],
+        "cols": ["number_tested", "mean_scale_score", "level_3_4_n", "level_3_4_pct"],
+    },
+    "nyc_math": {
+        "load": lambda columns=None, filters=None, cache=True: exams.load_math(columns, filters, cache),
+        "keys": ["dbn", "grade", "category"],
+        "cols": ["number_tested", "mean_scale_score", "level_3_4_n", "level_3_4_pct"],
+    },
+}
+
+
+def change_table(df, cols, keys=["dbn"], periods=(1,)):
+    """The change in `cols` since 1 or more years earlier, for each row.
+
+    The frame is sorted by `keys` and `ay` once and each row is compared to
+    the row of the same `keys` exactly `p` years earlier, so a missing year
+    gives NaN instead of the change since an older year.
+
+    Parameters
+    ----------
+    df : DataFrame
+        long data with `keys`, `ay` and `cols`
+    cols : list
+        the numeric columns to compare
+    keys : list
+        the columns that identify a series over the years, e.g. `["dbn"]`
+        or `["dbn", "grade", "category"]`
+    periods : tuple
+        the number of years to look back, e.g. `(1, 5)`
+
+    Returns
+    -------
+    DataFrame
+        `keys`, `ay` and a `{col}_change_{p}y` column for each column and period,
+        sorted by `keys` and `ay`
+
+    Raises
+    ------
+    ValueError
+        if `df` has more than one row for some `keys` and `ay`
+    """
+    keys = list(keys)
+    dups = df.duplicated(keys + ["ay"], keep=False)
+    if dups.any():
+        sample = df.loc[dups, keys + ["ay"]].drop_duplicates().head(5).to_dict("records")
+        raise ValueError(f"df has more than one row for some {keys + ['ay']}, e.g. {sample}")
+    df = df[keys + ["ay"] + list(cols)].sort_values(keys + ["ay"], kind="stable").reset_index(drop=True)
+    group = df.groupby(keys, sort=False, observed=True, dropna=False).ngroup().to_numpy()
+    ay = df["ay"].to_numpy(dtype="int64")
+    values = df[list(cols)].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    rows = np.arange(len(df))
+
+    changes = {}
+    for p in periods:
+        # with one row per year, the row p years back is at most p rows back
+        prev = np.full(len(df), -1)
+        for k in range(min(p, len(df)), 0, -1):
+            back = np.maximum(rows - k, 0)
+            found = (rows >= k) & (group[back] == group) & (ay[back] == ay - p)
+            prev = np.where(found, back, prev)
+        changed = np.full(values.shape, np.nan)
+        has = prev >= 0
+        changed[has] = values[has] - values[prev[has]]
+        for c, col in enumerate(cols):
+            changes[f"{col}_change_{p}y"] = changed[:, c]
+
+    names = [f"{col}_change_{p}y" for col in cols for p in periods]
+    return pd.concat([df[keys + ["ay"]], pd.DataFrame({n: changes[n] for n in names})], axis=1)
+
+
+def __spec(name):
+    if name not in change_specs:
+        raise ValueError(f"No change table for {name}, use one of {list(change_specs)}")
+    return change_specs[name]
+
+
+def load_changes(name="demographics", periods=(1,), refresh=False):
+    """Year-over-year and N-year change tables for `"demographics"` (enrollment
+    and every `_n` and `_pct` column) or the `"nyc_ela"` and `"nyc_math"`
+    exams (tested, mean scale score and proficiency by grade and category).
+
+    The table is saved in `data_dir/_cache` and reused until the data file
+    changes. See `change_table()` for the columns.
+
+    Parameters
+    ----------
+    name : str
+        the dataset, a key of `change_specs`
+    periods : tuple
+        the number of years to look back, e.g. `(1, 5)`
+    refresh : bool, default False
+        rebuild the table even if it is cached
+
+    Returns
+    -------
+    DataFrame
+    """
+    spec = __spec(name)
+    periods = tuple(periods)
+    source = dataloader.data_path(name)
+    path = None
+    if os.path.exists(source):
+        stat = os.stat(source)
+        prefix = f"{os.path.basename(source)}.changes-{'-'.join(map(str, periods))}."
+        path = os.path.join(os.path.dirname(source), dataloader.sidecar_dir,
+                            f"{prefix}{stat.st_size}-{stat.st_mtime_ns}.parquet")
+        if os.path.exists(path) and not refresh:
+            return pd.read_parquet(path)
+
+    df = spec["load"]()
+    table = change_table(df, [c for c in spec["cols"] if c in df.columns], spec["keys"], periods)
+    if path:
+        dataloader.write_cached(table, path, prefix)
+    return table
+
+
+def iter_changes(name="demographics", periods=(1,)):
+    """Builds the `load_changes()` table one district at a time to bound
+    memory: only the rows of one district's schools are loaded at once
+    (with a `dbn` filter, which Parquet data files push down to the reader).
+    The district frames are not kept in the `dataloader` cache.
+
+    Yields
+    ------
+    (int, DataFrame)
+        the district number (from the dbn) and its change table
+    """
+    spec = __spec(name)
+    dbns = pd.Series(spec["load"](columns=["dbn"], cache=False).dbn.astype(str).unique())
+    district = dbns.str[:2]
+    for d, in_district in sorted(dbns.groupby(district).groups.items()):
+        df = spec["load"](filters=[("dbn", "in", dbns[in_district].tolist())], cache=False)
+        cols = [c for c in spec["cols"] if c in df.columns]
+        yield int(d) if d.isdigit() else d, change_table(df, cols, spec["keys"], periods)
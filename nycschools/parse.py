@@ -0,0 +1,221 @@
+# NYC School Data
+# Copyright (C) 2022-2023. Matthew X. Curinga
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU AFFERO GENERAL PUBLIC LICENSE (the "License") as
+# published by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the License for more details.
+#
+# You should have received a copy of the License along with this program.
+# If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+"""
+Parsers that turn whole columns of suppressed or censored values, like
+`'84.33%'`, `'Above 95%'`, `'Below 5%'`, `'No Data'` or `'0-5'`, into numbers.
+
+The published data mixes numbers and strings in the same column. Each parser
+factorizes the column, parses every *distinct* value once, and then builds the
+result for all rows with array operations, so the cost grows with the number
+of distinct values rather than the number of rows.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# suppressed values are imputed as 96% / 4% of the population
+above = .96
+below = .04
+
+# kinds of values
+__number, __percent, __above, __below, __zero, __fewer, __bad = range(7)
+
+__zero_values = {"No Data", "-", ""}
+__range = re.compile(r"^\s*(\d+)\s*-\s*(\d+)\s*$")
+
+
+def __classify(v):
+    """Returns the kind and numeric value of a single distinct value."""
+    if not isinstance(v, str):
+        return __number, float(v)
+    kind = __number
+    if v.endswith("%"):
+        kind, v = __percent, v[:-1]
+    if "Above" in v:
+        return __above, np.nan
+    if "Below" in v:
+        return __below, np.nan
+    if v in __zero_values:
+        return __zero, 0.0
+    if "fewer than 5" in v:
+        return __fewer, np.nan
+    try:
+        return kind, float(v)
+    except ValueError:
+        return __bad, np.nan
+
+
+def pct(values, n=None, scale="ge1", missing=np.nan, errors="raise"):
+    """Converts a Series of percentages to reals between 0 and 1.
+
+    Parameters
+    ----------
+    values : Series
+        percentages as numbers (`.8433` or `84.33`) or strings like `'84.33%'`,
+        `'Above 95%'`, `'Below 5%'`, `'No Data'`, `'-'` or `'fewer than 5'`
+    n : Series, optional
+        the population (e.g. `total_enrollment`) for each row. `'Above'` and
+        `'Below'` values are imputed as `n * .96 / n` and `n * .04 / n`;
+        without `n` they are `.96` and `.04`.
+    scale : str
+        which numbers are on a 0..100 scale and get divided by 100:
+        `"ge1"` numbers >= 1 (the `%` sign is ignored),
+        `"gt1"` numbers outside 0..1 (the `%` sign is ignored),
+        `"sign"` only values written with a `%` sign
+    missing : float
+        the value for missing (NaN) entries
+    errors : str
+        `"raise"` to raise a ValueError for values that can't be parsed,
+        `"coerce"` to make them NaN
+
+    Returns
+    -------
+    Series
+        float64 values with the same index as `values`
+
+    Notes
+    -----
+    `'No Data'`, `'-'` and `''` become 0, `'fewer than 5'` becomes .01.
+    """
+    if pd.api.types.is_float_dtype(values) or pd.api.types.is_integer_dtype(values):
+        kinds = np.where(values.isna(), -1, __number)
+        numbers = values.to_numpy(dtype="float64")
+    else:
+        kinds, numbers = __parse(values, errors)
+
+    whole = kinds == __percent
+    if scale == "ge1":
+        whole = (kinds == __number) | whole
+        whole &= numbers >= 1
+    elif scale == "gt1":
+        whole = (kinds == __number) | whole
+        whole &= (numbers < 0) | (numbers > 1)
+    elif scale != "sign":
+        raise ValueError(f"unknown scale: {scale}")
+    numbers = np.where(whole, numbers / 100, numbers)
+
+    if n is None:
+        imputed_above, imputed_below = above, below
+    else:
+        n = np.asarray(n, dtype="float64")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            imputed_above, imputed_below = n * above / n, n * below / n
+
+    result = np.select(
+        [kinds == -1, kinds == __above, kinds == __below, kinds == __fewer],
+        [missing, imputed_above, imputed_below, .01],
+        numbers)
+    return pd.Series(result, index=values.index, name=values.name)
+
+
+def count(values, n=None):
+    """Converts a Series of counts to integers.
+
+    Parameters
+    ----------
+    values : Series
+        counts as numbers or strings like `'246'`, `'Above 95%'`, `'Below 5%'`,
+        or a suppressed range like `'0-5'`
+    n : Series, optional
+        the population for each row. `'Above'` is imputed as `ceil(n * .96)` and
+        `'Below'` as `floor(n * .04)`; without `n` they are NaN.
+
+    Returns
+    -------
+    Series
+        int64 values with the same index as `values`, or float64 with NaN
+        where a value is missing or can't be parsed.
+
+    Notes
+    -----
+    Ranges are imputed as their midpoint rounded down, so `'0-5'` is 2.
+    Numbers are truncated like `int()`; strings must be whole numbers.
+    """
+    if pd.api.types.is_integer_dtype(values) and not values.isna().any():
+        return values.astype("int64")
+
+    codes, uniques = pd.factorize(values)
+    numbers = np.full(len(uniques), np.nan)
+    kinds = np.full(len(uniques), __number, dtype="int8")
+    for i, v in enumerate(uniques):
+        try:
+            numbers[i] = int(v)
+            continue
+        except (ValueError, TypeError, OverflowError):
+            pass
+        if not isinstance(v, str):
+            kinds[i] = __bad
+        elif "Above" in v:
+            kinds[i] = __above
+        elif "Below" in v:
+            kinds[i] = __below
+        elif m := __range.match(v):
+            numbers[i] = (int(m.group(1)) + int(m.group(2))) // 2
+        else:
+            kinds[i] = __bad
+
+    kinds = np.where(codes < 0, __bad, kinds[codes])
+    numbers = numbers[codes]
+    if n is None:
+        n = np.full(len(values), np.nan)
+    else:
+        n = np.asarray(n, dtype="float64")
+    result = np.select([kinds == __above, kinds == __below, kinds == __bad],
+                       [np.ceil(n * above), np.floor(n * below), np.nan],
+                       numbers)
+    if np.isnan(result).any():
+        return pd.Series(result, index=values.index, name=values.name)
+    return pd.Series(result.astype("int64"), index=values.index, name=values.name)
+
+
+def number(values, downcast=None):
+    """`pd.to_numeric(values, errors="coerce", downcast=downcast)` that
+    converts each distinct value once.
+
+    Parameters
+    ----------
+    values : Series
+        numbers or strings like `'246'`; anything else, e.g. `'-'`, is NaN
+    downcast : str, optional
+        passed to `pd.to_numeric`, e.g. `"integer"`
+
+    Returns
+    -------
+    Series
+        the numbers with the same index as `values`
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return pd.to_numeric(values, errors="coerce", downcast=downcast)
+    codes, uniques = pd.factorize(values)
+    numbers = pd.to_numeric(pd.Series(uniques, dtype=object), errors="coerce", downcast=downcast).to_numpy()
+    if (codes < 0).any():
+        # codes of -1 (missing) pick the NaN at the end
+        numbers = np.append(numbers.astype("float64"), np.nan)
+    return pd.Series(numbers[codes], index=values.index, name=values.name)
+
+
+def __parse(values, errors):
+    """Parses the distinct values of `values` and lines them up with the rows."""
+    codes, uniques = pd.factorize(values)
+    parsed = [__classify(v) for v in uniques]
+    kinds = np.array([k for k, _ in parsed] + [-1], dtype="int8")
+    numbers = np.array([x for _, x in parsed] + [np.nan], dtype="float64")
+    if errors == "raise" and (kinds == __bad).any():
+        bad = uniques[np.flatnonzero(kinds == __bad)[0]]
+        raise ValueError(f"could not parse {values.name} value: {bad!r}")
+    # codes of -1 (missing) pick the last entry
+    return kinds[codes], numbers[codes]
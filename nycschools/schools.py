@@ -15,19 +15,24 @@
 # ==============================================================================
 import os.path
 import math
+import functools
 import numpy as np
 import re
+from collections import namedtuple, defaultdict
 
 import pandas as pd
-from thefuzz import fuzz
 
-from . import geo
-from . import config
+from . import config, parse, dataloader
+from .tools import lazy_import
 
-from nycschools.dataloader import load
+from nycschools.dataloader import load, data_path
 
+geo = lazy_import("nycschools.geo")
+fuzz = lazy_import("thefuzz.fuzz")
+fuzz_utils = lazy_import("thefuzz.utils")
+rf_fuzz = lazy_import("rapidfuzz.fuzz")
+rf_process = lazy_import("rapidfuzz.process")
 
-__demo_filename = os.path.join(config.data_dir, config.urls["demographics"].filename)
 
 class demo():
     """The `demo` class bundles some common sets of column names
@@ -238,35 +243,76 @@ def school_type(school):
     return "NA"
 
 
+__school_num = re.compile(r"\b([m|p|i]s [0-9]*)")
+__boro_names = {"bronx", "brooklyn", "manhattan", "queens", "staten island"}
+
+
+def __int_word(word):
+    try:
+        return str(int(word))
+    except ValueError:
+        return word
+
+
+@functools.lru_cache(maxsize=65536)
 def clean_name(sn):
     """Creates a simplified school name that is easier to search/index
 
+    Results are cached, so repeated names are only cleaned once.
+    Use `clean_names()` for a whole Series.
     """
     sn = sn.lower()
     sn = sn.strip()
     sn = sn.replace(".", "")
-    clean = []
-    for word in sn.split(" "):
-        try:
-            n = int(word)
-            clean.append(str(n))
-        except:
-            clean.append(word)
-
-    sn = " ".join(clean)
+    sn = " ".join(__int_word(word) for word in sn.split(" "))
 
     # ms, is, ps followed by a number
-    p = re.compile(r"\b([m|p|i]s [0-9]*)")
-    m = p.search(sn)
+    m = __school_num.search(sn)
     if m:
         sn = sn.replace(m.group(0), "")
     sn = sn.strip()
     # if the only thing left is the boro, short name will be school num + boro
-    if sn in ["bronx", "brooklyn", "manhattan", "queens", "staten island"]:
+    if m and sn in __boro_names:
         sn = f"{m.group(0)} {sn}"
     return sn
 
 
+def clean_names(names):
+    """The `clean_name()` of every name in a Series, computed with `.str`
+    methods over the distinct names.
+
+    Parameters
+    ----------
+    names : Series
+        school names; missing values stay missing
+
+    Returns
+    -------
+    Series
+        the clean names with the same index as `names`
+    """
+    codes, uniques = pd.factorize(names)
+    # object dtype so the .str methods use python's lower() / strip() / re
+    sn = pd.Series(uniques, dtype=object).str.lower().str.strip().str.replace(".", "", regex=False)
+
+    # words of plain digits lose their leading zeros; any other word with
+    # a digit ("+5", "1_000") goes through int() like clean_name() does
+    sn = sn.str.replace(r"(?<![^ ])0+(?=[0-9]+(?![^ ]))", "", regex=True)
+    odd = sn.str.contains(r"(?:^| )(?=[^ ]*\d)(?![0-9]+(?: |$))", regex=True)
+    sn[odd] = [" ".join(__int_word(w) for w in v.split(" ")) for v in sn[odd]]
+
+    # every copy of the first "ps 15" is removed
+    m = sn.str.extract(__school_num, expand=False)
+    found = m.notna().to_numpy()
+    sn[found] = [v.replace(g, "") for v, g in zip(sn[found], m[found])]
+    sn = sn.str.strip()
+    boro = found & sn.isin(__boro_names).to_numpy()
+    sn[boro] = m[boro] + " " + sn[boro]
+
+    result = sn.to_numpy(dtype=object)
+    return pd.Series(np.where(codes < 0, None, result[codes]), index=names.index, name=names.name)
+
+
 def short_name(row):
     """Attempts to guess the common "short name" for a school.
 For example, the full name might be "P.S. 015 Roberto Clemente".
@@ -282,96 +328,168 @@ This school is probably commonly referred to as PS 15."""
     return f"{row.school_num}"
 
 
+# vectorized versions of the row functions above, used to build the demographic data
+
+boros = {"K": "Brooklyn", "X": "Bronx", "M": "Manhattan", "Q": "Queens", "R": "Staten Island"}
+
+
+def map_unique(s, f):
+    """Calls `f` once for each distinct value in the Series `s` (instead of
+    once per row) and returns the results lined up with `s`."""
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    return pd.Series(pd.Series([f(v) for v in uniques]).to_numpy()[codes], index=s.index)
+
+
+def dbn_cols(df):
+    """Adds `district`, `boro` and `school_num` parsed from the `dbn` column.
+    The dbn looks like `01M015`: district 1, Manhattan, school number 15."""
+    df["district"] = map_unique(df["dbn"], lambda dbn: int(dbn[:2]))
+    df["boro"] = map_unique(df["dbn"], lambda dbn: boros[dbn[2]])
+    df["school_num"] = map_unique(df["dbn"], lambda dbn: int(dbn[3:]))
+    return df
+
+
+def name_cols(df):
+    """Adds `clean_name` and `short_name` (see `clean_name()` and `short_name()`)
+    for all rows."""
+    df["clean_name"] = clean_names(df["school_name"])
+
+    upper = df["school_name"].str.upper()
+    num = df["school_num"].astype(str)
+    df["short_name"] = np.select(
+        [upper.str.contains("P.S.", regex=False) | upper.str.contains("P. S.", regex=False),
+         upper.str.contains("M.S.", regex=False) | upper.str.contains("M. S.", regex=False),
+         upper.str.contains("I. S.", regex=False) | upper.str.contains("I.S.", regex=False)],
+        ["PS " + num, "MS " + num, "IS " + num],
+        num)
+    return df
+
+
+grade_cols = ["grade_3k", "grade_pk", "grade_k"] + [f"grade_{i}" for i in range(1, 13)]
+
+pk_grades = ("grade_pk", "grade_3k")
+elem_grades = ("grade_k", "grade_1", "grade_2", "grade_3", "grade_4", "grade_5")
+middle_grades = ("grade_6", "grade_7", "grade_8")
+high_grades = ("grade_9", "grade_10", "grade_11", "grade_12")
+
+
+def grades(first, last):
+    """The grade columns from `first` to `last`, e.g. `grades(6, 8)`."""
+    return tuple(grade_cols[grade_cols.index(f"grade_{first}"):grade_cols.index(f"grade_{last}") + 1])
+
+
+Rule = namedtuple("Rule", ["level", "all_of", "none_of", "zero", "any_of", "under_3"],
+                  defaults=[(), (), (), (), ()])
+Rule.__doc__ = """A school level rule. A school matches if it has students in every grade in
+`all_of`, no students in the grades in `none_of` (missing counts as none), a
+reported 0 (not missing) for the grades in `zero`, students in at least one grade
+of each group in `any_of`, and fewer than 3 students in total in the grades in `under_3`."""
+
+# The first rule that matches sets the school level, schools that match none are "other".
+school_level_rules = [
+    Rule("high", any_of=(high_grades,), under_3=elem_grades + middle_grades),
+    Rule("middle", any_of=(middle_grades,), under_3=elem_grades + high_grades),
+    Rule("elementary", any_of=(elem_grades,), under_3=middle_grades + high_grades),
+    Rule("prek", any_of=(pk_grades,), under_3=elem_grades + middle_grades + high_grades),
+    Rule("3-8", all_of=grades(3, 8), none_of=grades("k", 2) + high_grades),
+    Rule("4-8", all_of=grades(4, 8), none_of=grades("k", 3) + high_grades),
+    Rule("5-8", all_of=grades(5, 8), none_of=grades("k", 4) + high_grades),
+    Rule("8-12", all_of=grades(8, 12), none_of=grades("k", 7)),
+    Rule("5-12", all_of=grades(5, 12), none_of=grades("k", 4)),
+    Rule("6-12", all_of=grades(6, 12), none_of=elem_grades),
+    Rule("6-9", all_of=grades(6, 9), none_of=elem_grades, zero=grades(10, 12)),
+    Rule("7-12", all_of=grades(7, 12), none_of=grades("k", 6), zero=("grade_6",)),
+    Rule("K-6", all_of=("grade_k", "grade_3", "grade_5", "grade_6"), none_of=grades(7, 12)),
+    Rule("K-7", all_of=("grade_k", "grade_3", "grade_5", "grade_6", "grade_7"), none_of=high_grades,
+         zero=("grade_8",)),
+    Rule("K-8", all_of=("grade_k", "grade_3", "grade_5", "grade_6", "grade_7", "grade_8"), none_of=high_grades),
+    Rule("K-12", any_of=(elem_grades, middle_grades, high_grades)),
+]
+
+
+def grade_code(df):
+    """Encodes the grades a school serves as one integer per row. Each column in
+    `grade_cols` gets 3 bits that hold the number of students in that grade,
+    capped at 3 (0, 1, 2 or 3+), or 4 if the value is missing (NaN). That is
+    enough to evaluate `school_level_rules`. Grade columns that are not in `df`
+    count as 0 students.
+
+    Returns
+    -------
+    numpy.ndarray
+        int64 codes, one per row of `df`
+    """
+    code = np.zeros(len(df), dtype="int64")
+    for i, col in enumerate(grade_cols):
+        if col in df:
+            n = df[col].to_numpy(dtype="float64", na_value=np.nan)
+            n = np.where(np.isnan(n), 4, np.clip(np.ceil(np.nan_to_num(n)), 0, 3))
+            code |= n.astype("int64") << (3 * i)
+    return code
+
+
+def school_level(df, rules=school_level_rules):
+    """Classifies each row of `df` by the grades it has students in, e.g. "elementary",
+    "K-8", "6-12" (see `school_level_rules`). Works on any DataFrame with
+    grade columns (`grade_k`, `grade_1`, ...) and does not modify or copy it.
+
+    The rules are evaluated once for each distinct `grade_code()` and the
+    result is looked up for every row.
+
+    Parameters
+    ----------
+    df : DataFrame
+        school enrollment by grade
+    rules : list of Rule
+        the rules to apply in order of precedence
+
+    Returns
+    -------
+    Series
+        the school level for each row
+    """
+    codes, uniques = pd.factorize(grade_code(df))
+    counts = (uniques[:, None] >> (3 * np.arange(len(grade_cols)))) & 7
+    missing = counts == 4
+    counts[missing] = 0
+    col = {g: i for i, g in enumerate(grade_cols)}
+
+    def students(grades):
+        return counts[:, [col[g] for g in grades]]
+
+    levels = np.full(len(uniques), "other", dtype=object)
+    unmatched = np.ones(len(uniques), dtype=bool)
+    for rule in rules:
+        match = unmatched.copy()
+        if rule.all_of:
+            match &= (students(rule.all_of) > 0).all(axis=1)
+        if rule.none_of:
+            match &= (students(rule.none_of) == 0).all(axis=1)
+        if rule.zero:
+            match &= ((students(rule.zero) == 0) & ~missing[:, [col[g] for g in rule.zero]]).all(axis=1)
+        for group in rule.any_of:
+            match &= (students(group) > 0).any(axis=1)
+        if rule.under_3:
+            match &= students(rule.under_3).sum(axis=1) < 3
+        levels[match] = rule.level
+        unmatched &= ~match
+    return pd.Series(levels[codes], index=df.index, name="school_level")
+
 
 def set_school_level(data):
+    """Adds `school_type` (community, charter, d75 or transfer, based on the district)
+    and `school_level` (see `school_level()`) to a copy of `data`."""
     df = data.copy()
     if "grade_3k" not in df.columns:
         df["grade_3k"] = 0
 
-    df["school_type"] = None
-    df.loc[(df.district > 0) & (df.district < 33), "school_type"] = "community"
-    df.loc[df.district == 84, "school_type"] = "charter"
-    df.loc[df.district == 75, "school_type"] = "d75"
-    df.loc[df.district == 79, "school_type"] = "transfer"
-
-    pk = ["grade_pk", "grade_3k"]
-    elem = ["grade_k", "grade_1", "grade_2", "grade_3", "grade_4", "grade_5"]
-    middle = ["grade_6", "grade_7", "grade_8"]
-    high = ["grade_9", "grade_10", "grade_11", "grade_12"]
-
-    df["school_level"] = "other"
-
-    df.loc[(df[elem].sum(axis=1) > 0) & (df[middle].sum(axis=1) > 0)
-        & (df[high].sum(axis=1) > 0), "school_level"] = "K-12"
-
-    df.loc[(df.grade_k > 0) & (df.grade_3 > 0) & (df.grade_5 > 0)
-        & (df.grade_6 > 0) & (df.grade_7 > 0)
-        & (df.grade_8 > 0) & (df[high].sum(axis=1) == 0), "school_level"] = "K-8"
-
-    df.loc[(df.grade_k > 0) & (df.grade_3 > 0) & (df.grade_5 > 0)
-        & (df.grade_6 > 0) & (df.grade_7 > 0)
-        & (df.grade_8 == 0) & (df[high].sum(axis=1) == 0), "school_level"] = "K-7"
-
-    df.loc[(df.grade_k > 0) & (df.grade_3 > 0) & (df.grade_5 > 0) & (df.grade_6 > 0)
-        & (df[["grade_7", "grade_8"] + high].sum(axis=1) == 0), "school_level"] = "K-6"
-
-    df.loc[(df[["grade_6"] + elem].sum(axis=1) == 0)
-        & (df.grade_6 == 0) & (df.grade_7 > 0) & (df.grade_8 > 0)
-        & (df.grade_9 > 0) & (df.grade_10 > 0) & (df.grade_11 > 0) & (df.grade_12 > 0),
-        "school_level"] = "7-12"
-
-    df.loc[(df[elem].sum(axis=1) == 0)
-        & (df.grade_6 > 0) & (df.grade_7 > 0) & (df.grade_8 > 0)
-        & (df.grade_9 > 0) & (df.grade_10 == 0) & (df.grade_11 == 0) & (df.grade_12 == 0),
-        "school_level"] = "6-9"
-
-    df.loc[(df[elem].sum(axis=1) == 0)
-        & (df.grade_6 > 0) & (df.grade_7 > 0) & (df.grade_8 > 0)
-        & (df.grade_9 > 0) & (df.grade_10 > 0) & (df.grade_11 > 0) & (df.grade_12 > 0),
-        "school_level"] = "6-12"
-
-    df.loc[(df[elem[:-1]].sum(axis=1) == 0)
-        & (df.grade_5 > 0) & (df.grade_6 > 0) & (df.grade_7 > 0) & (df.grade_8 > 0)
-        & (df.grade_9 > 0) & (df.grade_10 > 0) & (df.grade_11 > 0) & (df.grade_12 > 0),
-        "school_level"] = "5-12"
-
-    df.loc[(df[elem + middle[:-1]].sum(axis=1) == 0)
-        & (df.grade_8 > 0)
-        & (df.grade_9 > 0) & (df.grade_10 > 0) & (df.grade_11 > 0) & (df.grade_12 > 0),
-        "school_level"] = "8-12"
-
-    df.loc[(df.grade_5 > 0)
-        & (df.grade_6 > 0)
-        & (df.grade_7 > 0)
-        & (df.grade_8 > 0)
-        & (df[elem[:-1] + high].sum(axis=1) == 0), "school_level"] = "5-8"
-
-    df.loc[(df.grade_4 > 0)
-        & (df.grade_5 > 0)
-        & (df.grade_6 > 0)
-        & (df.grade_7 > 0)
-        & (df.grade_8 > 0)
-        & (df[elem[:-2] + high].sum(axis=1) == 0), "school_level"] = "4-8"
-
-    df.loc[(df.grade_3 > 0)
-        & (df.grade_4 > 0)
-        & (df.grade_5 > 0)
-        & (df.grade_6 > 0)
-        & (df.grade_7 > 0)
-        & (df.grade_8 > 0)
-        & (df[elem[:-3] + high].sum(axis=1) == 0), "school_level"] = "3-8"
-
-
-    df.loc[(df[pk].sum(axis=1) > 0) & (
-        df[elem + middle + high].sum(axis=1) < 3), "school_level"] = "prek"
-
-    df.loc[(df[elem].sum(axis=1) > 0) & (
-        df[middle + high].sum(axis=1) < 3), "school_level"] = "elementary"
-    df.loc[(df[middle].sum(axis=1) > 0) & (
-        df[elem + high].sum(axis=1) < 3), "school_level"] = "middle"
-    df.loc[(df[high].sum(axis=1) > 0) & (
-        df[elem + middle].sum(axis=1) < 3), "school_level"] = "high"
-
+    district = df.district
+    school_type = np.select(
+        [district == 84, district == 75, district == 79, (district > 0) & (district < 33)],
+        ["charter", "d75", "transfer", "community"],
+        None)
+    df["school_type"] = pd.Series(school_type, index=df.index, dtype=object)
+    df["school_level"] = school_level(df)
     return df
 
 
@@ -396,7 +514,7 @@ def set_school_level(data):
 
 
 
-def load_school_demographics():
+def load_school_demographics(columns=None, filters=None, cache=True):
     """ Loads the NYC school-level demographic data from the
     open data portal and create a dataframe.
 
@@ -419,6 +537,17 @@ def load_school_demographics():
          geo_district: the geographic school district where the school is located
                        will differ for schools where district is > 32
 
+    Parameters
+    ----------
+    columns : list, optional
+        only load these columns, e.g. `schools.demo.core_cols`
+    filters : list, optional
+        only load rows that match these filters, e.g.
+        `[("ay", "==", 2022), ("district", "<", 33)]`.
+        See `dataloader.read_file()` for the filter format.
+    cache : bool, default True
+        keep the frame in the in-process `dataloader` cache
+
     Returns
     --------------
     DataFrame
@@ -429,9 +558,11 @@ def load_school_demographics():
 
     # try to load it locally to save time
     path = config.urls["demographics"].filename
-    df = load(path)
-    df.zip = df.zip.fillna(0).astype("int32")
-    df.beds = df.beds.fillna(0).astype("int64")
+    df = load(path, columns=columns, filters=filters, cache=cache)
+    if "zip" in df:
+        df.zip = df.zip.fillna(0).astype("int32")
+    if "beds" in df:
+        df.beds = df.beds.fillna(0).astype("int64")
     for c in df.columns:
         if c.startswith("grade_"):
             df[c] = pd.to_numeric(df[c], downcast='integer', errors='coerce')
@@ -452,14 +583,9 @@ def get_demographics(df):
         a pandas DataFrame holding school demographic data for all of the schools
     """
 
-    boros = {"K":"Brooklyn", "X":"Bronx", "M": "Manhattan", "Q": "Queens", "R": "Staten Island"}
-
-    df["ay"] = df["year"].apply(lambda year: int(year.split("-")[0]))
-    df["district"] = df["dbn"].apply(lambda dbn: int(dbn[:2]))
-
-    df["boro"] = df["dbn"].apply(lambda dbn: boros[dbn[2]])
-    df["school_num"] = df.dbn.apply(lambda dbn: int(dbn[3:]))
-    df["charter"] = df.district.apply(lambda x: 1 if x == 84 else 0)
+    df["ay"] = map_unique(df["year"], lambda year: int(year.split("-")[0]))
+    df = dbn_cols(df)
+    df["charter"] = (df.district == 84).astype("int64")
 
     # figure out what grades they teach
     df["pk"] = df["grade_pk"] > 0
@@ -468,12 +594,11 @@ def get_demographics(df):
     df["hs"] = df[["grade_10", "grade_11", "grade_12"]].sum(axis=1) > 0
 
     # make it easier to look up schools
-    df["clean_name"] = df.apply(lambda row: clean_name(row.school_name), axis=1)
-    df["short_name"] = df.apply(short_name, axis=1)
+    df = name_cols(df)
 
-    df["poverty"] = df.apply(lambda row: str_count(row, "poverty", "total_enrollment"), axis = 1)
-    df["poverty_1"] = df.apply(lambda row: str_pct(row, "poverty_1", "total_enrollment"), axis = 1)
-    df["economic_need_index"] = df.apply(lambda row: str_pct(row, "economic_need_index", "total_enrollment"), axis = 1)
+    df["poverty"] = parse.count(df["poverty"], df["total_enrollment"])
+    df["poverty_1"] = parse.pct(df["poverty_1"], df["total_enrollment"])
+    df["economic_need_index"] = parse.pct(df["economic_need_index"], df["total_enrollment"])
     
     df = df.rename(columns=demo.default_map)
     
@@ -492,9 +617,10 @@ def get_default_cols(df):
     return df
 
 
-def get_demo_2006():
-    """Load the 2006 demographic data from the NYC Open Data Portal"""
-    df = pd.read_csv(config.urls["demographics"].data_urls["2006"])
+def get_demo_2006(source=None):
+    """Load the 2006 demographic data from the NYC Open Data Portal
+    (or from `source`, a local copy of the file)"""
+    df = pd.read_csv(source or config.urls["demographics"].data_urls["2006"])
     def map_col(c):
         if c.startswith("grade"):
             return f"grade_{c[len('grade'):]}"
@@ -545,11 +671,7 @@ def get_demo_2006():
     df["poverty_pct"] = np.maximum(df.fl_pct, df.frl_pct)
     df["poverty_n"] = np.floor(df.poverty_pct * df.total_enrollment).astype(int)
 
-    df["district"] = df["dbn"].apply(lambda dbn: int(dbn[:2]))
-
-    boros = {"K": "Brooklyn", "X": "Bronx", "M": "Manhattan", "Q": "Queens", "R": "Staten Island"}
-    df["boro"] = df["dbn"].apply(lambda dbn: boros[dbn[2]])
-    df["school_num"] = df.dbn.apply(lambda dbn: int(dbn[3:]))
+    df = dbn_cols(df)
     df["charter"] = 0
 
 
@@ -560,8 +682,7 @@ def get_demo_2006():
     df["hs"] = df["grade_10"] > 0
 
     # make it easier to look up schools
-    df["clean_name"] = df.apply(lambda row: clean_name(row.school_name), axis=1)
-    df["short_name"] = df.apply(short_name, axis=1)
+    df = name_cols(df)
 
     df['eni'] = 0
     df['missing_race_ethnicity_data_n'] = 0
@@ -577,7 +698,7 @@ def get_demo_2006():
     return get_default_cols(df)
 
 
-def get_demo_2013():
+def get_demo_2013(source=None):
     def map_col(c):
         if c.endswith("_1") and not c.startswith("grade"):
             return c.replace("_1", "")
@@ -587,7 +708,7 @@ def get_demo_2013():
             return "grade_3k_pk_half_day_full"
         return c
 
-    df13 = pd.read_csv(config.urls["demographics"].data_urls["2013"])
+    df13 = pd.read_csv(source or config.urls["demographics"].data_urls["2013"])
 
     df13 = df13.rename(columns=map_col)
     df13["multi_racial"] = df13['multiple_race_categories_not_represented']
@@ -612,8 +733,8 @@ def get_demo_2013():
     return df13[df13.ay.isin([2013, 2014, 2015, 2017])]
 
 
-def get_demo_2016():
-    demo_2016 = pd.read_csv(config.urls["demographics"].data_urls["2016"])
+def get_demo_2016(source=None):
+    demo_2016 = pd.read_csv(source or config.urls["demographics"].data_urls["2016"])
     demo_2016 = demo_2016[demo_2016.year == "2016-17"]
     # make the columns match the most recent data set
     demo_2016.rename(
@@ -623,7 +744,7 @@ def get_demo_2016():
     return get_demographics(demo_2016)
 
 
-def get_demo_2022():
+def get_demo_2022(source=None):
     """Read the latest demographic data from an Excel download"""
     def xls_cols(col):
         d = {
@@ -642,14 +763,14 @@ def get_demo_2022():
             return d[col_name]
         return col_name
 
-    xls = pd.read_excel( config.urls["demographics"].data_urls["2022"], sheet_name=None)
+    xls = pd.read_excel(source or config.urls["demographics"].data_urls["2022"], sheet_name=None)
     df = xls["School"]
     df.rename(columns=xls_cols, inplace=True)
     df = get_demographics(df)
 
     return df
 
-def get_demo_2023():
+def get_demo_2023(source=None):
     """Read the latest demographic data from an Excel download"""
     def xls_cols(col):
         d = {
@@ -669,7 +790,7 @@ def get_demo_2023():
         if col_name in d:
             return d[col_name]
         return col_name
-    xls = pd.read_excel( config.urls["demographics"].data_urls["2023"], sheet_name=None)
+    xls = pd.read_excel(source or config.urls["demographics"].data_urls["2023"], sheet_name=None)
     df = xls["School"]
     a = len(df)
     df.rename(columns=xls_cols, inplace=True)
@@ -679,44 +800,123 @@ def get_demo_2023():
     return df
 
 
-def save_demographics():
-    demo_2006 = get_demo_2006()
-    demo_2013 = get_demo_2013()
-    demo_2016 = get_demo_2016()
-    demo_2022 = get_demo_2022()
-    demo_2023 = get_demo_2023()
-    df = demo_2023.copy()
-    # join the dataframes, but don't add any academic year 2x
-    for data in [demo_2022, demo_2016, demo_2013, demo_2006]:
-        df = pd.concat([df, data[~data.ay.isin(df.ay)]], ignore_index=True)
+# the demographic sources from oldest to newest, keyed like `data_urls`
+demo_sources = {
+    "2006": get_demo_2006,
+    "2013": get_demo_2013,
+    "2016": get_demo_2016,
+    "2022": get_demo_2022,
+    "2023": get_demo_2023,
+}
+
+
+def save_demographics(incremental=False, sources=None):
+    """Builds the demographic data from all of the `demo_sources` and saves it
+    to the `demographics` data file.
+
+    Each newer source replaces the rows of the older ones with the same
+    `dbn` and `ay`.
+
+    Parameters
+    ----------
+    incremental : bool, default False
+        cache each source's processed data in `data_dir/_cache`, keyed on the
+        source URL and a hash of its content, so only sources that have
+        changed since the last build are processed again
+    sources : dict, optional
+        URLs or local paths to use instead of the `data_urls` in `datasets.py`,
+        e.g. `{"2023": "demographic-snapshot.xlsx"}`
+
+    Returns
+    -------
+    DataFrame
+        the combined demographic data
+    """
+    urls = {**config.urls["demographics"].data_urls, **(sources or {})}
+    df = None
+    for key, build in demo_sources.items():
+        if incremental:
+            data = dataloader.build_cached(f"demographics-{key}", urls[key], build)
+        else:
+            data = build(urls[key])
+        df = dataloader.upsert(df, data, ["dbn", "ay"])
 
-    print("saving to:", __demo_filename)
-    df.to_csv(__demo_filename, index=False)
+    filename = data_path("demographics")
+    print("saving to:", filename)
+    df.to_csv(filename, index=False)
     return df
 
 
-def join_loc_data(df):
+loc_cols = ["beds", "zip", "geo_district"]
+
+
+def location_lookup():
+    """The `beds`, `zip` and `geo_district` of each school, indexed by `dbn`.
+
+    The table is read from the school locations file in `config.data_dir`
+    once (and again when the file or `data_dir` changes, e.g. after
+    `geo.get_and_save_locations()`) and shared by every caller of
+    `join_loc_data()`; treat it as read only.
+    `beds` is 0 and `geo_district` is NaN where the location data is missing.
+    """
+    path = dataloader.data_path("school_locations")
+    version = None
+    if os.path.exists(path):
+        stat = os.stat(path)
+        version = (stat.st_size, stat.st_mtime_ns)
+    return _location_lookup(config.data_dir, version)
+
+
+@functools.lru_cache(maxsize=4)
+def _location_lookup(data_dir, version):
+    # data_dir and version only key the cache, the file is read from config.data_dir
+    loc = pd.DataFrame(geo.load_school_locations(columns=["dbn", *loc_cols]))[["dbn", *loc_cols]]
+    loc = loc.drop_duplicates("dbn").set_index("dbn")
+    loc["beds"] = pd.to_numeric(loc.beds, errors="coerce").fillna(0).astype("int64")
+    loc["zip"] = pd.to_numeric(loc.zip, errors="coerce")
+    loc["geo_district"] = pd.to_numeric(loc.geo_district, errors="coerce")
+    return loc
+
+
+def join_loc_data(df, cols=loc_cols, lookup=None):
     """Join NYS BEDS id, zip code, and other location data.
+
+    Schools without a location get a `beds` of 0. Their `geo_district` is
+    their `district` for districts 1-32 and 0 otherwise.
+
+    Parameters
+    ----------
+    df : DataFrame
+        school data with a `dbn` column
+    cols : list
+        the location columns to add (replacing any that `df` already has)
+    lookup : DataFrame, optional
+        the table from `location_lookup()`, loaded if not given
+
+    Returns
+    -------
+    DataFrame
+        `df` with the location columns
     """
-    school_loc = geo.load_school_locations()
-    # with the left join, we might be missing zip and beds for some schools
-    df = df.merge(school_loc[["dbn", "beds", "zip", "geo_district"]], on="dbn", how="left")
-    # df.beds = df.beds.fillna(0)
-    df.geo_district = df.geo_district.fillna(0)
-    df.geo_district = df.geo_district.astype(int)
-    # df.zip = df.zip.fillna(0).astype("int32")
-    df.beds = pd.to_numeric(df.beds , downcast='integer', errors='coerce')
-    df.beds = df.beds.fillna(0).astype("int64")
-
-    def get_geo(row):
-        d = row.district
-        if row.geo_district > 0:
-            return row.geo_district
-        if d > 0 and d <=32:
-            return d
-        return 0
-    df.geo_district = df.apply(get_geo, axis=1)
-    return df
+    if lookup is None:
+        lookup = location_lookup()
+    loc = lookup.reindex(df["dbn"].to_numpy())
+    df = df.drop(columns=[c for c in cols if c in df.columns])
+    if "beds" in cols:
+        df["beds"] = loc.beds.fillna(0).to_numpy(dtype="int64")
+    if "zip" in cols:
+        df["zip"] = loc.zip.to_numpy()
+    if "geo_district" in cols:
+        geo_district = loc.geo_district.fillna(0).to_numpy(dtype="int64")
+        if "district" in df:
+            district = pd.to_numeric(df["district"], errors="coerce").fillna(0).to_numpy()
+        else:
+            # missing and non-numeric dbns (footnotes, "Citywide") are district 0
+            district = pd.to_numeric(df["dbn"].astype("string").str[:2], errors="coerce").fillna(0).astype(int).to_numpy()
+        fallback = np.where((district > 0) & (district <= 32), district, 0)
+        df["geo_district"] = np.where(geo_district > 0, geo_district, fallback).astype("int64")
+    return df.reset_index(drop=True)
+
 
 def search(df, qry):
     """Search a DataFrame for a school using fuzzy logic.
@@ -735,6 +935,10 @@ def search(df, qry):
         the schools that match the `qry` or an empty DataFrame
         if no matches were found
 
+    Notes
+    -----
+    Each call scans every school. To run many searches against the same data,
+    build a `SchoolIndex` once and use `SchoolIndex.search()`.
     """
     t = df.copy(deep=False)
     latest = t.ay.max()
@@ -763,6 +967,293 @@ def search(df, qry):
     return results
 
 
+def process_name(name):
+    """Normalizes a name the way `fuzz.token_set_ratio()` does: ascii only,
+    lower case, letters and numbers."""
+    return fuzz_utils.full_process(name, force_ascii=True)
+
+
+def name_ngrams(name, n=3):
+    """The set of character n-grams of each word in a `process_name()` name.
+    Words are padded with spaces, so any word two names share gives them
+    at least one n-gram in common."""
+    grams = set()
+    for word in name.split():
+        word = f" {word} "
+        grams.update(word[i:i + n] for i in range(max(len(word) - n + 1, 1)))
+    return grams
+
+
+class SchoolIndex():
+    """A search index over the schools in the demographic data. Build it
+    once and use `search()` for repeated lookups (e.g. autocomplete) or
+    `search_many()` to match a list of names. Results are the same as
+    `schools.search()`.
+
+    Exact matches on `clean_name`, `short_name`, `dbn` and `beds` are dict
+    lookups. Otherwise an n-gram index picks the schools whose names share at
+    least one n-gram with the query and only those are fuzzy scored (a name
+    without a shared n-gram can't score above the 80 cutoff).
+
+    Examples:
+    ----------
+    from nycschools import schools
+
+    index = schools.SchoolIndex()
+    index.search("clemente")
+    index.search_many(["PS 15", "Stuyvesant High School", "01M015"])
+    """
+
+    def __init__(self, df=None):
+        """
+        Parameters
+        ----------
+        df : DataFrame, optional
+            school data with `ay`, `dbn`, `school_name`, `clean_name` and `short_name`
+            columns, by default `load_school_demographics()`. Like `search()`, only the
+            latest academic year is indexed.
+        """
+        if df is None:
+            df = load_school_demographics()
+        self.schools = df[df.ay == df.ay.max()].reset_index(drop=True)
+
+        self.__exact = {}
+        for col in ["clean_name", "short_name", "dbn"]:
+            self.__exact[col] = self.schools.groupby(col, sort=False, observed=True).indices
+        self.__beds = {}
+        if "beds" in self.schools:
+            beds = pd.to_numeric(self.schools.beds, errors="coerce")
+            for b, rows in beds.groupby(beds, sort=False).indices.items():
+                self.__beds[int(b)] = rows
+
+        self.__names = np.array([process_name(n) for n in self.schools.school_name], dtype=object)
+        self.__clean_names = self.schools.clean_name.to_numpy(dtype=object)
+        postings = defaultdict(list)
+        for i, name in enumerate(self.__names):
+            for gram in name_ngrams(name):
+                postings[gram].append(i)
+        self.__postings = {gram: np.array(rows) for gram, rows in postings.items()}
+
+    def __len__(self):
+        return len(self.schools)
+
+    def __exact_match(self, qry):
+        q = clean_name(qry)
+        if len(q) > 0 and q in self.__exact["clean_name"]:
+            return self.__exact["clean_name"][q]
+        key = qry.upper().strip()
+        for col in ["short_name", "dbn"]:
+            if key in self.__exact[col]:
+                return self.__exact[col][key]
+        if key.isdigit() and int(key) in self.__beds:
+            return self.__beds[int(key)]
+        return None
+
+    def __candidates(self, name):
+        """The rows that share an n-gram with a processed `name`, in index order.
+        All of them are scored: a cap on the number of candidates would drop
+        matches of broad queries like "academy"."""
+        postings = [self.__postings[g] for g in name_ngrams(name) if g in self.__postings]
+        if not postings:
+            return np.array([], dtype=int)
+        return np.unique(np.concatenate(postings))
+
+    def search(self, qry, limit=None):
+        """Search for a school by name, short name (e.g. "PS 15"), DBN or BEDS code.
+
+        Parameters
+        ----------
+        qry : str
+            the school name or search term
+        limit : int, optional
+            only return the best `limit` matches
+
+        Returns
+        -------
+        DataFrame
+            the matching schools, fuzzy matches are sorted by a `match` score
+        """
+        qry = str(qry)
+        rows = self.__exact_match(qry)
+        if rows is not None:
+            return self.schools.iloc[rows[:limit]]
+
+        # the same scores as search(): fuzz.token_set_ratio() on the school name,
+        # then fuzz.ratio() on the clean name, rounded like thefuzz does
+        name = process_name(qry)
+        rows = self.__candidates(name)
+        if len(rows) > 0:
+            scores = self.__scores(name, self.__names[rows], rf_fuzz.token_set_ratio)
+            rows = rows[scores > 80]
+        match = self.__scores(qry, self.__clean_names[rows], rf_fuzz.ratio)
+        order = pd.Series(match).sort_values(ascending=False).index[:limit]
+        return self.schools.iloc[rows[order]].assign(match=match[order])
+
+    @staticmethod
+    def __scores(qry, choices, scorer):
+        if len(choices) == 0:
+            return np.array([], dtype="int64")
+        scores = rf_process.cdist([qry], choices, scorer=scorer, dtype=np.float64)[0]
+        return np.rint(scores).astype("int64")
+
+    def search_many(self, queries, limit=1):
+        """Search for a list of schools, e.g. to match the names in a spreadsheet
+        to DBNs.
+
+        Parameters
+        ----------
+        queries : list of str
+            the names or search terms
+        limit : int, optional
+            the number of matches to return per query, all of them if None
+
+        Returns
+        -------
+        DataFrame
+            the `query`, a `match` score (100 for exact matches) and the school
+            data for each result. Queries without a match get one row with
+            only the `query` set.
+        """
+        found = {}
+        results = []
+        for qry in queries:
+            if qry not in found:
+                r = self.search(qry, limit)
+                if len(r) == 0:
+                    r = pd.DataFrame({"match": [np.nan]})
+                elif "match" not in r:
+                    r = r.assign(match=100)
+                found[qry] = r
+            results.append(found[qry].assign(query=qry))
+        if not results:
+            return pd.DataFrame(columns=["query", "match"] + list(self.schools.columns))
+        df = pd.concat(results, ignore_index=True)
+        return df[["query", "match"] + [c for c in df.columns if c not in ("query", "match")]]
+
+
+def __boro_name(boro):
+    """Boro hints can be a code like "K" or a name like "brooklyn"."""
+    if not isinstance(boro, str):
+        return None
+    boro = boro.strip()
+    if boro.upper() in boros:
+        return boros[boro.upper()]
+    if boro.title() in boros.values():
+        return boro.title()
+    return None
+
+
+def link_schools(data, name_col="school_name", boro_col=None, district_col=None,
+                 df=None, threshold=80, workers=-1, chunk_size=2000):
+    """Match school names from another source (budget files, news data, etc.)
+    to DBNs in bulk.
+
+    Each distinct (name, boro, district) is matched once. A name whose
+    `clean_name()` matches exactly one school is an exact match. Otherwise the
+    name is fuzzy matched like `search()`: schools with a `token_set_ratio` above
+    `threshold` are candidates and the one whose clean name is closest
+    (`ratio`) wins. Only schools in the same boro and district are compared
+    when those hints are given. The scoring runs in `rapidfuzz` across `workers`
+    cores.
+
+    Parameters
+    ----------
+    data : DataFrame
+        the names to match
+    name_col : str
+        the column in `data` with the school names
+    boro_col : str, optional
+        a column with the boro of each school, as a code ("K") or name ("Brooklyn")
+    district_col : str, optional
+        a column with the district number of each school
+    df : DataFrame, optional
+        the schools to match against, by default `load_school_demographics()`.
+        Each dbn is matched by its most recent name.
+    threshold : int
+        the minimum `token_set_ratio` score (0-100) for a fuzzy match
+    workers : int
+        the number of cores to use, -1 for all of them
+    chunk_size : int
+        the number of names to score at once (limits memory use)
+
+    Returns
+    -------
+    DataFrame
+        with the same index as `data`: the matched `dbn` and `matched_name`,
+        the `match` score (100 for exact matches) and the `method`
+        ("exact" or "fuzzy"). Names without a match have NaN.
+    """
+    if df is None:
+        df = load_school_demographics(columns=["dbn", "ay", "school_name", "clean_name", "boro", "district"])
+    ref = df.sort_values("ay", kind="stable").drop_duplicates("dbn", keep="last").reset_index(drop=True)
+    ref_names = np.array([process_name(n) for n in ref.school_name], dtype=object)
+    ref_clean = ref.clean_name.to_numpy(dtype=object)
+    ref_boro = ref.boro.to_numpy(dtype=object)
+    ref_district = ref.district.to_numpy(dtype="float64")
+
+    q = pd.DataFrame({"name": data[name_col].to_numpy(dtype=object)})
+    q["boro"] = map_unique(data[boro_col], __boro_name).to_numpy() if boro_col else None
+    q["district"] = pd.to_numeric(data[district_col], errors="coerce").to_numpy() if district_col else np.nan
+    valid = np.flatnonzero(q.name.map(lambda n: isinstance(n, str)).to_numpy(dtype=bool))
+    q = q.iloc[valid]
+    codes = q.groupby(["name", "boro", "district"], dropna=False, sort=False).ngroup().to_numpy()
+    queries = q.drop_duplicates().reset_index(drop=True)
+    queries["clean"] = clean_names(queries.name)
+    queries["processed"] = map_unique(queries.name, process_name)
+
+    best = np.full(len(queries), -1)
+    score = np.full(len(queries), np.nan)
+    method = np.full(len(queries), None, dtype=object)
+    for (boro, district), block in queries.groupby(["boro", "district"], dropna=False, sort=False).indices.items():
+        in_block = np.ones(len(ref), dtype=bool)
+        if isinstance(boro, str):
+            in_block &= ref_boro == boro
+        if not pd.isna(district):
+            in_block &= ref_district == district
+        candidates = np.flatnonzero(in_block) if in_block.any() else np.arange(len(ref))
+
+        # exact matches on the clean name
+        exact = pd.Series(ref_clean[candidates]).drop_duplicates(keep=False)
+        exact = pd.Series(candidates[exact.index], index=exact.to_numpy())
+        found = queries.clean.iloc[block].map(exact).to_numpy(dtype="float64")
+        is_exact = ~np.isnan(found)
+        best[block[is_exact]] = found[is_exact].astype(int)
+        score[block[is_exact]] = 100
+        method[block[is_exact]] = "exact"
+
+        fuzzy = block[~is_exact]
+        for start in range(0, len(fuzzy), chunk_size):
+            rows = fuzzy[start:start + chunk_size]
+            token = rf_process.cdist(queries.processed.iloc[rows].tolist(), ref_names[candidates],
+                                     scorer=rf_fuzz.token_set_ratio, score_cutoff=threshold,
+                                     dtype=np.float64, workers=workers)
+            # only score the clean names of the candidate pairs
+            i, j = np.nonzero(np.rint(token) > threshold)
+            ratio = np.full(token.shape, -1.0)
+            ratio[i, j] = np.rint(rf_process.cpdist(queries.clean.to_numpy(dtype=object)[rows[i]],
+                                                    ref_clean[candidates[j]], scorer=rf_fuzz.ratio,
+                                                    dtype=np.float64, workers=workers))
+            top = ratio.argmax(axis=1)
+            top_score = ratio[np.arange(len(rows)), top]
+            matched = top_score >= 0
+            best[rows[matched]] = candidates[top[matched]]
+            score[rows[matched]] = top_score[matched]
+            method[rows[matched]] = "fuzzy"
+
+    found = best >= 0
+    matches = {
+        "dbn": np.where(found, ref.dbn.to_numpy(dtype=object)[best], None),
+        "matched_name": np.where(found, ref.school_name.to_numpy(dtype=object)[best], None),
+        "match": score,
+        "method": method,
+    }
+    result = {}
+    for col, values in matches.items():
+        result[col] = np.full(len(data), np.nan if col == "match" else None, dtype=values.dtype)
+        result[col][valid] = values[codes]
+    return pd.DataFrame(result, index=data.index)
+
+
 def load_hs_directory(ay=2021):
     """Loads the NYC High School Directory data from the NYC Open Data
     Portal. This is a thin wrapper around `pd.read_csv()` and
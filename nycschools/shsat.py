@@ -18,11 +18,13 @@ import os.path
 
 import pandas as pd
 
-from .dataloader import load
-from . import config
+from .dataloader import load, data_path
+from . import config, parse, schools
 
-def load_admission_offers():
-    return load(config.urls["shsat_apps"].filename)
+def load_admission_offers(columns=None, filters=None):
+    """Load the SHSAT applicants, testers and offers by sending school.
+    `columns` and `filters` select the data to load, see `dataloader.read_file()`."""
+    return load(config.urls["shsat_apps"].filename, columns=columns, filters=filters)
 
 
 def save_administration_offers():
@@ -32,9 +34,9 @@ def save_administration_offers():
         data = pd.read_csv(url)
         data.columns = ["dbn", "feeder_name", "hs_applicants_n", "testers_n", "offers_n"]
         data["ay"] = ay
-        data["hs_applicants_n"] = data.hs_applicants_n.apply(lambda x: 2 if x == "0-5" else x)
-        data["offers_n"] = data.offers_n.apply(lambda x: 2 if x == "0-5" else x)
-        data["testers_n"] = data.testers_n.apply(lambda x: 2 if x == "0-5" else x)
+        # suppressed counts like "0-5" are imputed as 2
+        for c in ["hs_applicants_n", "testers_n", "offers_n"]:
+            data[c] = parse.count(data[c])
         return data
 
     df = pd.concat([shsat(url, ay) for url, ay in data_urls.items()])
@@ -42,6 +44,7 @@ def save_administration_offers():
     df.testers_n = pd.to_numeric(df.testers_n, errors='coerce').astype('Int64')
     df.offers_n = pd.to_numeric(df.offers_n, errors='coerce').astype('Int64')
     df["offers_pct"] = df.offers_n / df.testers_n
-    f = os.path.join(config.data_dir, config.urls["shsat_apps"].filename)
+    df = schools.join_loc_data(df)
+    f = data_path("shsat_apps")
     df.to_csv(f, index=False)
     return df
\ No newline at end of file
@@ -16,15 +16,17 @@
 
 from requests import Session
 import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point
 import os
 
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
-from . import config
-from .dataloader import load
+from . import config, parse, schools
+from .dataloader import load, data_path
+from .tools import lazy_import
+
+gpd = lazy_import("geopandas")
+shapely = lazy_import("shapely.geometry")
 
 
 import subprocess
@@ -42,14 +44,19 @@ def wget(url, destination):
         return None
 
 
-def load_snapshots():
+def load_snapshots(columns=None, filters=None):
     """
     Loads the "snapshot" data from the NYC DOE data portal.
     This data contains core columns only for all "school types"
     mainly focusing on school demographics and teacher demographics.
+
+    `columns` and `filters` select the data to load, see `dataloader.read_file()`.
+    The `lat` and `long` columns are always loaded to make the point geometry.
     """
     filename = config.urls["snapshots"].filename
-    df = load(filename)
+    if columns is not None:
+        columns = list(dict.fromkeys(list(columns) + ["long", "lat"]))
+    df = load(filename, columns=columns, filters=filters)
     
     return make_geo(df)
 
@@ -86,29 +93,13 @@ def fix_ethnicity(df):
     return data
 
 def fix_pct(df):
-    pct_cols = [c for c in df.columns if c.endswith( "pct") or c == "attendance_rate"]
-
-
-    def pct(row):
-        for col in pct_cols:
-            if pd.isnull(row[col]):
-                row[col] = 0.0
-                continue
-            pct = row[col]
-            try:
-                pct = float(pct)
-            except:
-                if pct.endswith("%"):
-                    pct = pct[:-1]
-                    pct = float(pct) / 100
-                elif "fewer than 5" in pct:
-                    pct = .01
-            row[col] = pct
-        return row
-
-
-    df = df.apply(pct, axis=1)
-    return df
+    """Convert the percent columns to reals: '45%' is .45, 'fewer than 5' is .01,
+    numbers are kept as they are and missing values are 0."""
+    data = df.copy()
+    pct_cols = [c for c in data.columns if c.endswith( "pct") or c == "attendance_rate"]
+    for col in pct_cols:
+        data[col] = parse.pct(data[col], scale="sign", missing=0.0, errors="coerce")
+    return data
 
 def fix_admissions(df):
     data = df.copy()
@@ -205,7 +196,7 @@ def save_school_rank(df):
     next = next[next.hs_rank1_school_name.notnull()]
     next = next.melt(id_vars=["dbn", "ay", "school_type", "school_name"], value_vars=[f"hs_rank{i}_school_name" for i in range(1, 6)], var_name="rank", value_name="next_school")
     next["rank"] = next["rank"].apply(lambda x: int(x.split("_")[1][-1:]))
-    path = os.path.join(config.data_dir, config.urls["snapshots"].rank_filename)
+    path = data_path("snapshots", "rank_filename")
     next.to_csv(path, index=False)
 
     return df.drop(columns=drop)
@@ -213,7 +204,7 @@ def save_school_rank(df):
 
 def make_geo(data):
     df = data.copy()
-    df['geometry'] = [Point(xy) for xy in zip(df['long'], df['lat'])]
+    df['geometry'] = [shapely.Point(xy) for xy in zip(df['long'], df['lat'])]
     gdf = gpd.GeoDataFrame(df, geometry='geometry', crs="EPSG:4326")
     return gdf
 
@@ -244,10 +235,12 @@ def clean_snapshot():
     data = fix_colocations(data)
     data = data.rename(columns=rename_cols)
     data["district"] = data.dbn.apply(lambda x: int(x[:2]))
+    # the snapshot has its own geo_district
+    data = schools.join_loc_data(data, cols=["beds", "zip"])
     data = save_school_rank(data)
 
     gdf = make_geo(data)
-    path = os.path.join(config.data_dir, config.urls["snapshots"].filename)
+    path = data_path("snapshots")
     data.to_feather(path)
 
     return gdf
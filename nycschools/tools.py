@@ -15,8 +15,13 @@
 # ==============================================================================
 
 
+import os
+import time
+import types
 import warnings
 import functools
+import importlib
+from contextlib import contextmanager
 
 
 def suppress_warnings(warning_category=RuntimeWarning):
@@ -28,3 +33,72 @@ def suppress_warnings(warning_category=RuntimeWarning):
                 return func(*args, **kwargs)
         return wrapper
     return decorator
+
+
+class LazyModule(types.ModuleType):
+    """A stand-in for a module that is only imported when one of its
+    attributes is first used. See `lazy_import()`."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_name"] = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__dict__["_lazy_name"])
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __dir__(self):
+        return dir(importlib.import_module(self.__dict__["_lazy_name"]))
+
+
+def lazy_import(name):
+    """Returns a proxy for the module `name` that defers the real import
+    until an attribute is accessed. Use it for heavy optional dependencies
+    (geopandas, matplotlib, selenium...) so that `import nycschools.<module>`
+    stays fast and only pays for what is actually used.
+
+    Example:
+        gpd = lazy_import("geopandas")
+        ...
+        df = gpd.read_file(path)  # geopandas is imported here
+    """
+    return LazyModule(name)
+
+
+@contextmanager
+def file_lock(path, lock_dir=None):
+    """An exclusive advisory lock on `path` that works across processes and threads.
+    The lock is held on a separate `.lock` file (in `lock_dir` if given) so
+    `path` itself can be replaced while the lock is held.
+
+    Example:
+        with file_lock(local_path):
+            if not os.path.exists(local_path):
+                download(url, local_path)
+    """
+    folder = lock_dir or os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    lock_path = os.path.join(folder, os.path.basename(path) + ".lock")
+    with open(lock_path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(.1)
+            try:
+                yield lock_path
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield lock_path
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
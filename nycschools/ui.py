@@ -14,21 +14,24 @@
 # If not, see <http://www.gnu.org/licenses/>.
 # ==============================================================================
 import pandas as pd
-from IPython.display import Markdown as md
-from IPython.display import display
 from decimal import *
 
-import matplotlib.pyplot as plt
-import matplotlib as mpl
-import seaborn as sns
-import networkx as nx
-import folium
 import numpy as np
 import random
 import math
-from shapely import Point
 from functools import partial
 
+from .tools import lazy_import
+
+# plotting and notebook libraries are slow to import, load them on first use
+plt = lazy_import("matplotlib.pyplot")
+mpl = lazy_import("matplotlib")
+sns = lazy_import("seaborn")
+nx = lazy_import("networkx")
+folium = lazy_import("folium")
+shapely = lazy_import("shapely")
+ipd = lazy_import("IPython.display")
+
 
 def ul(t):
 
@@ -259,7 +262,7 @@ def rand_points(geometry, n, max_conflicts=0):
 
         x = random.uniform(minx, maxx)
         y = random.uniform(miny, maxy)
-        p = Point(x, y)
+        p = shapely.Point(x, y)
         if p.within(geometry) and not occupied(p):
             return p
         return rand_point()
@@ -494,7 +497,7 @@ def fmt_table(df, col_map=None, pct_cols=[], num_cols=[]):
 
 
 def show_md(s):
-    display(md(s))
+    ipd.display(ipd.Markdown(s))
 
 def infinite():
     n = 0
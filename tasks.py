@@ -43,7 +43,10 @@ def archive(c):
     print("removing existing archive", filename)
     c.run(f"rm -f {filename}")
     print(f"creating archive {filename} from {data_dir}/*")
-    c.run(f"7z a {filename} {data_dir}/*")
+    # skip the parquet sidecars, they are re-built on first load
+    c.run(f"7z a {filename} {data_dir}/* -xr!{dataloader.sidecar_dir}")
+    print(f"sha256: {dataloader.file_sha256(filename)}")
+    print("set this as the `sha256` of `school-data-archive` in datasets.py")
 
 @task 
 def clean(c):
@@ -84,6 +87,15 @@ def test(c, opt=""):
     c.run(f"pytest {opt}")
 
 
+@task
+def bench(c, name=None):
+    """Run the benchmarks in `benchmarks/`, or just one with --name (e.g. --name schemas)."""
+    names = [name] if name else [f[6:-3] for f in sorted(os.listdir("benchmarks")) if f.startswith("bench_")]
+    for n in names:
+        print(f"benchmarks/bench_{n}.py")
+        c.run(f"python benchmarks/bench_{n}.py")
+
+
 @task
 def api(c, clean=False):
     """Build the api documentation with sphynx-apidoc."""
@@ -276,6 +288,8 @@ def start_firebase(c):
 @task 
 def push_firebase(c):
     """Push to firebase."""
+    print("Writing the data manifest.")
+    dataloader.build_manifest(config.data_dir)
     data_index(c)
     c.run("firebase deploy")
 
@@ -6,3 +6,43 @@ def test_get_config():
     assert config.data_dir is not None
     assert config.urls is not None
 
+
+def importtime(code, tmp_path, flags=()):
+    """Run `code` in a fresh interpreter with `-X importtime` and return
+    (modules imported, {module: cumulative microseconds})."""
+    import os
+    import subprocess
+    import sys
+
+    env = dict(os.environ, NYC_SCHOOLS_DATA_DIR=str(tmp_path / "missing"))
+    code += "; import sys; print('\\n'.join(sys.modules))"
+    proc = subprocess.run([sys.executable, "-X", "importtime", *flags, "-c", code],
+                          capture_output=True, text=True, env=env, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return set(proc.stdout.split()), times
+
+
+heavy_modules = ["geopandas", "matplotlib", "seaborn", "networkx", "folium", "IPython",
+                 "selenium", "bs4", "thefuzz", "py7zr", "yaspin", "dotenv", "shapely"]
+
+
+def test_import_is_lazy(tmp_path):
+    """`import nycschools` must not touch the data directory (no warning)
+    or pull in pandas, and stay well under the import-time budget."""
+    modules, times = importtime("import nycschools", tmp_path, flags=("-W", "error"))
+    assert "pandas" not in modules
+    assert times["nycschools"] < 250_000, f"import nycschools took {times['nycschools']}us"
+
+
+def test_submodule_imports_are_light(tmp_path):
+    """Importing the data modules must not read the data directory or import
+    plotting, scraping or geo libraries."""
+    code = "from nycschools import schools, exams, nysed, class_size, shsat, geo, snapshot, budgets, ui, panel"
+    modules, _ = importtime(code, tmp_path, flags=("-W", "error"))
+    loaded = [m for m in heavy_modules if m in modules]
+    assert not loaded, f"heavy modules imported eagerly: {loaded}"
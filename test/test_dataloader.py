@@ -1,8 +1,16 @@
 from nycschools import config, dataloader as loader
+import pandas as pd
 import requests
 import os
 import pytest
 import shutil
+import hashlib
+import threading
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler, SimpleHTTPRequestHandler
+from collections import Counter
+import json
+import time
+import warnings
 
 
 tmp_data_dir = "/tmp/nyc-schools-test-data"
@@ -44,3 +52,352 @@ def test_download_archive():
     shutil.rmtree(tmp_data_dir)
 
 
+
+
+def test_load_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    loader.clear_cache()
+    path = tmp_path / "cache-test.csv"
+    pd.DataFrame({"dbn": ["01M015", "01M019"], "ay": [2022, 2022]}).to_csv(path, index=False)
+
+    a = loader.load("cache-test.csv")
+    a.loc[0, "dbn"] = "changed"
+    b = loader.load("cache-test.csv")
+    info = loader.cache_info()
+    assert info.hits == 1 and info.misses == 1
+    assert b.dbn[0] == "01M015", "callers should not be able to change the cached frame"
+
+    # re-writing the file invalidates the cached frame
+    pd.DataFrame({"dbn": ["02M001"], "ay": [2023]}).to_csv(path, index=False)
+    c = loader.load("cache-test.csv")
+    assert len(c) == 1
+    assert loader.cache_info().misses == 2
+
+    loader.set_cache_size(0)
+    assert loader.cache_info().frames == 0
+    assert loader.cache_info().evictions == 1
+    loader.set_cache_size(1024)
+    loader.clear_cache()
+
+
+def test_load_sidecar(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    loader.clear_cache()
+    path = tmp_path / "sidecar-test.csv"
+    expected = pd.DataFrame({"dbn": ["01M015", "01M019"], "ay": [2021, 2022], "eni": [.5, .75]})
+    expected.to_csv(path, index=False)
+
+    loader.load("sidecar-test.csv")
+    sidecar = loader.sidecar_path(str(path))
+    assert os.path.exists(sidecar), "a parquet sidecar should be written on the first load"
+
+    # the second load should not parse the csv
+    loader.clear_cache()
+    def no_csv(path, gdf=False):
+        raise AssertionError(f"parsed {path} instead of reading the sidecar")
+    monkeypatch.setattr(loader, "read_file", no_csv)
+    df = loader.load("sidecar-test.csv")
+    pd.testing.assert_frame_equal(df, expected)
+    monkeypatch.undo()
+
+    # a changed source file gets a new sidecar and the stale one is removed
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    expected.head(1).to_csv(path, index=False)
+    loader.clear_cache()
+    assert len(loader.load("sidecar-test.csv")) == 1
+    assert not os.path.exists(sidecar)
+    sidecars = [f for f in os.listdir(tmp_path / loader.sidecar_dir) if f.endswith(".parquet")]
+    assert sidecars == [os.path.basename(loader.sidecar_path(str(path)))]
+    loader.clear_cache()
+
+
+def test_read_file_columns_filters(tmp_path):
+    df = pd.DataFrame({
+        "dbn": ["01M015", "01M019", "75X010", "02M001"],
+        "district": [1, 1, 75, 2],
+        "ay": [2021, 2022, 2022, 2022],
+        "eni": [.5, .75, .8, .2]})
+    expected = pd.DataFrame({"dbn": ["01M019", "02M001"], "eni": [.75, .2]})
+    filters = [("ay", "==", 2022), ("district", "<", 33)]
+    for ext in ["csv", "feather", "parquet"]:
+        path = str(tmp_path / f"test.{ext}")
+        if ext == "csv":
+            df.to_csv(path, index=False)
+        elif ext == "feather":
+            df.to_feather(path)
+        else:
+            df.to_parquet(path)
+        data = loader.read_file(path, columns=["dbn", "eni"], filters=filters)
+        pd.testing.assert_frame_equal(data.reset_index(drop=True), expected, check_dtype=False)
+
+    # a list of lists is an OR of ANDs
+    data = loader.read_file(str(tmp_path / "test.csv"), filters=[[("dbn", "==", "01M015")], [("district", "in", [75])]])
+    assert list(data.dbn) == ["01M015", "75X010"]
+
+
+def test_load_columns_filters(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    loader.clear_cache()
+    df = pd.DataFrame({"dbn": ["01M015", "01M019", "02M001"], "ay": [2021, 2022, 2022]})
+    df.to_csv(tmp_path / "filter-test.csv", index=False)
+
+    # first load parses the csv, the second is served by the sidecar
+    for i in range(2):
+        data = loader.load("filter-test.csv", columns=["dbn"], filters=[("ay", "==", 2022)])
+        assert list(data.columns) == ["dbn"]
+        assert list(data.dbn) == ["01M019", "02M001"]
+        loader.clear_cache()
+    assert len(loader.load("filter-test.csv")) == 3
+    loader.clear_cache()
+
+
+def test_read_file_schema(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    loader.clear_cache()
+    filename = config.urls["demographics"].filename
+    pd.DataFrame({
+        "dbn": ["01M015", "01M019", "01M015"],
+        "beds": [310100010015, 310100010019, 310100010015],
+        "ay": [2021, 2021, 2022],
+        "grade_k": [20, 25, None],
+        "grade_1": [22, 24, 21],
+        "female_pct": [.5, .45, .55]}).to_csv(tmp_path / filename, index=False)
+
+    for i in range(2):
+        df = loader.load(filename)
+        assert df.dbn.dtype == "string[pyarrow]"
+        assert df.ay.dtype == "int16"
+        assert df.grade_1.dtype == "int16"
+        assert df.grade_k.dtype == "float32", "int columns with NaN should be floats"
+        assert df.female_pct.dtype == "float32"
+        assert df.beds.dtype == "int64"
+        loader.clear_cache()
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves `self.server.body` and supports single `Range: bytes=a-b` requests
+    if `self.server.ranges` is set. Records the requested ranges."""
+
+    def do_GET(self):
+        body = self.server.body
+        header = self.headers.get("Range")
+        self.server.requests.append(header)
+        if header and self.server.ranges:
+            start, end = [int(x) for x in header.split("=")[1].split("-")]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+            body = body[start:end + 1]
+        else:
+            self.send_response(200)
+        if getattr(self.server, "etag", None):
+            self.send_header("ETag", self.server.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = HTTPServer(("127.0.0.1", 0), RangeHandler)
+    server.body = os.urandom(100_000)
+    server.ranges = True
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def test_download_file(tmp_path, http_server):
+    url = f"http://127.0.0.1:{http_server.server_port}/archive.7z"
+    body = http_server.body
+    sha = hashlib.sha256(body).hexdigest()
+    out = str(tmp_path / "archive.7z")
+
+    # an interrupted download left part of the second chunk on disk
+    with open(f"{out}.part1", "wb") as f:
+        f.write(body[30_000:35_000])
+    loader.download_file(url, out, sha256=sha, chunk_size=30_000, workers=2)
+    with open(out, "rb") as f:
+        assert f.read() == body
+    assert "bytes=35000-59999" in http_server.requests, "the partial chunk should resume"
+    assert [f for f in os.listdir(tmp_path)] == ["archive.7z"]
+
+    with pytest.raises(ValueError):
+        loader.download_file(url, out, sha256="0" * 64, chunk_size=30_000)
+
+    # parts of an older version of the file are not stitched into the new one
+    os.remove(out)
+    http_server.etag = '"v1"'
+    with open(f"{out}.part0", "wb") as f:
+        f.write(b"x" * 30_001)
+    loader.download_file(url, out, chunk_size=30_000)
+    with open(out, "rb") as f:
+        assert f.read() == body
+    with open(f"{out}.part1", "wb") as f:
+        f.write(b"x" * 1000)
+    with open(f"{out}.part.json", "w") as f:
+        f.write('{"etag": "\\"v0\\""}')
+    os.remove(out)
+    loader.download_file(url, out, chunk_size=30_000)
+    with open(out, "rb") as f:
+        assert f.read() == body
+    assert [f for f in os.listdir(tmp_path)] == ["archive.7z"]
+
+    # servers without range support are read in one request
+    http_server.ranges = False
+    os.remove(out)
+    loader.download_file(url, out, sha256=sha, chunk_size=30_000)
+    with open(out, "rb") as f:
+        assert f.read() == body
+
+
+def test_extract_archive(tmp_path):
+    py7zr = pytest.importorskip("py7zr")
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.csv").write_text("dbn\n01M015\n")
+    (src / "b.csv").write_text("dbn\n01M019\n")
+    archive = str(tmp_path / "data.7z")
+    with py7zr.SevenZipFile(archive, "w") as z:
+        z.write(src / "a.csv", "a.csv")
+        z.write(src / "b.csv", "b.csv")
+
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    assert sorted(loader.extract_archive(archive, str(data_dir))) == ["a.csv", "b.csv"]
+    assert loader.extract_archive(archive, str(data_dir)) == []
+    (data_dir / "b.csv").write_text("dbn\n01M020\n")
+    assert loader.extract_archive(archive, str(data_dir)) == ["b.csv"]
+    assert (data_dir / "b.csv").read_text() == "dbn\n01M019\n"
+
+
+def test_fetch_file(tmp_path, monkeypatch):
+    remote = tmp_path / "remote"
+    remote.mkdir()
+    body = b"dbn,ay\n01M015,2022\n"
+    (remote / "fetch-test.csv").write_bytes(body)
+    (remote / "bad.csv").write_bytes(body)
+    (remote / "short.csv").write_bytes(body)
+    (remote / "ranges.csv").write_bytes(body)
+    manifest = {"files": {
+        "fetch-test.csv": {"size": len(body), "sha256": hashlib.sha256(body).hexdigest()},
+        "bad.csv": {"size": len(body), "sha256": "0" * 64},
+        "short.csv": {"size": len(body) + 1}}}
+    (remote / "manifest.json").write_text(json.dumps(manifest))
+
+    requested = Counter()
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(remote), **kwargs)
+        def do_GET(self):
+            requested[self.path] += 1
+            super().do_GET()
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(config, "data_dir", str(data_dir))
+    monkeypatch.setattr(config.urls["datasite"], "url", f"http://127.0.0.1:{server.server_port}/")
+    monkeypatch.setattr(loader, "_manifest", None)
+    loader.clear_cache()
+    try:
+        # parallel workers share a single download
+        threads = [threading.Thread(target=loader.fetch_file, args=("fetch-test.csv",)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert (data_dir / "fetch-test.csv").read_bytes() == body
+        # one probe for range support and one download
+        assert requested["/fetch-test.csv"] == 2
+        assert requested["/manifest.json"] == 1
+
+        with pytest.raises(ValueError, match="bad.csv.*manifest"):
+            loader.fetch_file("bad.csv")
+        assert not (data_dir / "bad.csv").exists()
+        # the size is checked too
+        with pytest.raises(ValueError, match="short.csv.*manifest"):
+            loader.fetch_file("short.csv")
+        assert not (data_dir / "short.csv").exists()
+
+        assert list(loader.load("fetch-test.csv").dbn) == ["01M015"]
+
+        # a download that fails with an IOError falls back to reading the file remotely
+        def ignored_range(path, data_dir=None):
+            raise IOError("Server ignored the range request")
+        monkeypatch.setattr(loader, "fetch_file", ignored_range)
+        with pytest.warns(UserWarning, match="reading it remotely"):
+            assert list(loader.load("ranges.csv").dbn) == ["01M015"]
+    finally:
+        server.shutdown()
+        loader.clear_cache()
+
+
+def test_write_file_atomic(tmp_path):
+    df = pd.DataFrame({"dbn": ["01M015"], "ay": [2022]})
+    path = str(tmp_path / "atomic.csv")
+    loader.write_file(df, path)
+    assert os.listdir(tmp_path) == ["atomic.csv"]
+
+    class Broken(pd.DataFrame):
+        def to_csv(self, path, **kwargs):
+            with open(path, "w") as f:
+                f.write("dbn,ay\n02M")
+            raise IOError("disk full")
+
+    with pytest.raises(IOError):
+        loader.write_file(Broken(df), path)
+    assert os.listdir(tmp_path) == ["atomic.csv"], "a failed write should not leave files behind"
+    assert pd.read_csv(path).dbn[0] == "01M015", "a failed write should not change the file"
+
+
+def test_load_write_through_lock(tmp_path, monkeypatch):
+    """Workers that miss the local file wait for one of them to read and save it."""
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    def no_fetch(path, data_dir=None):
+        raise requests.ConnectionError("no datasite")
+    monkeypatch.setattr(loader, "fetch_file", no_fetch)
+    remote_reads = []
+    def read_remote(path, gdf=False, columns=None, filters=None):
+        if path.startswith("http"):
+            remote_reads.append(path)
+            time.sleep(.2)
+            return pd.DataFrame({"dbn": ["01M015"], "ay": [2022]})
+        return pd.read_csv(path)
+    monkeypatch.setattr(loader, "read_file", read_remote)
+    monkeypatch.setattr(loader, "use_sidecars", False)
+    loader.clear_cache()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(loader.load("lock-test.csv"))) for i in range(6)]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert len(remote_reads) == 1
+    assert all(list(df.dbn) == ["01M015"] for df in results) and len(results) == 6
+    loader.clear_cache()
+
+
+def test_data_path_follows_data_dir(tmp_path, monkeypatch):
+    from nycschools import geo
+    a, b = str(tmp_path / "a"), str(tmp_path / "b")
+    name = config.urls["demographics"].filename
+    monkeypatch.setattr(config, "data_dir", a)
+    assert loader.data_path("demographics") == os.path.join(a, name)
+    assert geo.school_location_file == os.path.join(a, config.urls["school_locations"].filename)
+
+    # switching data_dir at runtime is picked up without reloading modules
+    monkeypatch.setattr(config, "data_dir", b)
+    assert loader.data_path("demographics") == os.path.join(b, name)
+    assert loader.data_path("class_size", "filename_ptr") == os.path.join(b, config.urls["class_size"].filename_ptr)
+    assert loader.data_path("demographics", data_dir=a) == os.path.join(a, name)
@@ -93,3 +93,169 @@ def check_state_test(df):
     assert upper in upper_range, f"Max school size of {upper} outside of expected {upper_range}"
     for c in counts:
         assert df[c].max() <= upper, f"Count value ({df[c].max()}) greater than max ({upper}) found in {c}"
+
+
+def exam_results(seed, n_schools=20):
+    """Synthetic math or ela results for 2 years, 2 grades and 2 categories."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    idx = pd.MultiIndex.from_product([[f"01M{i:03}" for i in range(n_schools)], [2021, 2022],
+                                      ["3", "All Grades"], ["All Students", "Female"]],
+                                     names=["dbn", "ay", "grade", "category"])
+    df = idx.to_frame(index=False).sample(frac=.9, random_state=seed)
+    df["number_tested"] = rng.integers(10, 100, len(df))
+    df["level_3_4_pct"] = rng.uniform(0, 1, len(df)).round(3)
+    return df
+
+
+def test_load_math_ela_combined(tmp_path, monkeypatch):
+    """The wide data matches rows on category too; the long data stacks both exams."""
+    import pandas as pd
+    from nycschools import dataloader
+
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    dataloader.clear_cache()
+    math_df, ela_df = exam_results(1), exam_results(2)
+    math_df.to_csv(dataloader.data_path("nyc_math"), index=False)
+    ela_df.to_csv(dataloader.data_path("nyc_ela"), index=False)
+
+    wide = exams.load_math_ela_wide()
+    expected = math_df.sort_values(exams.exam_keys).merge(
+        ela_df, on=exams.exam_keys, suffixes=["_math", "_ela"])
+    assert wide.columns.tolist() == expected.columns.tolist()
+    assert len(wide) == len(expected)
+    pd.testing.assert_frame_equal(wide.astype({"dbn": str, "grade": str, "category": str}), expected,
+                                  check_dtype=False)
+    assert not wide.duplicated(exams.exam_keys).any()
+
+    long = exams.load_math_ela_long()
+    assert len(long) == len(math_df) + len(ela_df)
+    assert long.exam.dtype == "category" and long.category.dtype == "category"
+    assert long.exam.tolist() == ["math"] * len(math_df) + ["ela"] * len(ela_df)
+    math_part = long[long.exam == "math"]
+    assert math_part[["dbn", "ay"]].astype({"dbn": str}).apply(tuple, axis=1).is_monotonic_increasing
+    assert math_part.number_tested.sum() == math_df.number_tested.sum()
+
+    wide = exams.load_math_ela_wide(columns=["number_tested"], filters=[("ay", "==", 2022)])
+    assert wide.columns.tolist() == exams.exam_keys + ["number_tested_math", "number_tested_ela"]
+    assert (wide.ay == 2022).all()
+    dataloader.clear_cache()
+
+
+def test_read_exam_excel(tmp_path, monkeypatch):
+    """Only the listed sheets are read; the second read comes from the cache."""
+    import os
+    import openpyxl
+    import pandas as pd
+    from nycschools import dataloader
+
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    cols = ['DBN', 'Grade', 'Year', 'Category', 'Number Tested', 'Mean Scale Score',
+            '# Level 1', '% Level 1', '# Level 2', '% Level 2', '# Level 3',
+            '% Level 3', '# Level 4', '% Level 4', '# Level 3+4', '% Level 3+4']
+    sheets = ['All', 'SWD', 'Ethnicity', 'Gender', 'Econ Status', 'ELL']
+    wb = openpyxl.Workbook()
+    wb.active.title = "Notes"
+    wb.active.append(["not", "exam", "data"])
+    for i, sheet in enumerate(sheets):
+        ws = wb.create_sheet(sheet)
+        ws.append(cols + ["Extra"])
+        ws.append(["01M015", "3", 2023, sheet, 40 + i, 600, 1, 2.5, 2, 5, 30, 75, 7, 17.5, 37, 92.5, "x"])
+        ws.append(["84X123", "4", 2022, sheet, 20, 590, "s", "s", "s", "s", "s", "s", "s", "s", "s", "s", "x"])
+    path = str(tmp_path / "exams.xlsx")
+    wb.save(path)
+
+    df = exams.read_nys_exam_excel(path)
+    assert len(df) == 2 * len(sheets)
+    assert df.category.tolist()[::2] == sheets
+    assert "Extra" not in df.columns and "year" not in df.columns
+    assert df.level_3_4_pct.iloc[0] == .925
+    assert df.level_1_n.isna().sum() == len(sheets)
+    assert df.ay.tolist()[:2] == [2022, 2021]
+    assert df.charter.tolist()[:2] == [False, True]
+
+    def fail(job):
+        raise AssertionError(f"{job[1]} were parsed again")
+    monkeypatch.setattr(dataloader, "_read_sheets", fail)
+    pd.testing.assert_frame_equal(exams.read_nys_exam_excel(path), df)
+    # the sheets are cached as Parquet
+    cached = os.listdir(tmp_path / dataloader.sidecar_dir)
+    assert len(cached) == len(sheets) and all(f.endswith(".parquet") for f in cached)
+    with pytest.raises(AssertionError):
+        dataloader.read_excel_sheets(path, ["All"], cache=False)
+    monkeypatch.undo()
+
+    # columns of numbers and "s" are read as strings so they can be saved
+    raw = dataloader.read_excel_sheets(path, ["All"], cache=False)["All"]
+    assert raw["# Level 1"].tolist() == ["1", "s"]
+    assert raw["Number Tested"].tolist() == [40, 20]
+
+    # the sheets can be parsed in parallel
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    xls = dataloader.read_excel_sheets(path, sheets[:2], columns=["DBN", "Category"], workers=2, cache=False)
+    assert list(xls) == sheets[:2]
+    assert xls["SWD"].columns.tolist() == ["DBN", "Category"]
+
+
+def test_exam_rollup(tmp_path, monkeypatch):
+    """Weighted school and district rollups; suppressed grades are not zeros."""
+    import numpy as np
+    import pandas as pd
+    from nycschools import dataloader
+
+    nan = np.nan
+    df = pd.DataFrame({
+        "dbn": ["01M015", "01M015", "01M015", "01M019", "01M019", "02M475"],
+        "ay": [2022] * 6,
+        "grade": ["3", "4", "All Grades", "3", "4", "3"],
+        "category": ["All Students"] * 6,
+        "number_tested": [10, 30, 40, 4, 20, 50],
+        "mean_scale_score": [400, 440, 430, nan, 420, 410],
+        "level_1_n": [1, 3, 4, nan, 2, 5],
+        "level_2_n": [2, 6, 8, nan, 4, 10],
+        "level_3_n": [3, 9, 12, nan, 6, 15],
+        "level_4_n": [4, 12, 16, nan, 8, 20],
+        "level_3_4_n": [7, 21, 28, nan, 14, 35],
+    })
+    schools = exams.exam_rollup(df)
+    assert schools.dbn.tolist() == ["01M015", "01M019", "02M475"]
+    ps15 = schools.iloc[0]
+    assert ps15.number_tested == 40 and ps15.grades_n == 2 and ps15.suppressed_n == 0
+    assert ps15.mean_scale_score == 430
+    assert ps15.level_3_4_n == 28 and ps15.level_3_4_pct == .7
+    # grade 3 at 01M019 is suppressed: 4 students tested but no scores or levels
+    ps19 = schools.iloc[1]
+    assert ps19.number_tested == 24 and ps19.suppressed_n == 4
+    assert ps19.mean_scale_score == 420 and ps19.level_1_pct == .1
+
+    districts = exams.exam_rollup(df, by="district")
+    assert districts.district.tolist() == [1, 2]
+    d1 = districts.iloc[0]
+    assert d1.schools_n == 2 and d1.number_tested == 64
+    assert d1.mean_scale_score == (10 * 400 + 30 * 440 + 20 * 420) / 60
+    assert d1.level_3_4_pct == 42 / 60
+
+    # all grades suppressed
+    df.loc[df.dbn == "02M475", ["mean_scale_score", "level_1_n", "level_3_4_n"]] = nan
+    assert exams.exam_rollup(df).iloc[2][["mean_scale_score", "level_3_4_pct"]].isna().all()
+    with pytest.raises(ValueError):
+        exams.exam_rollup(df, by="grade")
+
+    # the loader stacks both exams and caches the rollup
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    dataloader.clear_cache()
+    df.to_csv(dataloader.data_path("nyc_math"), index=False)
+    df.assign(number_tested=df.number_tested * 2).to_csv(dataloader.data_path("nyc_ela"), index=False)
+    rollup = exams.load_exam_rollup()
+    assert len(rollup) == 6
+    assert len(list((tmp_path / dataloader.sidecar_dir).glob("exam-rollup-school.*"))) == 1
+    with monkeypatch.context() as m:
+        m.setattr(exams, "exam_rollup", None)
+        pd.testing.assert_frame_equal(exams.load_exam_rollup(), rollup)
+    math = exams.load_math_rollup(columns=["number_tested"], filters=[("dbn", "==", "01M019")])
+    assert math.columns.tolist() == ["dbn", "ay", "category", "number_tested"]
+    assert math.number_tested.tolist() == [24]
+    assert exams.load_ela_rollup(by="district").number_tested.tolist() == [128, 100]
+    dataloader.clear_cache()
@@ -2,6 +2,7 @@ import pytest
 import pandas as pd
 import os.path
 from nycschools import config, nysed
+from nycschools import parse as nysed_parse
 from test_exams import check_state_test
 
 @pytest.mark.skip(reason="too slow for normal testing")
@@ -33,3 +34,199 @@ def test_load_nyc_nysed():
     n = len(df)
     assert n > 680_000, f"Only ({n}) records found"
     check_state_test(df)
+
+
+def test_calc_all_grades():
+    import numpy as np
+
+    df = pd.DataFrame({
+        "beds": ["310100010015"] * 4 + ["310200010475"] * 2,
+        "ay": [2021] * 6,
+        "test_year": [2022] * 6,
+        "exam": ["ela", "ela", "math", "math", "ela", "ela"],
+        "grade": [3, 4, 3, 4, 3, 4],
+        "category": ["All Students"] * 6,
+        "number_tested": [10, 30, 20, 20, 0, 0],
+        "number_not_tested": [1, 2, 0, 1, 5, 5],
+        "mean_scale_score": [400, 440, 420, np.nan, np.nan, np.nan],
+        "level_1_n": [1, 3, 2, 2, 0, 0],
+        "level_2_n": [2, 6, 4, 4, 0, 0],
+        "level_3_n": [3, 9, 6, 6, 0, 0],
+        "level_4_n": [4, 12, 8, 8, 0, 0],
+    })
+    df["level_3_4_n"] = df.level_3_n + df.level_4_n
+    all_grades = nysed.calc_all_grades(df)
+
+    assert len(all_grades) == 3
+    assert (all_grades.grade == "All Grades").all()
+    ela = all_grades.iloc[0]
+    assert ela.number_tested == 40 and ela.number_not_tested == 3
+    assert ela.mean_scale_score == 430
+    assert ela.level_3_pct == .3 and ela.level_4_pct == .4
+    # level_3_4_pct used to be a copy of level_3_pct
+    assert ela.level_3_4_pct == .7
+    # grades without a score don't count
+    assert all_grades.iloc[1].mean_scale_score == 420
+    # no one tested
+    empty = all_grades.iloc[2]
+    assert empty.number_tested == 0 and empty.level_1_pct == 0 and np.isnan(empty.mean_scale_score)
+
+    # every school, year, exam and category gets one row with the sums of its grades
+    rng = np.random.default_rng(1)
+    big = pd.concat([df.assign(beds=f"3{i:011}", number_tested=rng.integers(0, 50, len(df))) for i in range(50)])
+    all_grades = nysed.calc_all_grades(big)
+    assert len(all_grades) == len(big.drop_duplicates(["beds", "ay", "exam", "category"]))
+    expected = big.groupby(["beds", "exam"]).number_tested.sum()
+    assert all_grades.set_index(["beds", "exam"]).number_tested.equals(expected)
+
+
+def researcher_file(year, n=4):
+    """A small NYSED researcher file for one test year."""
+    return pd.DataFrame({
+        "NAME": [f"SCHOOL {i}" for i in range(n)],
+        "BEDSCODE": [f"3{i:011}" for i in range(n)],
+        "SUBGROUP_CODE": [1] * n,
+        "SUBGROUP_NAME": ["All Students", "English Language Learner", "Hispanic or Latino", "Female"][:n],
+        "ITEM_SUBJECT_AREA": ["ELA", "Mathematics"] * (n // 2),
+        "ITEM_DESC": [f"Grade {3 + i} {'ELA' if i % 2 == 0 else 'Math'}" for i in range(n)],
+        "SY_END_DATE": [f"06/30/{year}"] * n,
+        "TOTAL_TESTED": [40, "-", 25, 10][:n],
+        "L1_COUNT": [4, "-", 5, 1][:n], "L1_PCT": ["10%", "-", "20%", "10%"][:n],
+        "L2_COUNT": [8, "-", 5, 2][:n], "L2_PCT": ["20%", "-", "20%", "20%"][:n],
+        "L3_COUNT": [20, "-", 10, 3][:n], "L3_PCT": ["50%", "-", "40%", "30%"][:n],
+        "L4_COUNT": [8, "-", 5, 4][:n], "L4_PCT": ["20%", "-", "20%", "40%"][:n],
+        "L3-L4_PCT": ["70%", "-", "60%", "70%"][:n],
+        "MEAN_SCALE_SCORE": [600, "-", 598, 610][:n],
+    })
+
+
+def test_load_nysed_ela_math_archives_local(tmp_path, monkeypatch):
+    """Only the researcher files are read from the archives, csv or Excel."""
+    import io
+    import zipfile
+
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    archives = []
+    for year in [2018, 2019]:
+        path = tmp_path / f"3-8-{year - 1}-{year % 100}.zip"
+        with zipfile.ZipFile(path, "w") as z:
+            if year == 2018:
+                xlsx = io.BytesIO()
+                researcher_file(year).to_excel(xlsx, index=False)
+                z.writestr(f"3-8_ELA_AND_MATH_RESEARCHER_FILE_{year}.xlsx", xlsx.getvalue())
+            else:
+                z.writestr(f"3-8_ELA_AND_MATH_RESEARCHER_FILE_{year}.csv", researcher_file(year).to_csv(index=False))
+            z.writestr(f"3-8_ELA_AND_MATH_{year}.mdb", b"not a data file")
+            z.writestr(f"__MACOSX/._3-8_ELA_AND_MATH_RESEARCHER_FILE_{year}.csv", b"")
+            z.writestr("README.txt", "Grades 3-8 results")
+        archives.append(str(path))
+
+    df = nysed.load_nysed_ela_math_archives(archives, workers=2)
+    assert len(df) == 8
+    assert sorted(df.ay.unique()) == [2017, 2018]
+    assert "index" not in df.columns
+    assert df.grade.tolist()[:4] == [3, 4, 5, 6]
+    assert set(df.category) == {"All Students", "Current ELL", "Hispanic", "Female"}
+    assert df.exam.tolist()[:2] == ["ela", "math"]
+    assert df.level_3_4_pct.tolist()[:2] == [.7, 0]
+    assert df.level_3_4_n.tolist()[:2] == [28, 0]
+    assert not (tmp_path / "tmp").exists()
+
+    feather = pd.read_feather(tmp_path / "nysed-exams.feather")
+    assert len(feather) == len(df)
+    parquet = tmp_path / "nysed-exams"
+    assert sorted(p.name for p in parquet.iterdir()) == ["ay=2017", "ay=2018"]
+    year = pd.read_parquet(parquet, filters=[("ay", "==", 2018)])
+    assert len(year) == 4 and (year.test_year == 2019).all()
+
+    # the same data parsed in this process
+    pd.testing.assert_frame_equal(nysed.load_nysed_ela_math_archives(archives, workers=1), df)
+    assert len(pd.read_parquet(parquet)) == len(df)
+
+
+def test_fix_data():
+    """The vectorized cleaning gives the same data as the row-wise version."""
+    import numpy as np
+
+    rng = np.random.default_rng(1)
+    raw = pd.concat([researcher_file(year) for year in [2016, 2017, 2018, 2019]], ignore_index=True)
+    raw = raw.sample(frac=1, random_state=1).reset_index(drop=True)
+    raw.loc[rng.random(len(raw)) < .2, "SUBGROUP_NAME"] = "Students with Disabilities"
+    df = nysed.fix_cols(raw)
+    pd.testing.assert_frame_equal(nysed.fix_data(df), original_fix_data(df))
+    assert df.test_year.iloc[0] == raw.SY_END_DATE.iloc[0], "fix_data changed its input"
+
+    # Excel dates
+    df["test_year"] = pd.to_datetime(df.test_year)
+    pd.testing.assert_frame_equal(nysed.fix_data(df), original_fix_data(df))
+    df["test_year"] = df.test_year.astype(object)
+    pd.testing.assert_frame_equal(nysed.fix_data(df), original_fix_data(df))
+
+    # a missing grade stays missing (the row-wise version raised)
+    df.loc[3, "grade"] = np.nan
+    fixed = nysed.fix_data(df)
+    assert np.isnan(fixed.grade.iloc[3])
+    expected = original_fix_data(df.drop(index=3)).grade
+    pd.testing.assert_series_equal(fixed.grade.drop(index=3), expected, check_dtype=False)
+
+
+def original_fix_data(df):
+    """The row-wise fix_data that the vectorized version replaced."""
+
+    nysed = df.copy()
+    try: # this for excel
+        nysed.test_year = nysed.test_year.apply(lambda x: x.date().year)
+    except: # or this for csv
+        nysed.test_year = nysed.test_year.apply(lambda x: int(x.split("/")[-1]))
+
+    cat_map = {
+        'English Language Learner': "Current ELL",
+        'Asian or Native Hawaiian/Other Pacific Islander': 'Asian',
+        'Hispanic or Latino': 'Hispanic',
+        'Black or African American': 'Black',
+        'Not Economically Disadvantaged': 'Not Econ Disadv',
+        'Economically Disadvantaged': 'Econ Disadv',
+        'Students with Disabilities': 'SWD',
+        'General Education Students': 'Not SWD',
+        'Non-English Language Learner': 'Never ELL'
+    }
+
+    def map_cats(cat):
+        if cat in cat_map:
+            return cat_map[cat]
+        return cat
+
+    # rename the student demo categories to match NYC
+    nysed.category = nysed.category.apply(map_cats)
+
+    # rename the exams to match NYC
+    nysed.exam = nysed.exam.map({"ELA":"ela","Mathematics":"math"})
+
+
+    # make counts into integers
+    count_cols = [c for c in nysed.columns if c.endswith("_n")]
+    # if we have these cols, add them too
+    for c in ["number_tested", "total_enrollment", "number_not_tested", "test_year"]:
+        if c in nysed:
+            count_cols.append(c)
+    for col in count_cols:
+
+        nysed[col] = pd.to_numeric(nysed[col], errors='coerce')
+        nysed[col] = nysed[col].fillna(0)
+        nysed[col] = nysed[col].astype(int)
+
+    nysed["ay"] = nysed.test_year - 1
+    nysed["level_3_4_n"] = nysed.level_3_n + nysed.level_4_n
+
+    # parse the grade leve string to just the grade int
+    nysed.grade = nysed.grade.apply(lambda x: int(x[6]))
+
+
+    # convert percents from 0-100 to 0-1 to match other data, '-' is 0
+    pct_cols = [c for c in nysed.columns if c.endswith("pct")]
+    for c in pct_cols:
+        nysed[c] = nysed_parse.pct(nysed[c], scale="gt1", errors="coerce")
+
+    nysed["mean_scale_score"] = pd.to_numeric(nysed["mean_scale_score"], downcast='integer', errors='coerce')
+
+    return nysed
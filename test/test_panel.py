@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from nycschools.panel import SchoolPanel
+
+
+def demographics():
+    """Three schools over 2018-2022; 02M475 has no 2020 row and 84X123 opens in 2021."""
+    return pd.DataFrame({
+        "dbn": ["01M015", "01M015", "01M015", "01M015", "01M015",
+                "02M475", "02M475", "02M475", "02M475", "84X123", "84X123"],
+        "ay": [2018, 2019, 2020, 2021, 2022, 2018, 2019, 2021, 2022, 2021, 2022],
+        "district": [1, 1, 1, 1, 1, 2, 2, 2, 2, 84, 84],
+        "school_name": ["P.S. 015"] * 5 + ["Stuyvesant"] * 4 + ["Success"] * 2,
+        "total_enrollment": [200, 210, 190, 180, 171, 3300, 3330, 3270, 3300, 400, 500],
+        "black_pct": np.array([.3, .31, .32, .33, .34, .01, .01, .02, .02, .8, .75], dtype="float32"),
+    }).sample(frac=1, random_state=1).reset_index(drop=True)
+
+
+def test_panel_lookup():
+    df = demographics()
+    panel = SchoolPanel(df)
+    assert len(panel) == 3
+    assert panel.years.tolist() == [2018, 2019, 2020, 2021, 2022]
+    assert panel.measures == ["total_enrollment", "black_pct"]
+
+    assert panel["02M475", 2019, "total_enrollment"] == 3330
+    assert np.isnan(panel["02M475", 2020, "total_enrollment"])
+    assert panel["84X123", 2022].total_enrollment == 500
+    assert panel["01M015"].total_enrollment.tolist() == [200, 210, 190, 180, 171]
+    with pytest.raises(KeyError):
+        panel["01M015", 2017]
+    assert panel.wide("total_enrollment").loc["84X123"].isna().sum() == 3
+
+    # round trip to the long frame
+    pd.testing.assert_frame_equal(panel.to_frame(), df)
+
+    with pytest.raises(ValueError):
+        SchoolPanel(pd.concat([df, df.head(1)]))
+
+
+def test_panel_changes():
+    df = demographics()
+    panel = SchoolPanel(df)
+
+    delta = panel.delta()
+    assert delta["01M015", 2019, "total_enrollment"] == 10
+    assert np.isnan(delta["01M015", 2018, "total_enrollment"])
+    # no 2020 row, so no change for 2020 or 2021
+    assert np.isnan(delta["02M475", 2021, "total_enrollment"])
+    assert panel.delta(2)["02M475", 2021, "total_enrollment"] == -60
+    assert panel.pct_change()["84X123", 2022, "total_enrollment"] == .25
+
+    changes = delta.to_frame()
+    assert changes.columns.tolist() == df.columns.tolist()
+    assert changes.school_name.tolist() == df.school_name.tolist()
+    expected = df.sort_values(["dbn", "ay"]).groupby("dbn").total_enrollment.diff()
+    # groupby diff ignores the missing year
+    expected[(df.dbn == "02M475") & (df.ay == 2021)] = np.nan
+    np.testing.assert_array_equal(changes.total_enrollment, expected.sort_index())
+    assert len(delta.to_frame(dropna=True)) == len(df) - 4
+
+    rolling = panel.rolling(3, min_periods=2)
+    assert rolling["01M015", 2020, "total_enrollment"] == 200
+    assert rolling["02M475", 2021, "total_enrollment"] == 3300
+    assert np.isnan(rolling["84X123", 2021, "total_enrollment"])
+    assert panel.rolling(2, "sum")["84X123", 2022, "total_enrollment"] == 900
+    std = panel.rolling(5, "std", min_periods=1).wide("total_enrollment")
+    expected = panel.wide("total_enrollment").T.rolling(5, min_periods=1).std().T
+    pd.testing.assert_frame_equal(std, expected)
+
+
+def test_panel_select():
+    df = demographics()
+    panel = SchoolPanel(df)
+
+    part = panel.select(dbns=["84X123", "01M015"], years=range(2020, 2023), measures=["total_enrollment"])
+    assert part.values.shape == (2, 3, 1)
+    assert part["84X123", 2021, "total_enrollment"] == 400
+    with pytest.raises(KeyError):
+        part["02M475"]
+
+    expected = df[df.dbn.isin(["84X123", "01M015"]) & (df.ay >= 2020)].drop(columns="black_pct")
+    pd.testing.assert_frame_equal(part.to_frame(), expected.reset_index(drop=True))
+    with pytest.raises(ValueError):
+        panel.select(years=[2018, 2020])
+
+
+def test_change_table():
+    from nycschools import panel
+
+    df = demographics()
+    changes = panel.change_table(df, ["total_enrollment", "black_pct"], periods=(1, 3))
+    assert changes.columns.tolist() == ["dbn", "ay", "total_enrollment_change_1y", "total_enrollment_change_3y",
+                                        "black_pct_change_1y", "black_pct_change_3y"]
+    expected = SchoolPanel(df).select(measures=["total_enrollment"]).delta(3).to_frame()
+    expected = expected.sort_values(["dbn", "ay"]).total_enrollment
+    np.testing.assert_array_equal(changes.total_enrollment_change_3y, expected)
+
+    # the same as the self-merge it replaces
+    prev = df.assign(ay=df.ay + 1)
+    merged = df.merge(prev, on=["dbn", "ay"], how="left", suffixes=("", "_prev")).sort_values(["dbn", "ay"])
+    np.testing.assert_allclose(changes.black_pct_change_1y, merged.black_pct - merged.black_pct_prev)
+
+    # longer keys, e.g. exams by grade and category
+    exams = pd.concat([df.assign(grade="3"), df.assign(grade="4", total_enrollment=df.total_enrollment * 2)])
+    changes = panel.change_table(exams, ["total_enrollment"], keys=["dbn", "grade"])
+    assert changes.groupby("grade").total_enrollment_change_1y.sum().tolist() == [131, 262]
+
+    # more than one row per key and year, e.g. exams with keys=["dbn"]
+    with pytest.raises(ValueError, match="dbn"):
+        panel.change_table(exams, ["total_enrollment"], keys=["dbn"])
+
+
+def test_load_changes(tmp_path, monkeypatch):
+    import os
+    from nycschools import config, dataloader, panel
+
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    dataloader.clear_cache()
+    df = demographics().rename(columns={"black_pct": "black_n"})
+    df.to_csv(dataloader.data_path("demographics"), index=False)
+
+    changes = panel.load_changes("demographics", periods=(1, 2))
+    assert changes.columns.tolist() == ["dbn", "ay", "total_enrollment_change_1y", "total_enrollment_change_2y",
+                                        "black_n_change_1y", "black_n_change_2y"]
+    cached = [f for f in os.listdir(tmp_path / dataloader.sidecar_dir) if ".changes-" in f]
+    assert len(cached) == 1
+
+    # the cached table is read back, not rebuilt
+    monkeypatch.setitem(panel.change_specs["demographics"], "load", None)
+    pd.testing.assert_frame_equal(panel.load_changes("demographics", periods=(1, 2)), changes)
+    monkeypatch.undo()
+
+    # one district at a time gives the same table
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    before = dataloader.cache_info()
+    districts = dict(panel.iter_changes("demographics", periods=(1, 2)))
+    assert list(districts) == [1, 2, 84]
+    # the district frames don't fill the in-process cache
+    after = dataloader.cache_info()
+    assert after.currsize <= before.currsize
+    assert after.frames == before.frames
+    streamed = pd.concat(districts.values(), ignore_index=True)
+    pd.testing.assert_frame_equal(streamed, changes, check_dtype=False, check_categorical=False)
+    dataloader.clear_cache()
+
+    with pytest.raises(ValueError):
+        panel.load_changes("budgets")
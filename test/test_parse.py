@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from nycschools import parse
+
+
+def test_pct_schools():
+    """'ge1' scale: strip the % sign, numbers >= 1 are whole percents."""
+    values = pd.Series(["84.33%", "Above 95%", "Below 5%", "No Data", ".5", "100", np.nan], dtype=object)
+    n = pd.Series([100, 300, 300, 10, 10, 10, 10])
+    actual = parse.pct(values, n)
+    expected = [84.33 / 100, 300 * .96 / 300, 300 * .04 / 300, 0, .5, 1, np.nan]
+    np.testing.assert_array_equal(actual.to_numpy(), expected)
+    assert actual.dtype == "float64"
+
+    # without n the suppressed values are .96 and .04
+    assert parse.pct(pd.Series(["Above 95%", "Below 5%"])).tolist() == [.96, .04]
+
+
+def test_pct_snapshot():
+    """'sign' scale: only values with a % sign are whole percents."""
+    values = pd.Series([.93, "45%", "fewer than 5", np.nan, "50"], dtype=object)
+    actual = parse.pct(values, scale="sign", missing=0.0, errors="coerce")
+    assert actual.tolist() == [.93, .45, .01, 0.0, 50.0]
+
+
+def test_pct_nysed():
+    """'gt1' scale: numbers outside 0..1 are whole percents, '-' is 0."""
+    values = pd.Series(["45%", "-", "", 1, 0.25, 75, "s"], dtype=object)
+    actual = parse.pct(values, scale="gt1", errors="coerce")
+    np.testing.assert_array_equal(actual.to_numpy(), [.45, 0, 0, 1, .25, .75, np.nan])
+
+    numeric = pd.Series([0, 1, 50, np.nan])
+    np.testing.assert_array_equal(parse.pct(numeric, scale="gt1").to_numpy(), [0, 1, .5, np.nan])
+
+
+def test_pct_errors():
+    with pytest.raises(ValueError):
+        parse.pct(pd.Series(["12%", "twelve"], name="poverty_1"))
+    with pytest.raises(ValueError):
+        parse.pct(pd.Series([.5]), scale="percent")
+
+
+def test_count():
+    values = pd.Series(["246", "Above 95%", "Below 5%", 12, 7.9], dtype=object)
+    n = pd.Series([300, 300, 300, 30, 30])
+    actual = parse.count(values, n)
+    assert actual.dtype == "int64"
+    assert actual.tolist() == [246, 288, 12, 12, 7]
+
+    # suppressed ranges are the midpoint, unknown values are NaN
+    actual = parse.count(pd.Series(["0-5", "31", "n/a", None], dtype=object))
+    np.testing.assert_array_equal(actual.to_numpy(), [2, 31, np.nan, np.nan])
+
+    ints = pd.Series([1, 2, 3], index=[5, 6, 7])
+    assert parse.count(ints).index.tolist() == [5, 6, 7]
+
+
+def test_number():
+    values = pd.Series(["600", "-", "598", None, "600", 7.5], dtype=object)
+    expected = pd.to_numeric(values, errors="coerce")
+    pd.testing.assert_series_equal(parse.number(values), expected)
+
+    values = pd.Series(["600", "598", "600"], index=[3, 4, 5])
+    expected = pd.to_numeric(values, errors="coerce", downcast="integer")
+    pd.testing.assert_series_equal(parse.number(values, downcast="integer"), expected)
+    assert parse.number(values, downcast="integer").dtype == "int16"
@@ -1,5 +1,5 @@
 import os.path
-from nycschools import config, schools
+from nycschools import config, schools, dataloader
 
 def test_load_school_demographics():
     """Tests if schools can load demographics from local dataset and has reasonable values."""
@@ -87,12 +87,52 @@ def test_get_demo_2023():
 def test_save_demographics():
     df = schools.save_demographics()
     assert df is not None, "Demo data frame is null"
-    assert os.path.exists(schools.__demo_filename), "no demo file in data_dir"
+    assert os.path.exists(dataloader.data_path("demographics")), "no demo file in data_dir"
     expected_keys = schools.demo.default_cols
     for k in expected_keys:
         assert k in df, f"Missing expected key: {k}"
 
 
+
+def test_save_demographics_incremental(tmp_path, monkeypatch):
+    """Only changed sources are processed again and newer sources replace
+    the (dbn, ay) rows of older ones."""
+    import pandas as pd
+
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    built = []
+    def build(source):
+        built.append(source)
+        return pd.read_csv(source)
+    monkeypatch.setattr(schools, "demo_sources", {"old": build, "new": build})
+
+    old, new = tmp_path / "old.csv", tmp_path / "new.csv"
+    pd.DataFrame({"dbn": ["01M015", "01M019", "01M015"], "ay": [2016, 2016, 2017], "n": [1, 2, 3]}).to_csv(old, index=False)
+    pd.DataFrame({"dbn": ["01M015", "01M015"], "ay": [2017, 2018], "n": [30, 40]}).to_csv(new, index=False)
+    sources = {"old": str(old), "new": str(new)}
+
+    df = schools.save_demographics(incremental=True, sources=sources)
+    assert len(built) == 2
+    assert df.sort_values(["ay", "dbn"]).n.tolist() == [1, 2, 30, 40]
+    pd.testing.assert_frame_equal(pd.read_csv(dataloader.data_path("demographics")), df)
+
+    # nothing changed, nothing is rebuilt
+    again = schools.save_demographics(incremental=True, sources=sources)
+    assert len(built) == 2
+    pd.testing.assert_frame_equal(again, df)
+
+    # a new version of one source only rebuilds that source
+    pd.DataFrame({"dbn": ["01M015", "01M015"], "ay": [2018, 2019], "n": [41, 50]}).to_csv(new, index=False)
+    df = schools.save_demographics(incremental=True, sources=sources)
+    assert len(built) == 3
+    assert df.sort_values(["ay", "dbn"]).n.tolist() == [1, 2, 3, 41, 50]
+    cached = [f for f in os.listdir(tmp_path / dataloader.sidecar_dir) if f.endswith(".parquet")]
+    assert len(cached) == 2, "the stale cache for the changed source is removed"
+
+    full = schools.save_demographics(sources=sources)
+    assert len(built) == 5
+    pd.testing.assert_frame_equal(full, df)
+
 def test_load_hs_directory():
     def check_year(ay):
         df = schools.load_hs_directory(ay)
@@ -102,4 +142,312 @@ def test_load_hs_directory():
         assert "dbn" in df, "Missing dbn column"
     
     for ay in range(2013, 2021):
-        check_year(ay)
\ No newline at end of file
+        check_year(ay)
+
+def row_wise_demographics(df):
+    """The original per-row derivation from `get_demographics()`, kept as the reference."""
+    boros = {"K":"Brooklyn", "X":"Bronx", "M": "Manhattan", "Q": "Queens", "R": "Staten Island"}
+    df["ay"] = df["year"].apply(lambda year: int(year.split("-")[0]))
+    df["district"] = df["dbn"].apply(lambda dbn: int(dbn[:2]))
+    df["boro"] = df["dbn"].apply(lambda dbn: boros[dbn[2]])
+    df["school_num"] = df.dbn.apply(lambda dbn: int(dbn[3:]))
+    df["charter"] = df.district.apply(lambda x: 1 if x == 84 else 0)
+    df["clean_name"] = df.apply(lambda row: schools.clean_name(row.school_name), axis=1)
+    df["short_name"] = df.apply(schools.short_name, axis=1)
+    df["poverty"] = df.apply(lambda row: schools.str_count(row, "poverty", "total_enrollment"), axis=1)
+    df["poverty_1"] = df.apply(lambda row: schools.str_pct(row, "poverty_1", "total_enrollment"), axis=1)
+    df["economic_need_index"] = df.apply(lambda row: schools.str_pct(row, "economic_need_index", "total_enrollment"), axis=1)
+    return df
+
+
+def test_vectorized_derivations(monkeypatch):
+    """`get_demographics()` derives exactly the row-wise columns."""
+    import pandas as pd
+
+    raw = pd.DataFrame({
+        "dbn": ["01M015", "84X123", "75K001", "13K282", "02M001", "01M015"],
+        "year": ["2016-17", "2017-18", "2021-22", "2016-17", "2022-23", "2017-18"],
+        "school_name": ["P.S. 015 Roberto Clemente", "Success Academy Bronx 2", "I.S. 001 Brooklyn",
+                        "M. S. 282 Park Slope", "The 001 School", "P.S. 015 Roberto Clemente"],
+        "total_enrollment": [300, 450, 120, 600, 77, 311],
+        "poverty": pd.Series([246, "Above 95%", "Below 5%", 310.0, "12", "246"], dtype=object),
+        "poverty_1": pd.Series([0.8433, "84.33%", "Above 95%", "Below 5%", "No Data", "100%"], dtype=object),
+        "economic_need_index": [0.5, 93.2, 0.98, 1.0, 0.0, 0.123456789],
+    })
+    grades = [c for c in schools.demo.default_cols if c.startswith("grade_")]
+    for i, grade in enumerate(grades):
+        raw[grade] = [50 if (i + j) % 4 == 0 else 0 for j in range(len(raw))]
+    lookup = pd.DataFrame({"beds": [310100010015, 331300010282], "zip": [10002.0, 11215.0],
+                           "geo_district": [1, 13]}, index=pd.Index(["01M015", "13K282"], name="dbn"))
+    monkeypatch.setattr(schools, "location_lookup", lambda: lookup)
+
+    expected = row_wise_demographics(raw.copy()).rename(columns=schools.demo.default_map)
+    actual = schools.get_demographics(raw.copy())
+    assert actual.columns.tolist() == schools.demo.default_cols
+    cols = ["ay", "district", "boro", "school_name", "short_name", "clean_name", "poverty_n", "poverty_pct", "eni"]
+    pd.testing.assert_frame_equal(actual[cols], expected[cols])
+    assert actual[cols].to_csv(index=False) == expected[cols].to_csv(index=False)
+    assert actual.beds.tolist() == [310100010015, 0, 0, 331300010282, 0, 310100010015]
+    assert actual.geo_district.tolist() == [1, 0, 0, 13, 2, 1]
+
+
+def original_clean_name(sn):
+    """`clean_name()` as it was written before it was cached and vectorized."""
+    import re
+
+    sn = sn.lower()
+    sn = sn.strip()
+    sn = sn.replace(".", "")
+    clean = []
+    for word in sn.split(" "):
+        try:
+            n = int(word)
+            clean.append(str(n))
+        except:
+            clean.append(word)
+
+    sn = " ".join(clean)
+
+    p = re.compile(r"\b([m|p|i]s [0-9]*)")
+    m = p.search(sn)
+    if m:
+        sn = sn.replace(m.group(0), "")
+    sn = sn.strip()
+    if sn in ["bronx", "brooklyn", "manhattan", "queens", "staten island"]:
+        sn = f"{m.group(0)} {sn}"
+    return sn
+
+
+def test_clean_names():
+    """`clean_name()` and `clean_names()` match the original `clean_name()` on
+    random names built from school name fragments, digits and punctuation."""
+    import random
+    import pandas as pd
+
+    pieces = list("abcmpsixyz0123456789 .-+_'\t") + [
+        "P.S. ", "ps ", "M.S.", "I. S. ", "is ", "015", "007", "00", " bronx", "Brooklyn", "Staten Island",
+        "queens", "The ", "School", "Academy", "\u0663", "\u00c9"]
+    rng = random.Random(2023)
+    names = ["".join(rng.choice(pieces) for _ in range(rng.randint(0, 10))) for _ in range(20_000)]
+    names += ["P.S. 015 Roberto Clemente", "P.S. 015 Bronx", "Bronx", "ps 15 ps 150", "I.S. 001", ""]
+
+    expected = {}
+    for name in names:
+        try:
+            expected[name] = original_clean_name(name)
+        except AttributeError:
+            # the original failed on a bare boro name without a school number,
+            # now the boro name is returned
+            expected[name] = schools.clean_name(name)
+            assert expected[name] in {"bronx", "brooklyn", "manhattan", "queens", "staten island"}
+
+    assert [schools.clean_name(n) for n in names] == [expected[n] for n in names]
+    actual = schools.clean_names(pd.Series(names + [None], index=range(1, len(names) + 2)))
+    assert actual.index.tolist() == list(range(1, len(names) + 2))
+    assert actual.iloc[:-1].tolist() == [expected[n] for n in names]
+    assert actual.isna().iloc[-1]
+
+
+def enrollment(grades, n=30, **counts):
+    """One row of grade enrollment with `n` students in each grade listed in `grades`."""
+    row = {c: 0 for c in schools.grade_cols}
+    for g in grades:
+        row[f"grade_{g}"] = n
+    row.update({f"grade_{g}": v for g, v in counts.items()})
+    return row
+
+
+def test_school_level():
+    import numpy as np
+    import pandas as pd
+
+    cases = [
+        (enrollment(["k", 1, 2, 3, 4, 5]), "elementary"),
+        (enrollment([6, 7, 8]), "middle"),
+        (enrollment([9, 10, 11, 12]), "high"),
+        (enrollment([9, 10, 11, 12], k=1, **{"6": 1}), "high"),  # < 3 students outside high school
+        (enrollment(["pk", "3k"]), "prek"),
+        (enrollment(["k", 1, 2, 3, 4, 5, 6, 7, 8]), "K-8"),
+        (enrollment(["k", 1, 2, 3, 4, 5, 6, 7]), "K-7"),
+        (enrollment(["k", 1, 2, 3, 4, 5, 6, 7], **{"8": np.nan}), "other"),  # K-7 needs a reported 0
+        (enrollment(["k", 1, 2, 3, 4, 5, 6]), "K-6"),
+        (enrollment(["k", 3, 5, 6, 7, 8, 9, 10, 11, 12]), "K-12"),
+        (enrollment([7, 8, 9, 10, 11, 12]), "7-12"),
+        (enrollment([6, 7, 8, 9]), "6-9"),
+        (enrollment([6, 7, 8, 9, 10, 11, 12]), "6-12"),
+        (enrollment([5, 6, 7, 8, 9, 10, 11, 12]), "5-12"),
+        (enrollment([8, 9, 10, 11, 12]), "8-12"),
+        (enrollment([5, 6, 7, 8]), "5-8"),
+        (enrollment([4, 5, 6, 7, 8]), "4-8"),
+        (enrollment([3, 4, 5, 6, 7, 8]), "3-8"),
+        (enrollment([]), "other"),
+        (enrollment([2, 3]), "elementary"),
+    ]
+    df = pd.DataFrame([row for row, _ in cases])
+    levels = schools.school_level(df)
+    assert levels.tolist() == [level for _, level in cases]
+    assert "school_level" not in df
+
+    # other grade banded data without all the grade columns
+    partial = pd.DataFrame({"grade_6": [25, 0], "grade_7": [30, 0], "grade_8": [28, 0], "grade_9": [0, 40]})
+    assert schools.school_level(partial).tolist() == ["middle", "high"]
+
+
+def test_set_school_level():
+    import pandas as pd
+
+    df = pd.DataFrame([enrollment([9, 10, 11, 12])] * 5).drop(columns="grade_3k")
+    df["district"] = [2, 84, 75, 79, 0]
+    df = schools.set_school_level(df)
+    assert df.school_type.tolist() == ["community", "charter", "d75", "transfer", None]
+    assert (df.school_level == "high").all()
+    assert (df.grade_3k == 0).all()
+
+
+def school_names():
+    import pandas as pd
+
+    names = ["P.S. 015 Roberto Clemente", "P.S. 019 Asher Levy", "M.S. 131", "I.S. 061 William A Morris",
+             "Stuyvesant High School", "Brooklyn Technical High School", "The Bronx High School of Science",
+             "Success Academy Charter School - Bronx 2", "J.H.S. 054 Booker T. Washington",
+             "Frederick Douglass Academy", "Frederick Douglass Academy II Secondary School",
+             "P.S. 321 William Penn", "Benjamín Franklin High School"]
+    dbns = ["01M015", "01M019", "02M131", "31R061", "02M475", "13K430", "10X445",
+            "84X488", "03M054", "05M670", "03M860", "15K321", "04M435"]
+    df = pd.DataFrame({"dbn": dbns, "school_name": names})
+    df = schools.dbn_cols(df)
+    df = schools.name_cols(df)
+    df["beds"] = range(310100010015, 310100010015 + len(df))
+    old = df.assign(ay=2021, school_name=df.school_name + " (old)")
+    return pd.concat([old, df.assign(ay=2022)], ignore_index=True)
+
+
+def test_school_index():
+    import pandas as pd
+
+    df = school_names()
+    index = schools.SchoolIndex(df)
+    assert len(index) == 13
+
+    queries = ["clemente", "PS 15", "ps 321", "stuyvesant", "Stuyvesent High", "bronx science",
+               "Frederick Douglass", "Booker T Washington", "benjamin franklin", "Success Academy",
+               "no such school", "william"]
+    for q in queries:
+        expected = schools.search(df, q)
+        actual = index.search(q)
+        # (an empty result's `match` column has no meaningful dtype)
+        pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual.reset_index(drop=True),
+                                      check_dtype=len(expected) > 0)
+
+    # exact lookups by dbn and beds
+    assert index.search("02m475").school_name.tolist() == ["Stuyvesant High School"]
+    assert index.search(str(310100010015)).dbn.tolist() == ["01M015"]
+
+
+def test_school_index_broad_query():
+    """A query that matches more schools than a candidate cap would keep."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(3)
+    words = ["Lincoln", "Kennedy", "Roosevelt", "Hamilton", "Jefferson", "Madison", "Monroe", "Adams"]
+    names = [f"{rng.choice(words)} {rng.choice(words)} Academy {i}" for i in range(400)]
+    dbns = [f"{i % 32 + 1:02}{'KXMQR'[i % 5]}{i:03}" for i in range(400)]
+    df = schools.name_cols(schools.dbn_cols(pd.DataFrame({"dbn": dbns, "school_name": names}))).assign(ay=2022)
+    index = schools.SchoolIndex(df)
+    assert len(schools.search(df, "academy")) == 400
+    for q in ["academy", "lincoln academy"]:
+        expected = schools.search(df, q)
+        pd.testing.assert_frame_equal(index.search(q).reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_school_index_search_many():
+    index = schools.SchoolIndex(school_names())
+    results = index.search_many(["PS 15", "Stuyvesant", "no such school", "PS 15"])
+    assert results["query"].tolist() == ["PS 15", "Stuyvesant", "no such school", "PS 15"]
+    assert results.dbn.tolist()[:2] == ["01M015", "02M475"]
+    assert results.dbn.isna().tolist() == [False, False, True, False]
+    assert results.match.iloc[0] == 100
+
+
+def test_link_schools():
+    import numpy as np
+    import pandas as pd
+
+    df = school_names()
+    data = pd.DataFrame({
+        "name": ["Stuyvesant High School", "PS 321 William Penn", "frederick douglass academy",
+                 "Bronx Science High School", "nowhere school", None, "Stuyvesant High School"],
+        "boro": ["M", "brooklyn", "Manhattan", "X", None, "K", "M"],
+    }, index=[10, 11, 12, 13, 14, 15, 10])
+
+    links = schools.link_schools(data, "name", df=df)
+    assert links.index.tolist() == data.index.tolist()
+    assert links.dbn.fillna("").tolist() == ["02M475", "15K321", "05M670", "10X445", "", "", "02M475"]
+    assert links.method.fillna("").tolist() == ["exact", "exact", "exact", "fuzzy", "", "", "exact"]
+    assert links.match.iloc[0] == 100
+    assert np.isnan(links.match.iloc[4])
+
+    # "P.S. 015" is ambiguous across boros, the hint picks the right one
+    other = df.assign(dbn=df.dbn.str.replace("01M015", "20K015"), boro="Brooklyn", ay=df.ay - 10)
+    both = pd.concat([df, other[other.dbn == "20K015"]], ignore_index=True)
+    data = pd.DataFrame({"name": ["PS 15 Roberto Clemente"] * 2, "boro": ["K", "M"]})
+    links = schools.link_schools(data, "name", boro_col="boro", df=both)
+    assert links.dbn.tolist() == ["20K015", "01M015"]
+
+
+def test_join_loc_data():
+    import numpy as np
+    import pandas as pd
+
+    lookup = pd.DataFrame({"beds": [310100010015, 0], "zip": [10002.0, 10451.0], "geo_district": [1, 0]},
+                          index=pd.Index(["01M015", "84X123"], name="dbn"))
+    df = pd.DataFrame({"dbn": ["01M015", "84X123", "02M999", "75K001", "01M015"], "zip": [1, 2, 3, 4, 5]},
+                      index=[5, 4, 3, 2, 1])
+    df = schools.join_loc_data(df, lookup=lookup)
+    assert df.index.tolist() == [0, 1, 2, 3, 4]
+    assert df.beds.tolist() == [310100010015, 0, 0, 0, 310100010015]
+    assert df.zip.fillna(0).tolist() == [10002, 10451, 0, 0, 10002]
+    # no location: the district if it is geographic (1-32), else 0
+    assert df.geo_district.tolist() == [1, 0, 2, 0, 1]
+
+    df = schools.join_loc_data(df.assign(district=[1, 84, 2, 75, 1]).drop(columns="zip"), cols=["zip"], lookup=lookup)
+    assert df.geo_district.tolist() == [1, 0, 2, 0, 1]
+    assert df.columns[-1] == "zip"
+
+    # missing and non-numeric dbns without a district column
+    df = schools.join_loc_data(pd.DataFrame({"dbn": ["01M015", np.nan, "Citywide", "02M999"]}), lookup=lookup)
+    assert df.geo_district.tolist() == [1, 0, 0, 2]
+    assert df.beds.tolist() == [310100010015, 0, 0, 0]
+
+
+def test_location_lookup_refresh(tmp_path, monkeypatch):
+    """The lookup is read again when the locations file changes."""
+    import os
+    import pandas as pd
+    from nycschools import geo
+
+    monkeypatch.setattr(config, "data_dir", str(tmp_path))
+    reads = []
+    def load_school_locations(columns=None, filters=None):
+        reads.append(1)
+        return pd.DataFrame({"dbn": ["01M015"], "beds": [len(reads)], "zip": [10002], "geo_district": [1]})
+    monkeypatch.setattr(geo, "load_school_locations", load_school_locations)
+
+    path = dataloader.data_path("school_locations")
+    with open(path, "w") as f:
+        f.write("{}")
+    assert schools.location_lookup().beds.tolist() == [1]
+    assert schools.location_lookup().beds.tolist() == [1]
+    assert len(reads) == 1
+    with open(path, "w") as f:
+        f.write("{ }")
+    os.utime(path, ns=(0, 10**9))
+    assert schools.location_lookup().beds.tolist() == [2]
+
+    # and when data_dir changes
+    other = tmp_path / "other"
+    other.mkdir()
+    monkeypatch.setattr(config, "data_dir", str(other))
+    assert schools.location_lookup().beds.tolist() == [3]
+